@@ -1,7 +1,10 @@
 import logging
 import sys
-root = logging.getLogger()
-root.setLevel(logging.INFO)
-handler = logging.StreamHandler(sys.stdout)
-handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-root.addHandler(handler)
+
+def configure_logging(level: int = logging.INFO) -> None:
+    # Only called by the command line entry points, importing cloud_fits leaves logging to the application
+    root = logging.getLogger()
+    root.setLevel(level)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    root.addHandler(handler)
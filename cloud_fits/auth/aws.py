@@ -7,15 +7,18 @@ import typing
 
 from datetime import datetime
 from requests.auth import AuthBase
-from urllib.parse import quote, urlparse
+from urllib.parse import parse_qsl, quote, urlparse
 from requests.models import PreparedRequest
 
+from cloud_fits import profiling
+
 PWN: typing.TypeVar = typing.TypeVar('PWN')
 ENCODING: str = 'utf-8'
 
 AMZDATE_FORMATE: str = '%Y%m%dT%H%M%SZ'
 DATESTAMP_FORMATE: str = '%Y%m%d'
 QUOTE_SAFE_CHARS: str = '/-_.~'
+QUERYSTRING_SAFE_CHARS: str = '-_.~'
 
 class AWSAuth(AuthBase):
     def _load_aws_context(self: PWN) -> typing.Dict[str, str]:
@@ -59,10 +62,11 @@ class AWSAuth(AuthBase):
             return ''
 
         # https://github.com/DavidMuller/aws-requests-auth/blob/969bc643f8386bc796c30d71e78c59af7f82f6b2/aws_requests_auth/aws_auth.py#L202
-        raise NotImplementedError
-        sorted_querystring: str = sorted(url_parts.query.split('&'))
-        import pdb; pdb.set_trace()
-        pass
+        # https://docs.aws.amazon.com/general/latest/gr/sigv4-create-canonical-request.html
+        querystring: typing.List[typing.Tuple[str, str]] = sorted([
+            (quote(key, safe=QUERYSTRING_SAFE_CHARS), quote(value, safe=QUERYSTRING_SAFE_CHARS))
+            for key, value in parse_qsl(url_parts.query, keep_blank_values=True)])
+        return '&'.join([f'{key}={value}' for key, value in querystring])
 
     def _get_canonical_url(self: PWN, request: PreparedRequest) -> str:
         url_parts = urlparse(request.url)
@@ -94,6 +98,10 @@ class AWSAuth(AuthBase):
         return kSigning
 
     def __call__(self: PWN, request: 'request') -> 'request':
+        with profiling.phase('sign'):
+            return self._sign_request(request)
+
+    def _sign_request(self: PWN, request: 'request') -> 'request':
         timestamp = datetime.utcnow()
         aws_context = self._load_aws_context()
         request_host: str = urlparse(request.url).netloc
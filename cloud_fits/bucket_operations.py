@@ -1,49 +1,375 @@
 import argparse
+import collections
+import concurrent.futures
+import hashlib
 import logging
 import os
-import tempfile
-import requests
+import pickle
+import threading
 import typing
-import yaml
 
-from cloud_fits import data_types
-from cloud_fits.auth import aws as aws_auth
+from xml.etree import ElementTree
+
+from cloud_fits import data_types, exceptions
+from cloud_fits.data_types import footprint, keyword_table, utils
+from cloud_fits.lazy_import import lazy_import
+
+aws_auth = lazy_import('cloud_fits.auth.aws')
+requests = lazy_import('requests')
+yaml = lazy_import('yaml')
 
 AWS_REGION: str = os.environ.get('AWS_DEFAULT_REGION', 'us-east-1')
 ENCODING: str = 'utf-8'
 INDEX_KEY: str = 'cloud-fits.yaml'
+SHARD_LISTING_KEY: str = 'cloud-fits-shards.yaml'
+# Sharded indices keep the footprint index and keyword table in their own documents, the root only names them
+FOOTPRINTS_KEY: str = 'cloud-fits-footprints.yaml'
+KEYWORDS_KEY: str = 'cloud-fits-keywords.yaml'
+# Preview pyramids are uploaded next to the index, see local_index.attach_previews. The listing names the previews the
+# index refers to, previews of removed files are deleted on the next upload
+PREVIEWS_PREFIX: str = 'previews'
+PREVIEW_LISTING_KEY: str = 'cloud-fits-previews.yaml'
+# Set CLOUD_FITS_CACHE to an empty string to disable the local index cache
+INDEX_CACHE_DIRECTORY: str = os.environ.get('CLOUD_FITS_CACHE', os.path.expanduser('~/.cache/cloud-fits'))
+# S3 requires every part other than the last to be at least 5MiB. At most UPLOAD_WORKERS + 1 parts are held in memory
+UPLOAD_PART_SIZE: int = 8 * 1024 * 1024
+UPLOAD_WORKERS: int = 4
+# The last ETag seen for the root index of the ETAGS_SIZE most recent buckets, the index ETag keys cached cutouts,
+# see cloud_fits.data_types.cutout_cache
+ETAGS_SIZE: int = 64
+ETAGS: typing.Dict[str, typing.Optional[str]] = collections.OrderedDict()
+ETAGS_LOCK = threading.Lock()
+PWN: typing.TypeVar = typing.TypeVar('PWN')
 logger = logging.getLogger(__name__)
 
 
-def upload_index(options: argparse.Namespace, cloud_indices: typing.List[data_types.FitsFileIndex]) -> None:
-    index_filepath: str = tempfile.NamedTemporaryFile().name
+def _build_url(bucket_name: str, key: str) -> str:
+    return utils.build_s3_url(AWS_REGION, f'{bucket_name}/{key}')
+
+class MultipartUploadStream:
+    def __init__(self: PWN, url: str, part_size: int = None, workers: int = None) -> None:
+        self._url = url
+        self._part_size = part_size or UPLOAD_PART_SIZE
+        self._workers = workers or UPLOAD_WORKERS
+        self._buffer = bytearray()
+        self._upload_id: str = None
+        self._executor: concurrent.futures.ThreadPoolExecutor = None
+        self._parts: typing.List[concurrent.futures.Future] = []
+        self._slots = threading.BoundedSemaphore(self._workers)
+
+    def _start(self: PWN) -> None:
+        # https://docs.aws.amazon.com/AmazonS3/latest/API/API_CreateMultipartUpload.html
+        response = requests.post(f'{self._url}?uploads', auth=aws_auth.AWSAuth())
+        if response.status_code != 200:
+            raise NotImplementedError
+
+        for element in ElementTree.fromstring(response.content).iter():
+            if element.tag.endswith('UploadId'):
+                self._upload_id = element.text
+
+        if self._upload_id is None:
+            raise NotImplementedError('Unable to start Multipart Upload')
+
+        logger.info(f'Starting Multipart Upload[{self._upload_id}] to URL[{self._url}]')
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._workers)
+
+    def _upload_part(self: PWN, part_number: int, part: bytes) -> str:
+        try:
+            response = requests.put(
+                f'{self._url}?partNumber={part_number}&uploadId={self._upload_id}',
+                data=part, auth=aws_auth.AWSAuth())
+            if response.status_code != 200:
+                raise NotImplementedError(f'Unable to upload Part[{part_number}]')
+
+            return response.headers['ETag']
+
+        finally:
+            self._slots.release()
+
+    def _submit_part(self: PWN, part: bytes) -> None:
+        if self._upload_id is None:
+            self._start()
+
+        # Blocks the writer until a part upload finishes, which keeps memory bounded
+        self._slots.acquire()
+        self._parts.append(self._executor.submit(self._upload_part, len(self._parts) + 1, part))
+
+    def write(self: PWN, data: typing.Union[str, bytes]) -> int:
+        if isinstance(data, str):
+            data = data.encode(ENCODING)
+
+        self._buffer.extend(data)
+        while len(self._buffer) >= self._part_size:
+            part: bytes = bytes(self._buffer[:self._part_size])
+            del self._buffer[:self._part_size]
+            self._submit_part(part)
+
+        return len(data)
+
+    def close(self: PWN) -> None:
+        if self._upload_id is None:
+            response = requests.put(self._url, data=bytes(self._buffer), auth=aws_auth.AWSAuth())
+            if response.status_code != 200:
+                raise NotImplementedError
+
+            return None
+
+        if self._buffer:
+            self._submit_part(bytes(self._buffer))
+            self._buffer = bytearray()
+
+        parts: typing.List[str] = [
+            f'<Part><PartNumber>{idx + 1}</PartNumber><ETag>{part.result()}</ETag></Part>'
+            for idx, part in enumerate(self._parts)]
+        self._executor.shutdown()
+        # https://docs.aws.amazon.com/AmazonS3/latest/API/API_CompleteMultipartUpload.html
+        body: str = f'<CompleteMultipartUpload>{"".join(parts)}</CompleteMultipartUpload>'
+        response = requests.post(f'{self._url}?uploadId={self._upload_id}', data=body.encode(ENCODING), auth=aws_auth.AWSAuth())
+        if response.status_code != 200 or b'<Error>' in response.content:
+            raise NotImplementedError(f'Unable to complete Multipart Upload[{self._upload_id}]')
+
+    def abort(self: PWN) -> None:
+        if self._upload_id is None:
+            return None
+
+        logger.info(f'Aborting Multipart Upload[{self._upload_id}]')
+        self._executor.shutdown()
+        requests.delete(f'{self._url}?uploadId={self._upload_id}', auth=aws_auth.AWSAuth())
+
+    def __enter__(self: PWN) -> PWN:
+        return self
+
+    def __exit__(self: PWN, exc_type: typing.Any, exc_value: typing.Any, traceback: typing.Any) -> None:
+        if not exc_type is None:
+            return self.abort()
+
+        try:
+            self.close()
+        except Exception:
+            self.abort()
+            raise
+
+def _dump_yaml(body: typing.Dict[str, typing.Any], stream: MultipartUploadStream) -> None:
+    # Top level lists and mappings are written one entry at a time, so only a single entry is ever represented in memory
+    for key, value in body.items():
+        if isinstance(value, list) and value:
+            stream.write(f'{key}:\n')
+            for item in value:
+                yaml.dump([item], stream, indent=4, canonical=False)
+
+        elif isinstance(value, dict) and value:
+            stream.write(f'{key}:\n')
+            for item_key, item_value in value.items():
+                item: str = yaml.dump({item_key: item_value}, indent=4, canonical=False)
+                stream.write(''.join([f'    {line}' for line in item.splitlines(True)]))
+
+        else:
+            yaml.dump({key: value}, stream, indent=4, canonical=False)
+
+def _put_yaml(bucket_name: str, key: str, body: typing.Dict[str, typing.Any]) -> None:
+    logger.info(f'Updating Key[{key}] in AWS Bucket[{bucket_name}]')
+    with MultipartUploadStream(_build_url(bucket_name, key)) as stream:
+        _dump_yaml(body, stream)
+
+def _build_cache_filepath(bucket_name: str, key: str) -> typing.Optional[str]:
+    if not INDEX_CACHE_DIRECTORY:
+        return None
+
+    digest: str = hashlib.sha1(f'{bucket_name}/{key}'.encode(ENCODING)).hexdigest()
+    return os.path.join(INDEX_CACHE_DIRECTORY, f'{digest}.pickle')
+
+def _load_cache(cache_filepath: typing.Optional[str]) -> typing.Optional[typing.Dict[str, typing.Any]]:
+    if cache_filepath is None or not os.path.exists(cache_filepath):
+        return None
+
+    try:
+        with open(cache_filepath, 'rb') as stream:
+            return pickle.load(stream)
+
+    except (EOFError, pickle.UnpicklingError) as err:
+        logger.warning(f'Ignoring invalid Index Cache[{cache_filepath}]: {err}')
+        return None
+
+def _write_cache(cache_filepath: typing.Optional[str], response: 'requests.Response', body: typing.Dict[str, typing.Any]) -> None:
+    if cache_filepath is None or not ('ETag' in response.headers or 'Last-Modified' in response.headers):
+        return None
+
+    os.makedirs(os.path.dirname(cache_filepath), exist_ok=True)
+    cache_tmp_filepath: str = f'{cache_filepath}.{os.getpid()}'
+    with open(cache_tmp_filepath, 'wb') as stream:
+        pickle.dump({
+            'etag': response.headers.get('ETag', None),
+            'last-modified': response.headers.get('Last-Modified', None),
+            'body': body,
+        }, stream, protocol=pickle.HIGHEST_PROTOCOL)
+
+    os.replace(cache_tmp_filepath, cache_filepath)
+
+def _remember_etag(url: str, etag: typing.Optional[str]) -> None:
+    with ETAGS_LOCK:
+        ETAGS.pop(url, None)
+        ETAGS[url] = etag
+        while len(ETAGS) > ETAGS_SIZE:
+            ETAGS.popitem(last=False)
+
+def _get_yaml(bucket_name: str, key: str) -> typing.Optional[typing.Dict[str, typing.Any]]:
+    logger.info(f'Downloading Key[{key}] from AWS Bucket[{bucket_name}]')
+    url: str = _build_url(bucket_name, key)
+    cache_filepath: typing.Optional[str] = _build_cache_filepath(bucket_name, key)
+    cache: typing.Optional[typing.Dict[str, typing.Any]] = _load_cache(cache_filepath)
+    headers: typing.Dict[str, str] = {}
+    if cache and cache['etag']:
+        headers['If-None-Match'] = cache['etag']
+
+    if cache and cache['last-modified']:
+        headers['If-Modified-Since'] = cache['last-modified']
+
+    response = requests.get(url, headers=headers, auth=aws_auth.AWSAuth())
+    if response.status_code == 304 and cache:
+        logger.info(f'Using Index Cache[{cache_filepath}] for Key[{key}]')
+        if key == INDEX_KEY:
+            _remember_etag(url, cache['etag'])
+
+        return cache['body']
+
+    elif response.status_code == 404:
+        return None
+
+    elif response.status_code != 200:
+        raise NotImplementedError
+
+    body: typing.Dict[str, typing.Any] = yaml.load(response.content.decode(ENCODING), Loader=yaml.FullLoader)
+    if key == INDEX_KEY:
+        _remember_etag(url, response.headers.get('ETag', None))
+
+    _write_cache(cache_filepath, response, body)
+    return body
+
+def _delete_key(bucket_name: str, key: str) -> None:
+    logger.info(f'Removing Key[{key}] from AWS Bucket[{bucket_name}]')
+    url: str = _build_url(bucket_name, key)
+    response = requests.delete(url, auth=aws_auth.AWSAuth())
+    if not response.status_code in [200, 204]:
+        raise NotImplementedError
+
+def build_shards(
+    cloud_indices: typing.List[data_types.FitsFileIndex],
+    manifest: typing.Dict[str, typing.Any],
+    shard_depth: int) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+    shards: typing.Dict[str, typing.Dict[str, typing.Any]] = collections.defaultdict(lambda: {
+        'indicies': [],
+        'manifest': {},
+    })
+    for cloud_index in cloud_indices:
+        shard: typing.Dict[str, typing.Any] = shards[utils.build_shard_key(cloud_index.cloudpath, shard_depth)]
+        shard['indicies'].append(cloud_index.index)
+        if cloud_index.cloudpath in manifest:
+            shard['manifest'][cloud_index.cloudpath] = manifest[cloud_index.cloudpath]
+
+    return dict(shards)
+
+def upload_previews(bucket_name: str, preview_directory: str) -> None:
+    for root, directories, filenames in os.walk(preview_directory):
+        for filename in filenames:
+            filepath: str = os.path.join(root, filename)
+            key: str = f'{PREVIEWS_PREFIX}/{os.path.relpath(filepath, preview_directory)}'
+            logger.info(f'Uploading Preview[{key}] to AWS Bucket[{bucket_name}]')
+            with open(filepath, 'rb') as stream, MultipartUploadStream(_build_url(bucket_name, key)) as upload:
+                for chunk in iter(lambda: stream.read(UPLOAD_PART_SIZE), b''):
+                    upload.write(chunk)
+
+def upload_index(
+    options: argparse.Namespace,
+    cloud_indices: typing.List[data_types.FitsFileIndex],
+    manifest: typing.Dict[str, typing.Any] = None) -> None:
+    manifest = {} if manifest is None else manifest
     configuration: typing.Dict[str, typing.Any] = {
         'version': '0.1.0',
         'aws-default-region': AWS_REGION,
-        'indicies': [],
         'index-bucket-name': options.index_bucket_name,
         'data-bucket-path': options.data_bucket_path,
     }
-    for cloud_index in cloud_indices:
-        configuration['indicies'].append(cloud_index.index)
+    indices: typing.List[typing.Dict[str, typing.Any]] = [cloud_index.index for cloud_index in cloud_indices]
+    footprint_index: typing.Dict[str, typing.Any] = footprint.build_footprint_index(indices)
+    keywords: typing.Dict[str, typing.Any] = keyword_table.build_keyword_table(
+        indices, getattr(options, 'keywords', None) or keyword_table.KEYWORDS)
+    if not getattr(options, 'preview_directory', None) is None:
+        upload_previews(options.index_bucket_name, options.preview_directory)
 
-    logger.info(f'Writing Index to Filepath[{index_filepath}]')
-    with open(index_filepath, 'w', encoding=ENCODING) as stream:
-        stream.write(yaml.dump(configuration, indent=4, canonical=False))
+    previews: typing.List[str] = sorted(
+        header['preview']['path'] for index in indices for header in index['headers'] if 'preview' in header)
+    previous_previews: typing.Dict[str, typing.Any] = _get_yaml(options.index_bucket_name, PREVIEW_LISTING_KEY) or {}
+    for preview_path in set(previous_previews.get('previews', [])) - set(previews):
+        _delete_key(options.index_bucket_name, f'{PREVIEWS_PREFIX}/{preview_path}')
 
-    logger.info(f'Updating Cloud Index in AWS Bucket[{options.index_bucket_name}]')
-    url: str = f'https://s3.{AWS_REGION}.amazonaws.com/{options.index_bucket_name}/{INDEX_KEY}'
-    with open(index_filepath, 'r') as stream:
-        response = requests.put(url, data=stream.read(), auth=aws_auth.AWSAuth())
-        if response.status_code != 200:
-            raise NotImplementedError
+    if previews or previous_previews:
+        _put_yaml(options.index_bucket_name, PREVIEW_LISTING_KEY, {'previews': previews})
+
+    # Previews carried over from earlier runs are already in the bucket
+    if any('preview' in header for index in indices for header in index['headers']):
+        configuration['previews-path'] = f's3://{options.index_bucket_name}/{PREVIEWS_PREFIX}'
+
+    shard_depth: int = getattr(options, 'shard_depth', 0)
+    if shard_depth > 0:
+        # The root index only describes how to find a shard, so it stays the same size as the archive grows.
+        # The shard listing is only read back by cloud-fits-index
+        shards: typing.Dict[str, typing.Dict[str, typing.Any]] = build_shards(cloud_indices, manifest, shard_depth)
+        for shard_key, shard in shards.items():
+            _put_yaml(options.index_bucket_name, utils.build_shard_filepath(shard_key), shard)
+
+        previous_listing: typing.Dict[str, typing.Any] = _get_yaml(options.index_bucket_name, SHARD_LISTING_KEY) or {}
+        for shard_key in set(previous_listing.get('shards', [])) - set(shards):
+            _delete_key(options.index_bucket_name, utils.build_shard_filepath(shard_key))
+
+        _put_yaml(options.index_bucket_name, SHARD_LISTING_KEY, {'shards': sorted(shards)})
+        _put_yaml(options.index_bucket_name, FOOTPRINTS_KEY, footprint_index)
+        _put_yaml(options.index_bucket_name, KEYWORDS_KEY, keywords)
+        configuration['shard-depth'] = shard_depth
+        configuration['footprints-key'] = FOOTPRINTS_KEY
+        configuration['keywords-key'] = KEYWORDS_KEY
+
+    else:
+        configuration['footprints'] = footprint_index
+        configuration['keywords'] = keywords
+        configuration['indicies'] = indices
+        configuration['manifest'] = manifest
+
+    _put_yaml(options.index_bucket_name, INDEX_KEY, configuration)
+
+def download_configuration(bucket_name: str) -> typing.Optional[typing.Dict[str, typing.Any]]:
+    configuration: typing.Dict[str, typing.Any] = _get_yaml(bucket_name, INDEX_KEY)
+    if configuration is None or not 'shard-depth' in configuration:
+        return configuration
+
+    # Sharded indices are merged back into a single configuration
+    configuration['indicies'] = []
+    configuration['manifest'] = {}
+    listing: typing.Dict[str, typing.Any] = _get_yaml(bucket_name, SHARD_LISTING_KEY) or {}
+    for shard_key in listing.get('shards', []):
+        shard: typing.Dict[str, typing.Any] = _get_yaml(bucket_name, utils.build_shard_filepath(shard_key)) or {}
+        configuration['indicies'].extend(shard.get('indicies', []))
+        configuration['manifest'].update(shard.get('manifest', {}))
+
+    return configuration
 
 def download_index(bucket_name: str) -> data_types.FitsCloudIndex:
-    index_filepath: str = tempfile.NamedTemporaryFile().name
-    logger.info(f'Downloading Cloud Index from AWS Bucket[{bucket_name}]')
-    url: str = f'https://s3.{AWS_REGION}.amazonaws.com/{bucket_name}/{INDEX_KEY}'
-    response = requests.get(url, auth=aws_auth.AWSAuth())
-    if response.status_code != 200:
-        raise NotImplementedError
+    configuration: typing.Dict[str, typing.Any] = download_configuration(bucket_name)
+    if configuration is None:
+        raise exceptions.IndexException(f'Cloud Index not found in AWS Bucket[{bucket_name}]')
+
+    configuration['index-etag'] = ETAGS.get(_build_url(bucket_name, INDEX_KEY), None)
+    return data_types.FitsCloudIndex(configuration)
+
+def download_catalog(bucket_name: str) -> data_types.FitsCloudCatalog:
+    configuration: typing.Dict[str, typing.Any] = _get_yaml(bucket_name, INDEX_KEY)
+    if configuration is None:
+        raise exceptions.IndexException(f'Cloud Index not found in AWS Bucket[{bucket_name}]')
+
+    def _load_shard(shard_key: str) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        return _get_yaml(bucket_name, utils.build_shard_filepath(shard_key))
+
+    def _load_document(key: str) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        return _get_yaml(bucket_name, key)
 
-    return data_types.FitsCloudIndex(yaml.load(response.content.decode(ENCODING)))
+    configuration['index-etag'] = ETAGS.get(_build_url(bucket_name, INDEX_KEY), None)
+    return data_types.FitsCloudCatalog(configuration, _load_shard, _load_document)
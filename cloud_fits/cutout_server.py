@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+
+import argparse
+import collections
+import concurrent.futures
+import http.server
+import json
+import logging
+import socketserver
+import threading
+import time
+import typing
+
+from urllib.parse import parse_qs, urlparse
+
+import cloud_fits
+
+from cloud_fits import exceptions, data_types, local_index
+from cloud_fits.data_types import gzip_index, utils, shortcuts
+from cloud_fits.lazy_import import lazy_import
+
+bucket_operations = lazy_import('cloud_fits.bucket_operations')
+requests = lazy_import('requests')
+
+# A long running cutout service. Every request shares the in memory index, one connection pool and a cache of file
+# blocks. Requests for the same file that arrive within BATCH_WINDOW seconds are merged into one coalesced fetch plan
+CACHE_BLOCK_SIZE: int = 1024 * 1024
+CACHE_SIZE: int = 512 * 1024 * 1024
+BATCH_WINDOW: float = .005
+FETCH_WORKERS: int = 16
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+logger = logging.getLogger(__name__)
+
+def parse_view(view: str) -> typing.Tuple[typing.Union[int, slice]]:
+    # 0:10,5:20,3 is the same as [0:10, 5:20, 3]
+    nViews: typing.List[typing.Union[int, slice]] = []
+    for axis_view in view.split(','):
+        if ':' in axis_view:
+            nViews.append(slice(*[int(part) if part.strip() else None for part in axis_view.split(':')]))
+
+        else:
+            nViews.append(int(axis_view))
+
+    return tuple(nViews)
+
+class BlockCache:
+    def __init__(self: PWN, max_bytes: int = None) -> None:
+        # Least recently used blocks of CACHE_BLOCK_SIZE bytes, keyed by (url, block number)
+        self.max_bytes = CACHE_SIZE if max_bytes is None else max_bytes
+        self.size = 0
+        self._blocks: typing.Dict[typing.Tuple[str, int], bytes] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self: PWN, key: typing.Tuple[str, int]) -> typing.Optional[bytes]:
+        with self._lock:
+            block: bytes = self._blocks.get(key, None)
+            if not block is None:
+                self._blocks.move_to_end(key)
+
+            return block
+
+    def put(self: PWN, key: typing.Tuple[str, int], block: bytes) -> None:
+        with self._lock:
+            if key in self._blocks:
+                self.size = self.size - len(self._blocks.pop(key))
+
+            self._blocks[key] = block
+            self.size = self.size + len(block)
+            while self.size > self.max_bytes and self._blocks:
+                evicted_key, evicted_block = self._blocks.popitem(last=False)
+                self.size = self.size - len(evicted_block)
+
+class _Batch:
+    def __init__(self: PWN) -> None:
+        self.ranges: typing.List[typing.Tuple[int, int]] = []
+        self.requests = 0
+        self.blocks: typing.Dict[int, bytes] = None
+        self.error: Exception = None
+        self.done = threading.Event()
+
+class CutoutService:
+    def __init__(self: PWN,
+        catalog: data_types.FitsCloudCatalog,
+        cache_size: int = None,
+        batch_window: float = None,
+        fetch_workers: int = None) -> None:
+        self.catalog = catalog
+        self.cache = BlockCache(cache_size)
+        self.batch_window = BATCH_WINDOW if batch_window is None else batch_window
+        self.statistics: typing.Dict[str, int] = collections.Counter()
+        fetch_workers = fetch_workers or FETCH_WORKERS
+        self.session = requests.Session()
+        self.session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=fetch_workers, pool_maxsize=fetch_workers))
+        self.session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=fetch_workers, pool_maxsize=fetch_workers))
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=fetch_workers)
+        self._lock = threading.Lock()
+        self._pending: typing.Dict[str, _Batch] = {}
+
+    def record(self: PWN, key: str, count: int = 1) -> None:
+        with self._lock:
+            self.statistics[key] += count
+
+    def _fetch(self: PWN, url: str, start: int, stop: int) -> bytes:
+        self.record('requests-fetch')
+        if url.startswith('https://') or url.startswith('http://'):
+            return shortcuts.fetch_byte_range(url, start, stop, session=self.session)
+
+        return shortcuts.load_byte_ranges(url, [(start, stop)])[0]
+
+    def _load_blocks(self: PWN, url: str, ranges: typing.List[typing.Tuple[int, int]]) -> typing.Dict[int, bytes]:
+        block_numbers: typing.Set[int] = set()
+        for (start, stop) in ranges:
+            block_numbers.update(range(start // CACHE_BLOCK_SIZE, (stop - 1) // CACHE_BLOCK_SIZE + 1))
+
+        blocks: typing.Dict[int, bytes] = {}
+        missing: typing.List[typing.Tuple[int, int]] = []
+        for block_number in sorted(block_numbers):
+            block: bytes = self.cache.get((url, block_number))
+            if block is None:
+                missing.append((block_number * CACHE_BLOCK_SIZE, (block_number + 1) * CACHE_BLOCK_SIZE))
+
+            else:
+                blocks[block_number] = block
+
+        self.record('cache-hits', len(blocks))
+        self.record('cache-misses', len(missing))
+        # Neighbouring missing blocks are fetched together, the file may end part way through the last block
+        fetch_ranges: typing.List[typing.Tuple[int, int]] = utils.split_ranges(utils.coalesce_ranges(missing), shortcuts.STREAM_CHUNK_SIZE)
+        contents: typing.Iterator[bytes] = self._executor.map(lambda fetch_range: self._fetch(url, *fetch_range), fetch_ranges)
+        for (start, stop), content in zip(fetch_ranges, contents):
+            self.record('bytes-fetched', len(content))
+            for position in range(0, len(content), CACHE_BLOCK_SIZE):
+                block_number: int = (start + position) // CACHE_BLOCK_SIZE
+                blocks[block_number] = content[position:position + CACHE_BLOCK_SIZE]
+                self.cache.put((url, block_number), blocks[block_number])
+
+        return blocks
+
+    def load_byte_ranges(self: PWN, url: str, ranges: typing.List[typing.Tuple[int, int]]) -> typing.List[bytes]:
+        # The first request for a url waits BATCH_WINDOW seconds for others to join before fetching
+        with self._lock:
+            batch: _Batch = self._pending.get(url, None)
+            leader: bool = batch is None
+            if leader:
+                batch = self._pending[url] = _Batch()
+
+            batch.ranges.extend(ranges)
+            batch.requests = batch.requests + 1
+
+        if leader:
+            time.sleep(self.batch_window)
+            with self._lock:
+                self._pending.pop(url)
+                self.statistics['batches'] += 1
+                self.statistics['batched-requests'] += batch.requests
+
+            try:
+                batch.blocks = self._load_blocks(url, batch.ranges)
+            except Exception as err:
+                batch.error = err
+
+            finally:
+                batch.done.set()
+
+        else:
+            batch.done.wait()
+
+        if not batch.error is None:
+            raise batch.error
+
+        datas: typing.List[bytes] = []
+        for (start, stop) in ranges:
+            pieces: typing.List[bytes] = []
+            for block_number in range(start // CACHE_BLOCK_SIZE, (stop - 1) // CACHE_BLOCK_SIZE + 1):
+                block_start: int = block_number * CACHE_BLOCK_SIZE
+                pieces.append(batch.blocks[block_number][max(start, block_start) - block_start:min(stop, block_start + CACHE_BLOCK_SIZE) - block_start])
+
+            datas.append(b''.join(pieces))
+
+        return datas
+
+    def load_gzip_byte_ranges(self: PWN,
+        url: str,
+        ranges: typing.List[typing.Tuple[int, int]],
+        seek_index: typing.Dict[str, typing.Any]) -> typing.List[bytes]:
+        # Ranges are uncompressed offsets, the compressed spans from their seek points go through the block cache
+        reads: typing.List[gzip_index.GzipRead] = gzip_index.plan_reads(seek_index, ranges)
+        payloads: typing.List[bytes] = self.load_byte_ranges(url, [(read.compressed_start, read.compressed_stop) for read in reads])
+        datas: typing.List[bytes] = [None] * len(ranges)
+        for read, payload in zip(reads, payloads):
+            inflated: bytes = gzip_index.inflate_read(seek_index, read, payload)
+            for idx in read.ranges:
+                datas[idx] = inflated[ranges[idx][0] - read.start:ranges[idx][1] - read.start]
+
+        return datas
+
+    def find_header(self: PWN, cloudpath: str, hdu: int) -> data_types.FitsCloudIndexHeader:
+        # FitsCloudIndex replaces the index headers in place, so the catalog is only read by one thread at a time
+        with self._lock:
+            headers: typing.List[data_types.FitsCloudIndexHeader] = self.catalog[cloudpath].headers
+
+        if hdu < 0 or hdu >= len(headers):
+            raise exceptions.IndexException(f'HDU[{hdu}] not found in CloudPath[{cloudpath}]')
+
+        return headers[hdu]
+
+    def cutout(self: PWN, cloudpath: str, hdu: int, nViews: typing.Tuple[typing.Union[int, slice]]) -> bytes:
+        # The cutout is returned as a FITS file, the payloads are already big-endian FITS data in C order
+        header: data_types.FitsCloudIndexHeader = self.find_header(cloudpath, hdu)
+        ranges, primary_header, cutout_header = header._plan_cutout_file(nViews)
+        if header.seek_index is None:
+            payload: bytes = b''.join(self.load_byte_ranges(header.url, ranges))
+
+        else:
+            payload: bytes = b''.join(self.load_gzip_byte_ranges(header.url, ranges, header.seek_index))
+
+        self.record('cutouts')
+        return b''.join([
+            primary_header,
+            cutout_header.tostring().encode('ascii'),
+            payload,
+            b'\0' * (-len(payload) % utils.BLOCK_SIZE)])
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads: bool = True
+    # Parallel range fetches open many connections at once, the default backlog of 5 resets them
+    request_queue_size: int = 128
+
+class _CutoutRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version: str = 'HTTP/1.1'
+
+    def log_message(self: PWN, format: str, *args: typing.Any) -> None:
+        logger.debug(format % args)
+
+    def _send(self: PWN, status_code: int, body: bytes, content_type: str) -> None:
+        self.send_response(status_code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self: PWN, status_code: int, body: typing.Any) -> None:
+        self._send(status_code, json.dumps(body).encode('utf-8'), 'application/json')
+
+    def do_GET(self: PWN) -> None:
+        # GET /cutout?path=<cloudpath>&hdu=1&view=0:10,5:20,3 and GET /statistics
+        service: CutoutService = self.server.service
+        url_parts = urlparse(self.path)
+        query: typing.Dict[str, typing.List[str]] = parse_qs(url_parts.query)
+        if url_parts.path == '/statistics':
+            return self._send_json(200, dict(service.statistics))
+
+        elif url_parts.path != '/cutout':
+            return self._send_json(404, {'error': f'Path[{url_parts.path}] not found'})
+
+        try:
+            body: bytes = service.cutout(query['path'][0], int(query.get('hdu', ['1'])[0]), parse_view(query['view'][0]))
+        except exceptions.IndexException as err:
+            return self._send_json(404, {'error': str(err)})
+
+        except exceptions.RangeException as err:
+            # The data bucket refused or failed the range, status is what it answered with
+            return self._send_json(502, {'error': str(err), 'status': err.status_code})
+
+        except (KeyError, ValueError, AssertionError, NotImplementedError) as err:
+            return self._send_json(400, {'error': f'Invalid Request[{self.path}]: {err!r}'})
+
+        except Exception as err:
+            # Anything else, e.g. a dropped connection to the data bucket, still gets a response
+            logger.exception(f'Unable to serve Request[{self.path}]')
+            return self._send_json(500, {'error': f'Unable to serve Request[{self.path}]: {err!r}'})
+
+        return self._send(200, body, 'application/fits')
+
+class CutoutServer:
+    def __init__(self: PWN, service: CutoutService, host: str = '127.0.0.1', port: int = 0) -> None:
+        self.service = service
+        self._server = _ThreadingHTTPServer((host, port), _CutoutRequestHandler)
+        self._server.service = service
+        self._thread: threading.Thread = None
+
+    @property
+    def endpoint(self: PWN) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self: PWN) -> PWN:
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f'Serving Cutouts on Endpoint[{self.endpoint}]')
+        return self
+
+    def stop(self: PWN) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self: PWN) -> PWN:
+        return self.start()
+
+    def __exit__(self: PWN, *args: typing.Any) -> None:
+        self.stop()
+
+def capture_options() -> argparse.Namespace:
+    options = argparse.ArgumentParser()
+    source = options.add_mutually_exclusive_group(required=True)
+    source.add_argument('-i', '--index-bucket-name', type=str, help="""
+Serve the Cloud Fits Index stored in this bucket
+""")
+    source.add_argument('-f', '--fits-files-directory', type=str, help="""
+Index a local directory in memory and serve it
+""")
+    options.add_argument('--host', type=str, default='127.0.0.1')
+    options.add_argument('-p', '--port', type=int, default=8080)
+    options.add_argument('-c', '--cache-size', type=int, default=CACHE_SIZE, help="""
+Bytes of file blocks cached across requests
+""")
+    options.add_argument('-w', '--batch-window', type=float, default=BATCH_WINDOW, help="""
+Seconds a request waits for others on the same file to be fetched together
+""")
+    return options.parse_args()
+
+def run_from_cli() -> None:
+    cloud_fits.configure_logging()
+    options = capture_options()
+    if options.fits_files_directory:
+        catalog: data_types.FitsCloudCatalog = local_index.build_local_catalog(options.fits_files_directory)
+
+    else:
+        catalog: data_types.FitsCloudCatalog = bucket_operations.download_catalog(options.index_bucket_name)
+
+    server = CutoutServer(CutoutService(catalog, options.cache_size, options.batch_window), options.host, options.port)
+    logger.info(f'Serving Cutouts on Endpoint[{server.endpoint}]')
+    server._server.serve_forever()
+
+if __name__ == '__main__':
+    run_from_cli()
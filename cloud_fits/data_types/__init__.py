@@ -1,48 +1,69 @@
 import collections
 import enum
 import functools
+import hashlib
 import logging
 import operator
 import os
-import requests
 import tempfile
 import typing
 
-import numpy as np
+from cloud_fits import exceptions, profiling
+from cloud_fits.data_types import cutout_cache, footprint, gzip_index, keyword_table, metrics, read_plan, utils, shortcuts
+from cloud_fits.lazy_import import lazy_import
 
-from astropy.io import fits
-from astropy.table import Table as Astropy_Table
-
-from cloud_fits import exceptions
-from cloud_fits.auth import aws as aws_auth
-from cloud_fits.data_types import utils, shortcuts
+astropy_table = lazy_import('astropy.table')
+fits = lazy_import('astropy.io.fits')
+np = lazy_import('numpy')
 
 BLOCK_SIZE: int = 2880
+# nan* operations skip NaN pixels per element, nanmean divides by the weight of the pixels that were valid
+REDUCE_OPERATIONS: typing.List[str] = ['sum', 'mean', 'nansum', 'nanmean']
 PWN: typing.TypeVar = typing.TypeVar('PWN')
 logger = logging.getLogger(__name__)
 
 FitsCloudIndexContext = collections.namedtuple('FitsCloudIndexContext', [
-    'region', 'version', 'bucket_name', 'data_bucket_path'])
+    'region', 'version', 'bucket_name', 'data_bucket_path', 'etag', 'previews_path'])
+Preview = collections.namedtuple('Preview', ['data', 'factor'])
 
 class ExtensionType(enum.Enum):
     BinTable: str = 'bintable'
     Image: str = 'image'
     Primary: str = 'primary'
 
+# Resolved into slots once per HDU, a catalog holds one FitsCloudIndexHeader for every HDU it has loaded
+HEADER_FIELDS: typing.List[str] = ['offset', 'length', 'stop', 'whole']
+DATA_FIELDS: typing.List[str] = ['offset', 'length', 'stop', 'shape', 'data_type', 'strides', 'size']
+
 class FitsCloudIndexHeader:
+    __slots__ = ['_context', '_hdu', '_seek_index', '_header', '_primary_header', '_cloudpath', '_times', '_dtype', 'type'] \
+        + [f'header_{name}' for name in HEADER_FIELDS] + [f'data_{name}' for name in DATA_FIELDS]
+
     def __init__(self: PWN,
         header: typing.Dict[str, typing.Any],
         primary_header: typing.Dict[str, typing.Any],
         cloudpath: str,
-        context: FitsCloudIndexContext) -> None:
+        context: FitsCloudIndexContext,
+        hdu: int = None,
+        seek_index: typing.Dict[str, typing.Any] = None) -> None:
 
         self._context = context
-        self._header = header
+        self._hdu = hdu
+        self._seek_index = seek_index
+        # Only the optional sections, e.g. time, zones and preview, are kept as a dict
+        self._header = {name: value for name, value in header.items() if not name in ['header', 'data']}
         self._primary_header = primary_header
         self._cloudpath = cloudpath
+        self._times: typing.Tuple['np.ndarray', 'np.ndarray'] = None
+        self._dtype: 'np.dtype' = None
+        for name in HEADER_FIELDS:
+            setattr(self, f'header_{name}', header['header'].get(name, None))
+
+        for name in DATA_FIELDS:
+            setattr(self, f'data_{name}', header['data'].get(name, None))
 
         for header_name in ['SIMPLE', 'XTENSION']:
-            value: str = self.fits.get(header_name, None)
+            value: str = utils.read_header_card(self.header_whole, header_name)
             if value is True:
                 self.type = ExtensionType.Primary
 
@@ -55,27 +76,179 @@ class FitsCloudIndexHeader:
         if getattr(self, 'type', None) is None:
             raise NotImplementedError
 
-    def _slice_image(self: PWN, nViews: typing.List[slice]) -> Astropy_Table:
+    def _generate_image_ranges(self: PWN, nViews: typing.List[slice]) -> typing.Tuple[typing.List[slice], typing.List[typing.List[int]]]:
         utils.image__validate_fits_format(self.fits)
         utils.image__validate_python_inputs(nViews, self.data_shape)
         nViews = utils.convert_nViews_to_slices(nViews, self.data_shape)
-        # cutout = shortcuts.test_cutout('data/data-cube/tess-s0001-1-1-cube.fits')
-        # cutout.writeto('/tmp/test-cutout.fits', overwrite=True)
-        # Keeping this code for debugging at some point
-        # utils.image__generate_ranges__validate(nViews, self.data_strides, self.data_offset, 0, ranges)
-        # shape = utils.calculate_shape_from_nViews(nViews)
-        # cutout = shortcuts.local_cutout('data/data-cube/tess-s0001-1-1-cube.fits', ranges, shape, getattr(np, self.data_data_type))
-        # cutout[1].data = np.transpose(cutout[1].data[:, :, 0, 0])
-        # cutout.writeto('/tmp/main.fits', overwrite=True)
-        cloud_data_path = self._context.data_bucket_path.split('s3://', 1)[1].strip('/')
-        url: str = f'https://s3.{self._context.region}.amazonaws.com/{cloud_data_path}/{self._cloudpath}'
-        ranges = utils.image__generate_ranges(nViews, self.data_strides, self.data_offset, -1)
+        return nViews, utils.image__generate_ranges(nViews, self.data_strides, self.data_offset, 0)
+
+    def _plan_image(self: PWN, nViews: typing.List[slice]) -> typing.Tuple[typing.List[slice], typing.List[typing.List[int]]]:
+        nViews, ranges = self._generate_image_ranges(nViews)
+        # Sorted ranges are in C order, so the payloads can be laid out back to back
+        return nViews, utils.coalesce_ranges(ranges)
+
+    def _plan_read(self: PWN,
+        nViews: typing.List[slice],
+        network_model: read_plan.NetworkModel = None,
+        out: typing.Union[str, 'np.ndarray', None] = None) -> read_plan.ReadPlan:
+        # Ranges are split the same way the read splits them, out of core and gzip compressed cutouts and bintables stream
+        if self.type == ExtensionType.Image:
+            nViews, generated_ranges = self._generate_image_ranges(nViews)
+            shape: typing.Tuple[int] = utils.calculate_shape_from_nViews(nViews)
+            ranges: typing.List[typing.List[int]] = utils.coalesce_ranges(generated_ranges)
+            if shortcuts.streams_cutout(shape, self.dtype, False, utils.image__read_scaling(self.header_whole), out, self._seek_index):
+                ranges = utils.split_ranges(ranges, shortcuts.STREAM_CHUNK_SIZE)
+
+            return read_plan.ReadPlan('cutout', self.url, shape, len(generated_ranges), self._compressed_ranges(ranges), network_model)
+
+        elif self.type == ExtensionType.BinTable:
+            assert len(nViews) == 1
+            nViews = utils.convert_nViews_to_slices(nViews, (self.fits['NAXIS2'], ))
+            start: int = nViews[0].start * self.fits['NAXIS1'] + self.data_offset
+            stop: int = nViews[0].stop * self.fits['NAXIS1'] + self.data_offset
+            return read_plan.ReadPlan('bintable', self.url, utils.calculate_shape_from_nViews(nViews), 1,
+                self._compressed_ranges(utils.split_ranges([[start, stop]], shortcuts.STREAM_CHUNK_SIZE)), network_model)
+
+        raise NotImplementedError(f'Fits Datatype[{self.type}] Not supported yet')
+
+    def _compressed_ranges(self: PWN, ranges: typing.List[typing.List[int]]) -> typing.List[typing.List[int]]:
+        # Gzip compressed files are fetched from the seek point before every read
+        if self._seek_index is None:
+            return ranges
+
+        return [[read.compressed_start, read.compressed_stop] for read in gzip_index.plan_reads(self._seek_index, ranges)]
+
+    @property
+    def seek_index(self: PWN) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        return self._seek_index
+
+    @property
+    def explain(self: PWN) -> read_plan.ReadPlanner:
+        # Dry run, header.explain[0:10, 0:10, 0:100, 0] plans and prices the read without fetching
+        return read_plan.ReadPlanner(self)
+
+    def _plan_cutout(self: PWN,
+        nViews: typing.List[slice],
+        scale: bool = True) -> typing.Tuple[typing.List[typing.List[int]], typing.Tuple[int], utils.ImageScaling, 'fits.Header']:
+        nViews, ranges = self._plan_image(nViews)
         shape = utils.calculate_shape_from_nViews(nViews)
-        return shortcuts.remote_cutout(url, ranges, shape)
+        scaling: utils.ImageScaling = utils.image__read_scaling(self.header_whole) if scale else None
+        header: fits.Header = None
+        if all([nView.step in [None, 1] for nView in nViews]):
+            header = utils.image__build_cutout_header(self.fits, nViews)
+
+        return ranges, shape, scaling, header
+
+    def _plan_fetch(self: PWN,
+        nViews: typing.List[slice],
+        native_byteorder: bool = False,
+        scale: bool = True) -> typing.Tuple[typing.List[typing.List[int]], metrics.FetchTelemetry, typing.Callable[[typing.List[bytes]], typing.Any]]:
+        # The ranges of this HDU for FitsCloudIndex.fetch, and how their payloads are assembled once fetched. Ranges are
+        # split by STREAM_CHUNK_SIZE like a streamed read. Cached cutouts have no ranges, out of core cutouts have none
+        # either and are streamed into their memmap when assembled
+        if self.type == ExtensionType.Image:
+            cache: typing.Optional[cutout_cache.CutoutCache] = cutout_cache.CUTOUT_CACHE
+            if not cache is None:
+                cache_key: typing.Tuple = self._build_cache_key(nViews, native_byteorder, scale)
+                cached: typing.Optional[fits.HDUList] = self._load_cached_cutout(cache, cache_key)
+                if not cached is None:
+                    return [], cached.telemetry, lambda payloads: cached
+
+            ranges, shape, scaling, header = self._plan_cutout(nViews, scale)
+            telemetry = metrics.FetchTelemetry('cutout', self.url, len(ranges), int(np.prod(shape)) * self.data_itemsize)
+            if shortcuts.streams_cutout(shape, self.dtype, native_byteorder, scaling):
+                def _stream_cutout(payloads: typing.List[bytes]) -> 'fits.HDUList':
+                    cutout: fits.HDUList = shortcuts.image_cutout(
+                        self.url, ranges, shape, self.dtype, native_byteorder, scaling, header, None, telemetry, self._seek_index)
+                    cutout.telemetry = telemetry.finish()
+                    return cutout
+
+                return [], telemetry, _stream_cutout
+
+            split_ranges: typing.List[typing.List[int]] = utils.split_ranges(ranges, shortcuts.STREAM_CHUNK_SIZE)
+            def _assemble_cutout(payloads: typing.List[bytes]) -> 'fits.HDUList':
+                cutout: fits.HDUList = shortcuts.assemble_image_cutout(
+                    payloads, split_ranges, shape, self.dtype, native_byteorder, scaling, header)
+                cutout.telemetry = telemetry.finish()
+                if not cache is None:
+                    cache.put(cache_key, cutout[1].header.copy(), cutout[1].data)
+
+                return cutout
+
+            return split_ranges, telemetry, _assemble_cutout
+
+        elif self.type == ExtensionType.BinTable:
+            start, stop, telemetry = self._plan_bintable(nViews)
+            ranges: typing.List[typing.List[int]] = utils.split_ranges([[start, stop]], shortcuts.STREAM_CHUNK_SIZE)
+            return ranges, telemetry, lambda payloads: self._assemble_bintable(nViews, payloads, telemetry)
+
+        raise NotImplementedError(f'Fits Datatype[{self.type}] Not supported yet')
+
+    def _slice_image(self: PWN,
+        nViews: typing.List[slice],
+        native_byteorder: bool = False,
+        scale: bool = True,
+        out: typing.Union[str, 'np.ndarray', None] = None) -> 'fits.HDUList':
+        cache: typing.Optional[cutout_cache.CutoutCache] = cutout_cache.CUTOUT_CACHE if out is None else None
+        if not cache is None:
+            cache_key: typing.Tuple = self._build_cache_key(nViews, native_byteorder, scale)
+            cached: typing.Optional[fits.HDUList] = self._load_cached_cutout(cache, cache_key)
+            if not cached is None:
+                return cached
+
+        with profiling.phase('plan'):
+            ranges, shape, scaling, header = self._plan_cutout(nViews, scale)
+
+        telemetry = metrics.FetchTelemetry('cutout', self.url, len(ranges), int(np.prod(shape)) * self.data_itemsize)
+        cutout: fits.HDUList = shortcuts.image_cutout(
+            self.url, ranges, shape, self.dtype, native_byteorder, scaling, header, out, telemetry, self._seek_index)
+        cutout.telemetry = telemetry.finish()
+        if not cache is None and not isinstance(cutout[1].data, np.memmap):
+            cache.put(cache_key, cutout[1].header.copy(), cutout[1].data)
+
+        return cutout
+
+    def _load_cached_cutout(self: PWN, cache: cutout_cache.CutoutCache, cache_key: typing.Tuple) -> typing.Optional['fits.HDUList']:
+        cached: typing.Optional[cutout_cache.CachedCutout] = cache.get(cache_key)
+        if cached is None:
+            return None
 
+        cutout: fits.HDUList = utils.create_hdu_list(cached.header.copy())
+        cutout[1].data = cached.data
+        cutout.telemetry = metrics.FetchTelemetry('cutout', self.url, 0, cached.data.nbytes)
+        cutout.telemetry.cached = True
+        cutout.telemetry.finish()
+        return cutout
 
-    def _slice_bintable(self: PWN, nViews: typing.List[slice]) -> Astropy_Table:
-        def __validate_bintable_fits_format(header: fits.Header) -> None:
+    def _build_cache_key(self: PWN, nViews: typing.List[slice], native_byteorder: bool, scale: bool) -> typing.Tuple:
+        # The root index ETag alone misses files re-indexed into a shard, the header and data offset identify the file
+        token: str = hashlib.sha1(self.header_whole + str(self.data_offset).encode('ascii')).hexdigest()
+        nViews = utils.convert_nViews_to_slices(nViews, self.data_shape)
+        return (self._context.etag, token, self._cloudpath, self._hdu, tuple((nView.start, nView.stop, nView.step) for nView in nViews), native_byteorder, scale)
+
+    def _plan_cutout_file(self: PWN,
+        nViews: typing.Union[typing.Tuple, int, slice, typing.Tuple[slice]]) -> typing.Tuple[typing.List[typing.List[int]], bytes, 'fits.Header']:
+        if self.type != ExtensionType.Image:
+            raise NotImplementedError(f'Fits Datatype[{self.type}] Not supported yet')
+
+        nViews, ranges = self._plan_image(self._as_nViews(nViews))
+        primary_header: bytes = self._primary_header['header']['whole']
+        if utils.read_header_card(primary_header, 'NAXIS') != 0:
+            primary_header = utils.create_primary_header().header.tostring().encode('ascii')
+
+        return ranges, primary_header, utils.image__build_cutout_header(self.fits, nViews)
+
+    def write_cutout(self: PWN, nViews: typing.Union[typing.Tuple, int, slice, typing.Tuple[slice]], filepath: str) -> str:
+        # Streams the cutout to a FITS file without holding it in memory
+        ranges, primary_header, header = self._plan_cutout_file(nViews)
+        telemetry = metrics.FetchTelemetry('write-cutout', self.url, len(ranges), sum(stop - start for (start, stop) in ranges))
+        shortcuts.write_image_cutout(self.url, ranges, primary_header, header, filepath, telemetry, self._seek_index)
+        telemetry.finish()
+        return filepath
+
+
+    def _plan_bintable(self: PWN, nViews: typing.List[slice]) -> typing.Tuple[int, int, metrics.FetchTelemetry]:
+        def __validate_bintable_fits_format(header: 'fits.Header') -> None:
             # https://github.com/astropy/astropy/blob/master/astropy/io/fits/hdu/table.py#L548
             # Implemented the validators that are aligned with the FITS Spec
             # http://articles.adsabs.harvard.edu/pdf/1995A%26AS..113..159C
@@ -92,45 +265,309 @@ class FitsCloudIndexHeader:
                 if idx > 999:
                     raise NotImplementedError(f'Invalid FITS Format')
 
-        def __validate_bintable_python_inputs(header: fits.Header, nViews: typing.List[slice]) -> None:
+        def __validate_bintable_python_inputs(header: 'fits.Header', nViews: typing.List[slice]) -> None:
             assert len(nViews) == 1
 
         __validate_bintable_fits_format(self.fits)
         __validate_bintable_python_inputs(self.fits, nViews)
-        path: str = f'{self._context.data_bucket_path[5:].strip("/")}/{self._cloudpath}'
-        url: str = f'https://s3.{self._context.region}.amazonaws.com/{path}'
 
         # NAXIS1 = number of bytes per row
         # NAXIS2 = number of rows in the table
         start: int = nViews[0].start * self.fits['NAXIS1'] + self.data_offset
         stop: int = nViews[0].stop * self.fits['NAXIS1'] + self.data_offset
-        response = requests.get(url, headers={
-            'Range': f'bytes={start}-{stop}',
-        }, auth=aws_auth.AWSAuth(True), stream=True)
+        return start, stop, metrics.FetchTelemetry('bintable', self.url, 1, stop - start)
+
+    def _slice_bintable(self: PWN, nViews: typing.List[slice]) -> 'astropy_table.Table':
+        start, stop, telemetry = self._plan_bintable(nViews)
+        chunks: typing.Iterator[bytes] = shortcuts.stream_byte_ranges(
+            self.url, [(start, stop)], telemetry=telemetry, seek_index=self._seek_index)
+        return self._assemble_bintable(nViews, chunks, telemetry)
+
+    def _assemble_bintable(self: PWN,
+        nViews: typing.List[slice],
+        chunks: typing.Iterable[bytes],
+        telemetry: metrics.FetchTelemetry) -> 'astropy_table.Table':
+        # Chunks are written to the file as they arrive, the rows are only held once astropy decodes them
         cutout_name: str = tempfile.NamedTemporaryFile().name
+        data_length: int = 0
         with open(cutout_name, 'wb') as stream:
             stream.write(self._primary_header['header']['whole'])
             new_header: fits.Header = self.fits
             new_header['NAXIS2'] = nViews[0].stop - nViews[0].start
             stream.write(new_header.tostring().encode('ascii'))
-            for chunk in response.iter_content(1024):
-                stream.write(chunk)
-
-        return Astropy_Table(fits.open(cutout_name)[1].data)
-
-    def __getitem__(self: PWN, nViews: typing.Union[typing.Tuple, int, slice, typing.Tuple[slice]]) -> typing.Any:
+            with profiling.phase('fetch'):
+                for chunk in chunks:
+                    stream.write(chunk)
+                    data_length = data_length + len(chunk)
+
+            stream.write(b'\0' * (-data_length % BLOCK_SIZE))
+
+        with profiling.phase('decode'):
+            table: astropy_table.Table = astropy_table.Table(fits.open(cutout_name)[1].data)
+
+        table.telemetry = telemetry.finish()
+        return table
+
+    def where(self: PWN, column: str, op: str, value: typing.Any) -> 'astropy_table.Table':
+        # Rows where `column op value`, e.g. where('QUALITY', '&', 128). Row groups the zone map rules out aren't fetched
+        if self.type != ExtensionType.BinTable:
+            raise NotImplementedError(f'Fits Datatype[{self.type}] Not supported yet')
+
+        header: fits.Header = self.fits
+        if header.get('PCOUNT', 0) != 0:
+            raise NotImplementedError(f'Variable length arrays Not supported yet')
+
+        row_length: int = header['NAXIS1']
+        row_ranges: typing.List[typing.List[int]] = utils.bintable__zone_candidates(
+            self._header.get('zones', None), column, op, value, header['NAXIS2'])
+        ranges: typing.List[typing.Tuple[int, int]] = [
+            (start * row_length + self.data_offset, stop * row_length + self.data_offset) for (start, stop) in row_ranges]
+        telemetry = metrics.FetchTelemetry('where', self.url, len(ranges))
+        with profiling.phase('fetch'):
+            payload: bytes = b''.join(shortcuts.load_byte_ranges(self.url, ranges, telemetry, self._seek_index))
+
+        with profiling.phase('decode'):
+            header['NAXIS2'] = len(payload) // row_length
+            candidates = fits.BinTableHDU.fromstring(header.tostring().encode('ascii') + payload + b'\0' * (-len(payload) % BLOCK_SIZE))
+            table: astropy_table.Table = astropy_table.Table(candidates.data)[
+                utils.bintable__evaluate(np.asarray(candidates.data[column]), op, value)]
+
+        # Only the matching rows are useful, the rest of each candidate row group is over-read
+        telemetry.bytes_useful = len(table) * row_length
+        table.telemetry = telemetry.finish()
+        return table
+
+    def to_dask(self: PWN, chunks: typing.Union[str, typing.Tuple[int]] = 'auto') -> typing.Any:
+        if self.type != ExtensionType.Image:
+            raise NotImplementedError(f'Fits Datatype[{self.type}] Not supported yet')
+
+        from cloud_fits.data_types import dask_array
+        return dask_array.from_index_header(self, chunks)
+
+    def _as_nViews(self: PWN, nViews: typing.Union[typing.Tuple, int, slice, typing.Tuple[slice]]) -> typing.List[slice]:
         if isinstance(nViews, tuple):
-            nViews = list(nViews)
+            return list(nViews)
 
         elif isinstance(nViews, slice):
-            nViews = [nViews]
+            return [nViews]
 
         elif isinstance(nViews, int):
-            nViews = [slice(nViews, nViews + 1, None)]
-
-        else:
-            raise NotImplementedError(nViews.__class__)
+            return [slice(nViews, nViews + 1, None)]
+
+        raise NotImplementedError(nViews.__class__)
+
+    def cutout(self: PWN,
+        nViews: typing.Union[typing.Tuple, int, slice, typing.Tuple[slice]],
+        native_byteorder: bool = False,
+        scale: bool = True,
+        out: typing.Union[str, 'np.ndarray', None] = None) -> 'fits.HDUList':
+        # native_byteorder byteswaps the result in place, scale applies BSCALE/BZERO the same way astropy does
+        # out is a filepath backing the result with a np.memmap, or an array to fill. Cutouts over
+        # shortcuts.MEMMAP_THRESHOLD bytes are memory mapped automatically
+        if self.type != ExtensionType.Image:
+            raise NotImplementedError(f'Fits Datatype[{self.type}] Not supported yet')
+
+        return self._slice_image(self._as_nViews(nViews), native_byteorder, scale, out)
+
+    def _as_pixels(self: PWN, pixels: typing.Union['np.ndarray', typing.List[typing.Tuple[int]]]) -> 'np.ndarray':
+        # (pixels, leading axes) indices, a boolean mask selects its True pixels in C order
+        pixels = np.asarray(pixels)
+        data_shape: typing.Tuple[int] = tuple(self.data_shape)
+        if pixels.dtype == bool:
+            assert 0 < pixels.ndim < len(data_shape) and pixels.shape == data_shape[:pixels.ndim]
+            return np.argwhere(pixels)
+
+        assert len(pixels) > 0
+        pixels = pixels.astype(np.int64).reshape(len(pixels), -1)
+        assert pixels.shape[1] < len(data_shape)
+        assert ((pixels > -1) & (pixels < np.array(data_shape[:pixels.shape[1]]))).all()
+        return pixels
+
+    def _plan_pixels(self: PWN,
+        pixels: typing.Union['np.ndarray', typing.List[typing.Tuple[int]]],
+        nViews: typing.Union[typing.Tuple, int, slice, typing.Tuple[slice]] = None) -> typing.Tuple['np.ndarray', 'np.ndarray', 'np.ndarray', typing.Tuple[int]]:
+        # Ranges of the pixel at the origin are planned once, every selected pixel shifts them by its byte offset
+        pixels = self._as_pixels(pixels)
+        leading: int = pixels.shape[1]
+        trailing_nViews: typing.List[slice] = [] if nViews is None else self._as_nViews(nViews)
+        trailing_nViews = trailing_nViews + [slice(None)] * (len(self.data_shape) - leading - len(trailing_nViews))
+        nViews, pixel_ranges = self._plan_image([slice(0, 1)] * leading + trailing_nViews)
+        offsets: np.ndarray = pixels @ np.array(self.data_strides[:leading], dtype=np.int64)
+        return pixels, offsets, np.array(pixel_ranges, dtype=np.int64), utils.calculate_shape_from_nViews(nViews)[leading:]
+
+    def take(self: PWN,
+        pixels: typing.Union['np.ndarray', typing.List[typing.Tuple[int]]],
+        nViews: typing.Union[typing.Tuple, int, slice, typing.Tuple[slice]] = None,
+        native_byteorder: bool = False,
+        scale: bool = True,
+        max_gap: int = None) -> 'np.ndarray':
+        # pixels is a boolean mask over the leading axes, e.g. (rows, columns), or a list of index tuples into them.
+        # nViews selects the remaining axes. Returns (pixels, ) + the remaining shape, only the selected pixels are
+        # fetched and reads closer than max_gap bytes are merged
+        if self.type != ExtensionType.Image:
+            raise NotImplementedError(f'Fits Datatype[{self.type}] Not supported yet')
+
+        with profiling.phase('plan'):
+            pixels, offsets, pixel_ranges, shape = self._plan_pixels(pixels, nViews)
+            ranges: typing.List[typing.List[int]] = (offsets[:, None, None] + pixel_ranges).reshape(-1, 2).tolist()
+            shape = (len(pixels), ) + shape
+
+        telemetry = metrics.FetchTelemetry('take', self.url, len(ranges), int(np.prod(shape)) * self.data_itemsize)
+        with profiling.phase('fetch'):
+            payload: bytearray = shortcuts.gather_byte_ranges(
+                self.url, ranges, shortcuts.GATHER_MAX_GAP if max_gap is None else max_gap, telemetry, self._seek_index)
+
+        with profiling.phase('decode'):
+            data_arr: np.ndarray = np.frombuffer(payload, dtype=self.dtype).reshape(shape)
+            if native_byteorder and not data_arr.dtype.isnative:
+                data_arr.byteswap(inplace=True)
+                data_arr = data_arr.view(data_arr.dtype.newbyteorder('='))
+
+            data_arr = utils.image__apply_scaling(data_arr, utils.image__read_scaling(self.header_whole) if scale else None)
+
+        telemetry.finish()
+        return data_arr
+
+    def reduce(self: PWN,
+        aperture: typing.Union['np.ndarray', typing.List[typing.Tuple[int]]],
+        op: str = 'sum',
+        nViews: typing.Union[typing.Tuple, int, slice, typing.Tuple[slice]] = None,
+        weights: 'np.ndarray' = None,
+        scale: bool = True) -> 'np.ndarray':
+        # Reduces the aperture pixels to one array of the remaining view shape, e.g. a summed light curve. weights is one
+        # value per pixel or a map over the leading axes. Payloads are accumulated as they stream in, so memory is the
+        # result plus the fetch chunks in flight
+        if self.type != ExtensionType.Image:
+            raise NotImplementedError(f'Fits Datatype[{self.type}] Not supported yet')
+
+        if not op in REDUCE_OPERATIONS:
+            raise NotImplementedError(f'Operation[{op}] Not supported yet')
+
+        with profiling.phase('plan'):
+            pixels, offsets, pixel_ranges, shape = self._plan_pixels(aperture, nViews)
+            pixel_weights: np.ndarray = np.ones(len(pixels)) if weights is None else np.asarray(weights, dtype=np.float64)
+            if pixel_weights.shape == tuple(self.data_shape[:pixels.shape[1]]):
+                pixel_weights = pixel_weights[tuple(pixels.T)]
+
+            assert pixel_weights.shape == (len(pixels), )
+            # Pixels are read in file order, a repeated pixel is read once and counts its weights together
+            offsets, inverse = np.unique(offsets, return_inverse=True)
+            pixel_weights = np.bincount(inverse.reshape(-1), weights=pixel_weights, minlength=len(offsets))
+            ranges: typing.List[typing.List[int]] = utils.coalesce_ranges((offsets[:, None, None] + pixel_ranges).reshape(-1, 2).tolist())
+
+        scaling: utils.ImageScaling = utils.image__read_scaling(self.header_whole) if scale else None
+        pixel_length: int = int(np.prod(shape)) * self.data_itemsize
+        telemetry = metrics.FetchTelemetry('reduce', self.url, len(ranges), len(offsets) * pixel_length)
+        total: np.ndarray = np.zeros(shape, dtype=np.float64)
+        norm: np.ndarray = np.zeros(shape, dtype=np.float64)
+        payload: bytearray = bytearray()
+        position: int = 0
+        with profiling.phase('fetch'):
+            for content in shortcuts.stream_byte_ranges(self.url, ranges, telemetry=telemetry, seek_index=self._seek_index):
+                payload.extend(content)
+                count: int = len(payload) // pixel_length
+                if count == 0:
+                    continue
+
+                with profiling.phase('decode'):
+                    values: np.ndarray = np.frombuffer(payload[:count * pixel_length], dtype=self.dtype).reshape((count, ) + shape)
+                    values = utils.image__apply_scaling(values, scaling).astype(np.float64)
+                    block_weights: np.ndarray = pixel_weights[position:position + count]
+                    if op.startswith('nan'):
+                        valid: np.ndarray = ~np.isnan(values)
+                        total += np.tensordot(block_weights, np.where(valid, values, 0), axes=1)
+                        norm += np.tensordot(block_weights, valid, axes=1)
+
+                    else:
+                        total += np.tensordot(block_weights, values, axes=1)
+
+                    del payload[:count * pixel_length]
+                    position = position + count
+
+        if position != len(offsets) or len(payload) > 0:
+            raise NotImplementedError(f'Ranges[{position} pixels] do not fill Aperture[{len(offsets)} pixels]')
+
+        telemetry.finish()
+        if op == 'mean':
+            return total / pixel_weights.sum()
+
+        elif op == 'nanmean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return total / norm
+
+        return total
+
+    def preview(self: PWN,
+        size: typing.Union[int, typing.Tuple[int, int]],
+        nViews: typing.Union[typing.Tuple, slice, typing.Tuple[slice]] = None) -> Preview:
+        # The coarsest preview level with at least size pixels, (rows, columns) or both, across the view. nViews is in
+        # full resolution pixels. Without a fine enough level the view is cut out at full resolution, factor 1
+        if self.type != ExtensionType.Image:
+            raise NotImplementedError(f'Fits Datatype[{self.type}] Not supported yet')
+
+        if len(self.data_shape or []) != 2:
+            raise NotImplementedError(f'Previews of Shape[{self.data_shape}] Not supported yet')
+
+        rows, columns = (size, size) if isinstance(size, int) else size
+        nViews = [slice(None), slice(None)] if nViews is None else self._as_nViews(nViews)
+        utils.image__validate_python_inputs(nViews, self.data_shape)
+        row_view, column_view = utils.convert_nViews_to_slices(nViews, self.data_shape)
+        preview_index: typing.Dict[str, typing.Any] = self._header.get('preview', None)
+        if not preview_index is None and not self._context.previews_path is None:
+            for level in reversed(preview_index['levels']):
+                factor: int = level['factor']
+                if (row_view.stop - row_view.start) // factor < rows or (column_view.stop - column_view.start) // factor < columns:
+                    continue
+
+                # Whole rows of the level are one range, the columns are sliced out afterwards
+                row_start, row_stop = row_view.start // factor, min(-(-row_view.stop // factor), level['shape'][0])
+                row_length: int = level['shape'][1] * 4
+                start: int = level['offset'] + row_start * row_length
+                url: str = self._build_url(self._context.previews_path, preview_index['path'])
+                telemetry = metrics.FetchTelemetry('preview', url, 1, (row_stop - row_start) * row_length)
+                with profiling.phase('fetch'):
+                    payload: bytes = shortcuts.load_byte_ranges(url, [(start, start + (row_stop - row_start) * row_length)], telemetry)[0]
+
+                telemetry.finish()
+                data_arr: np.ndarray = np.frombuffer(payload, dtype='>f4').reshape(row_stop - row_start, level['shape'][1])
+                column_stop: int = min(-(-column_view.stop // factor), level['shape'][1])
+                return Preview(data_arr[:, column_view.start // factor:column_stop].astype(np.float32), factor)
+
+        return Preview(self.cutout((row_view, column_view), native_byteorder=True)[1].data, 1)
+
+    def time_frames(self: PWN, t0: float, t1: float) -> slice:
+        # Frames overlapping [t0, t1), binary searched in the per cadence TSTART/TSTOP the indexer stored
+        if self._times is None:
+            time_axis: typing.Dict[str, typing.Any] = self._header.get('time', None)
+            if time_axis is None:
+                raise NotImplementedError(f'CloudPath[{self._cloudpath}] has no time axis indexed')
+
+            # Gaps in the timestamps are NaN, the running maximum keeps both arrays sorted
+            self._times = tuple(np.fmax.accumulate(np.nan_to_num(
+                utils.unpack_float_array(time_axis[key]), nan=-np.inf)) for key in ['start', 'stop'])
+
+        starts, stops = self._times
+        return slice(int(np.searchsorted(stops, t0, side='right')), int(np.searchsorted(starts, t1, side='left')))
+
+    def time_slice(self: PWN,
+        t0: float,
+        t1: float,
+        nViews: typing.Union[typing.Tuple, int, slice, typing.Tuple[slice]] = None,
+        native_byteorder: bool = False,
+        scale: bool = True) -> 'fits.HDUList':
+        # nViews selects the other axes, its time axis view is replaced by the frames in [t0, t1)
+        frames: slice = self.time_frames(t0, t1)
+        if frames.start >= frames.stop:
+            raise ValueError(f'No frames between Time[{t0}, {t1}] in CloudPath[{self._cloudpath}]')
+
+        # Axes the view leaves out are taken whole, the time axis may be one of them
+        nViews = [] if nViews is None else list(self._as_nViews(nViews))
+        nViews = nViews + [slice(None)] * (len(self.data_shape) - len(nViews))
+        nViews[self._header['time']['axis']] = frames
+        return self.cutout(tuple(nViews), native_byteorder, scale)
 
+    def __getitem__(self: PWN, nViews: typing.Union[typing.Tuple, int, slice, typing.Tuple[slice]]) -> typing.Any:
+        nViews = self._as_nViews(nViews)
         if self.type == ExtensionType.BinTable:
             return self._slice_bintable(nViews)
 
@@ -139,40 +576,43 @@ class FitsCloudIndexHeader:
 
         raise NotImplementedError(f'Fits Datatype[{self.type}] Not supported yet')
 
-    def __getattr__(self: PWN, name: str) -> typing.Any:
-        if name == 'data_itemsize':
-            value: str = self._header['data']['data_type']
-            if value == 'uint8':
-                np_type = np.uint8
-
-            elif value == 'uint16':
-                np_type = np.uint16
-
-            elif value == 'uint32':
-                np_type = np.uint32
+    @property
+    def dtype(self: PWN) -> 'np.dtype':
+        # BITPIX is authoritative, older indices recorded BITPIX 16/32 as unsigned
+        if self._dtype is None:
+            self._dtype = utils.bitpix_to_dtype(utils.read_header_card(self.header_whole, 'BITPIX'))
 
-            elif value == 'float32':
-                np_type = np.float32
+        return self._dtype
 
-            elif value == 'float64':
-                np_type = np.float64
+    @property
+    def data_itemsize(self: PWN) -> int:
+        return self.dtype.itemsize
 
-            else:
-                raise NotImplementedError(f'Unable to convert value to Python DataType: {value}')
+    @property
+    def index(self: PWN) -> typing.Dict[str, typing.Any]:
+        # The index entry the header was loaded from
+        return dict(self._header, **{
+            'header': {name: getattr(self, f'header_{name}') for name in HEADER_FIELDS},
+            'data': {name: getattr(self, f'data_{name}') for name in DATA_FIELDS},
+        })
 
-            return np.zeros(0, dtype=np_type).itemsize
+    def _build_url(self: PWN, bucket_path: str, path: str) -> str:
+        if bucket_path.startswith('s3://'):
+            cloud_data_path = bucket_path.split('s3://', 1)[1].strip('/')
+            return utils.build_s3_url(self._context.region, f'{cloud_data_path}/{path}')
 
-        elif name.startswith('data_'):
-            return self._header['data'][name[5:]]
+        elif bucket_path.startswith('file://'):
+            return os.path.join(bucket_path.split('file://', 1)[1], path)
 
-        elif name.startswith('header_'):
-            return self._header['header'][name[7:]]
+        raise NotImplementedError(f'DataBucketPath[{bucket_path}] Not supported yet')
 
-        return super(FitsCloudIndexHeader, self).__getattr__(name)
+    @property
+    def url(self: PWN) -> str:
+        return self._build_url(self._context.data_bucket_path, self._cloudpath)
 
     @property
-    def fits(self: PWN) -> fits.Header:
-        return fits.Header.fromstring(self._header['header']['whole'])
+    def fits(self: PWN) -> 'fits.Header':
+        return fits.Header.fromstring(self.header_whole)
 
     def __repr__(self: PWN) -> str:
         return f'FitsCloudIndexHeader: {self.type.name}'
@@ -183,13 +623,19 @@ class FitsCloudIndex:
             os.environ.get('AWS_DEFAULT_REGION', configuration['aws-default-region']),
             configuration['version'],
             configuration['index-bucket-name'],
-            configuration['data-bucket-path'])
+            configuration['data-bucket-path'],
+            configuration.get('index-etag', None),
+            configuration.get('previews-path', None))
         self._index = configuration['indicies'][0]
         self._primary_header = self._index['headers'][0]
+        # Only this file's HDUs, a catalog configuration carries the footprints of every file
+        self._footprints = footprint.build_footprint_index([self._index])
+        self._keywords: typing.Optional[keyword_table.KeywordTable] = None
 
         logger.info(f'Loading FitsCloudIndex Version[{self._context.version}]')
         for idx, header in enumerate(self._index['headers']):
-            self._index['headers'][idx] = FitsCloudIndexHeader(header, self._primary_header, self._index['cloudpath'], self._context)
+            self._index['headers'][idx] = FitsCloudIndexHeader(
+                header, self._primary_header, self._index['cloudpath'], self._context, idx, self._index.get('gzip', None))
 
     @property
     def index(self: PWN) -> typing.Any:
@@ -199,28 +645,163 @@ class FitsCloudIndex:
     def headers(self: PWN) -> typing.List[FitsCloudIndexHeader]:
         return self._index['headers']
 
+    def fetch(self: PWN,
+        views: typing.Dict[int, typing.Union[typing.Tuple, int, slice, typing.Tuple[slice]]],
+        native_byteorder: bool = False,
+        scale: bool = True,
+        workers: int = None) -> typing.Dict[int, typing.Any]:
+        # {hdu: view}, e.g. {1: (slice(0, 10), slice(0, 10), slice(None), 0), 2: slice(0, 1282)}. Every HDU is planned
+        # first, then all ranges are fetched together and each HDU is assembled like its __getitem__ result
+        plans: typing.Dict[int, typing.Tuple] = {}
+        with profiling.phase('plan'):
+            for hdu, nViews in views.items():
+                header: FitsCloudIndexHeader = self.headers[hdu]
+                plans[hdu] = header._plan_fetch(header._as_nViews(nViews), native_byteorder, scale)
+
+        # Cached and out of core cutouts have nothing to fetch here
+        reads: typing.List[int] = [hdu for hdu, (ranges, telemetry, assemble) in plans.items() if ranges]
+        payloads: typing.Dict[int, typing.List[bytes]] = dict(zip(reads, shortcuts.fetch_reads([
+            (self.headers[hdu].url, plans[hdu][0], plans[hdu][1], self.headers[hdu].seek_index) for hdu in reads], workers)))
+        return {hdu: assemble(payloads.get(hdu, [])) for hdu, (ranges, telemetry, assemble) in plans.items()}
+
+    def query(self: PWN, ra: float, dec: float, radius: float = 0) -> typing.List[footprint.FootprintMatch]:
+        # Files and pixel boxes whose footprint is within radius degrees of ra, dec. Boxes are padded, not exact
+        return footprint.query_footprint_index(self._footprints, ra, dec, radius)
+
+    @property
+    def keywords(self: PWN) -> keyword_table.KeywordTable:
+        # Every keyword of this file's headers, parsed on first use
+        if self._keywords is None:
+            self._keywords = keyword_table.KeywordTable(keyword_table.build_keyword_table([self._index]))
+
+        return self._keywords
+
+class FitsCloudCatalog:
+    def __init__(self: PWN,
+        configuration: typing.Dict[str, typing.Any],
+        shard_loader: typing.Callable[[str], typing.Optional[typing.Dict[str, typing.Any]]],
+        document_loader: typing.Callable[[str], typing.Optional[typing.Dict[str, typing.Any]]] = None) -> None:
+        # document_loader loads other documents next to the root index by key, e.g. the footprints of a sharded index
+        self._configuration = configuration
+        self._shard_loader = shard_loader
+        self._document_loader = document_loader
+        self._shard_depth = configuration.get('shard-depth', 0)
+        self._shards: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+        self._indices: typing.Dict[str, FitsCloudIndex] = {}
+        if not 'shard-depth' in configuration:
+            self._shards[''] = {index['cloudpath']: index for index in configuration.get('indicies', [])}
+
+        # The footprint index is in the root document, or in its own document for sharded indices. Spatial queries
+        # don't load any shards
+        self._footprints: typing.Optional[typing.Dict[str, typing.Any]] = configuration.get('footprints', None)
+        self._keywords: typing.Any = configuration.get('keywords', None)
+
+    def _load_shard(self: PWN, shard_key: str) -> typing.Dict[str, typing.Any]:
+        if not shard_key in self._shards:
+            logger.info(f'Loading FitsCloudCatalog Shard[{shard_key}]')
+            shard: typing.Dict[str, typing.Any] = self._shard_loader(shard_key) or {}
+            self._shards[shard_key] = {index['cloudpath']: index for index in shard.get('indicies', [])}
+
+        return self._shards[shard_key]
+
+    def __contains__(self: PWN, cloudpath: str) -> bool:
+        return cloudpath in self._load_shard(utils.build_shard_key(cloudpath, self._shard_depth))
+
+    def __getitem__(self: PWN, cloudpath: str) -> FitsCloudIndex:
+        if not cloudpath in self._indices:
+            shard: typing.Dict[str, typing.Any] = self._load_shard(utils.build_shard_key(cloudpath, self._shard_depth))
+            if not cloudpath in shard:
+                raise exceptions.IndexException(f'CloudPath[{cloudpath}] not found in FitsCloudCatalog')
+
+            configuration: typing.Dict[str, typing.Any] = dict(self._configuration)
+            configuration.pop('footprints', None)
+            configuration.pop('keywords', None)
+            configuration['indicies'] = [shard[cloudpath]]
+            self._indices[cloudpath] = FitsCloudIndex(configuration)
+
+        return self._indices[cloudpath]
+
+    def _load_document(self: PWN, name: str) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        key: str = self._configuration.get(name, None)
+        if key is None or self._document_loader is None:
+            return None
+
+        logger.info(f'Loading FitsCloudCatalog Document[{key}]')
+        return self._document_loader(key)
+
+    def query(self: PWN, ra: float, dec: float, radius: float = 0) -> typing.List[footprint.FootprintMatch]:
+        if self._footprints is None:
+            self._footprints = self._load_document('footprints-key') or footprint.build_footprint_index(
+                self._configuration.get('indicies', []))
+
+        return footprint.query_footprint_index(self._footprints, ra, dec, radius)
+
+    @property
+    def keywords(self: PWN) -> keyword_table.KeywordTable:
+        # Like the footprints, the keyword table is in the root document or its own document for sharded indices.
+        # Indices without one are only covered for the shards loaded so far
+        if not isinstance(self._keywords, keyword_table.KeywordTable):
+            self._keywords = self._keywords or self._load_document('keywords-key') or keyword_table.build_keyword_table(
+                [index for shard in self._shards.values() for index in shard.values()], keyword_table.KEYWORDS)
+            self._keywords = keyword_table.KeywordTable(self._keywords)
+
+        return self._keywords
 
 class FitsFileIndex:
-    def __init__(self: PWN, cloudpath: str, filename: str, index_name: str, headers: typing.List[str] = []) -> None:
+    def __init__(self: PWN,
+        cloudpath: str,
+        filename: str,
+        index_name: str,
+        headers: typing.List[str] = [],
+        seek_index: typing.Dict[str, typing.Any] = None) -> None:
         self._cloudpath = cloudpath
         self._filename = filename
         self._index_name = index_name
         self._headers = headers
+        self._seek_index = seek_index
+
+    @classmethod
+    def from_index(cls: PWN, index: typing.Dict[str, typing.Any]) -> PWN:
+        headers: typing.List[FitsFileHeader] = [FitsFileHeader(
+            header['header']['offset'],
+            header['header']['length'],
+            header['header']['stop'],
+            header['data']['offset'],
+            header['data']['length'],
+            header['data']['stop'],
+            header['header']['whole'],
+            header.get('time', None),
+            header.get('zones', None),
+            header.get('preview', None),
+            header.get('footprint', None)) for header in index['headers']]
+        return cls(index['cloudpath'], index['filename'], index['index_name'], headers, index.get('gzip', None))
+
+    @property
+    def cloudpath(self: PWN) -> str:
+        return self._cloudpath
 
     @property
     def index(self: PWN) -> typing.Dict[str, typing.Any]:
-        return {
+        index: typing.Dict[str, typing.Any] = {
             'cloudpath': self._cloudpath,
             'filename': self._filename,
             'index_name': self._index_name,
             'headers': [header.index for header in self._headers],
         }
+        if not self._seek_index is None:
+            index['gzip'] = self._seek_index
+
+        return index
 
 class FitsFileHeader:
     def __init__(self: PWN,
         offset: int, length: int, stop: int,
         data_offset: int, data_length: int, data_stop: int,
-        header: bytes) -> None:
+        header: bytes,
+        time_axis: typing.Dict[str, typing.Any] = None,
+        zone_map: typing.Dict[str, typing.Any] = None,
+        preview: typing.Dict[str, typing.Any] = None,
+        sky_footprint: typing.Dict[str, typing.Any] = None) -> None:
         self._offset = offset
         self._length = length
         self._stop = stop
@@ -228,10 +809,16 @@ class FitsFileHeader:
         self._data_length = data_length
         self._data_stop = data_stop
         self._header = header
+        self.time_axis = time_axis
+        self.zone_map = zone_map
+        self.preview = preview
+        # Solving the WCS is the slowest part of .index, it runs once. Headers carried over from an index reuse its footprint
+        self._footprint = sky_footprint
+        self._footprint_resolved: bool = not sky_footprint is None
 
     @property
     def index(self: PWN) -> typing.Dict[str, typing.Any]:
-        return {
+        index: typing.Dict[str, typing.Any] = {
             'header': {
                 'offset': self._offset,
                 'length': self._length,
@@ -249,13 +836,38 @@ class FitsFileHeader:
                 'size': self.datum_size,
             }
         }
+        sky_footprint: typing.Optional[typing.Dict[str, typing.Any]] = self.footprint
+        if not sky_footprint is None:
+            index['footprint'] = sky_footprint
+
+        if not self.time_axis is None:
+            index['time'] = self.time_axis
+
+        if not self.zone_map is None:
+            index['zones'] = self.zone_map
+
+        if not self.preview is None:
+            index['preview'] = self.preview
+
+        return index
 
     @property
-    def as_fits(self: PWN) -> fits.Header:
+    def footprint(self: PWN) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        if not self._footprint_resolved:
+            header: fits.Header = self.as_fits
+            if header.get('XTENSION', 'IMAGE').strip().lower() == 'image':
+                self._footprint = footprint.build_footprint(header, self.datum_shape)
+
+            self._footprint_resolved = True
+
+        return self._footprint
+
+    @property
+    def as_fits(self: PWN) -> 'fits.Header':
         return fits.Header.fromstring(self._header)
 
     @property
-    def datum_shape(self: PWN) -> fits.Header:
+    def datum_shape(self: PWN) -> 'fits.Header':
         header: fits.Header = fits.Header.fromstring(self._header)
 
         # Image Data
@@ -276,23 +888,7 @@ class FitsFileHeader:
     @property
     def datum_data_type(self: PWN) -> typing.List[str]:
         header: fits.Header = fits.Header.fromstring(self._header)
-        if header['BITPIX'] == 8:
-            return np.uint8
-
-        elif header['BITPIX'] == 16:
-            return np.uint16
-
-        elif header['BITPIX'] == 32:
-            return np.uint32
-
-        elif header['BITPIX'] == -32:
-            return np.float32
-
-        elif header['BITPIX'] == -64:
-            return np.float64
-
-        else:
-            raise ValueError(f'BITPIX={header["BITPIX"]} not supported')
+        return utils.bitpix_to_dtype(header['BITPIX']).newbyteorder('=').type
 
     @property
     def datum_size(self: PWN) -> int:
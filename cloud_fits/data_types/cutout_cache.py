@@ -0,0 +1,67 @@
+import collections
+import logging
+import threading
+import typing
+
+# An opt-in, size bounded LRU of cutout results. Cached arrays are read-only so every caller can share them,
+# keys include the ETag of the index document so a re-indexed archive never serves stale cutouts
+CUTOUT_CACHE_SIZE: int = 256 * 1024 * 1024
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+logger = logging.getLogger(__name__)
+
+CachedCutout = collections.namedtuple('CachedCutout', ['header', 'data'])
+
+class CutoutCache:
+    def __init__(self: PWN, max_bytes: int = None) -> None:
+        self.max_bytes = CUTOUT_CACHE_SIZE if max_bytes is None else max_bytes
+        self.size = 0
+        self.statistics: typing.Dict[str, int] = collections.Counter()
+        self._cutouts: typing.Dict[typing.Tuple, CachedCutout] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self: PWN) -> int:
+        return len(self._cutouts)
+
+    def get(self: PWN, key: typing.Tuple) -> typing.Optional[CachedCutout]:
+        with self._lock:
+            cutout: CachedCutout = self._cutouts.get(key, None)
+            if cutout is None:
+                self.statistics['misses'] += 1
+                return None
+
+            self._cutouts.move_to_end(key)
+            self.statistics['hits'] += 1
+            return cutout
+
+    def put(self: PWN, key: typing.Tuple, header: 'fits.Header', data: 'np.ndarray') -> None:
+        if data.nbytes > self.max_bytes:
+            return None
+
+        data.flags.writeable = False
+
+        with self._lock:
+            if key in self._cutouts:
+                self.size = self.size - self._cutouts.pop(key).data.nbytes
+
+            self._cutouts[key] = CachedCutout(header, data)
+            self.size = self.size + data.nbytes
+            while self.size > self.max_bytes:
+                evicted_key, evicted_cutout = self._cutouts.popitem(last=False)
+                self.size = self.size - evicted_cutout.data.nbytes
+                self.statistics['evictions'] += 1
+
+    def clear(self: PWN) -> None:
+        with self._lock:
+            self._cutouts.clear()
+            self.size = 0
+
+CUTOUT_CACHE: typing.Optional[CutoutCache] = None
+
+def enable(max_bytes: int = None) -> CutoutCache:
+    global CUTOUT_CACHE
+    CUTOUT_CACHE = CutoutCache(max_bytes)
+    return CUTOUT_CACHE
+
+def disable() -> None:
+    global CUTOUT_CACHE
+    CUTOUT_CACHE = None
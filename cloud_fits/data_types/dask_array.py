@@ -0,0 +1,64 @@
+import itertools
+import logging
+import typing
+
+from cloud_fits.data_types import utils, shortcuts
+from cloud_fits.lazy_import import lazy_import
+
+np = lazy_import('numpy')
+
+# Chunks default to roughly what a single task can fetch in one go
+CHUNK_BYTES: int = 64 * 1024 * 1024
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+logger = logging.getLogger(__name__)
+
+def _load_block(
+    url: str,
+    nViews: typing.List[slice],
+    strides: typing.Tuple[int],
+    offset: int,
+    dtype: 'np.dtype',
+    scaling: utils.ImageScaling,
+    seek_index: typing.Dict[str, typing.Any] = None) -> 'np.ndarray':
+    ranges = utils.coalesce_ranges(utils.image__generate_ranges(nViews, strides, offset, 0))
+    datas: typing.List[bytes] = shortcuts.load_byte_ranges(url, ranges, None, seek_index)
+    # bytearray keeps the block writable so scaling can happen in place
+    block: np.ndarray = np.frombuffer(bytearray().join(datas), dtype=dtype).reshape(utils.calculate_shape_from_nViews(nViews))
+    return utils.image__apply_scaling(block, scaling)
+
+def from_index_header(header: 'FitsCloudIndexHeader', chunks: typing.Union[str, typing.Tuple[int]] = 'auto') -> typing.Any:
+    try:
+        import dask.array as da
+        from dask.base import tokenize
+    except ImportError:
+        raise NotImplementedError('dask is required for FitsCloudIndexHeader.to_dask, pip install cloud-fits[dask]')
+
+    shape: typing.Tuple[int] = tuple(header.data_shape)
+    strides: typing.Tuple[int] = tuple(header.data_strides)
+    dtype: np.dtype = header.dtype
+    scaling: utils.ImageScaling = utils.image__read_scaling(header.header_whole)
+    if scaling.bscale == 1 and scaling.bzero == 0:
+        scaling = None
+
+    if len(shape) < 2:
+        raise NotImplementedError(f'Image Shape[{shape}] Not supported yet')
+
+    if chunks == 'auto':
+        chunks = utils.image__contiguous_chunks(shape, dtype.itemsize, CHUNK_BYTES)
+
+    chunks = da.core.normalize_chunks(chunks, shape, dtype=dtype)
+    name: str = f'cloud-fits-{tokenize(header.url, header.data_offset, shape, strides, chunks)}'
+    logger.info(f'Building Dask Array[{name}] Shape[{shape}] Chunks[{tuple(len(c) for c in chunks)}]')
+
+    axis_starts: typing.List[typing.List[int]] = [
+        [sum(axis_chunks[:idx]) for idx in range(0, len(axis_chunks))] for axis_chunks in chunks]
+    graph: typing.Dict[typing.Tuple, typing.Any] = {}
+    for block_idx in itertools.product(*[range(0, len(axis_chunks)) for axis_chunks in chunks]):
+        nViews: typing.List[slice] = []
+        for axis, idx in enumerate(block_idx):
+            start: int = axis_starts[axis][idx]
+            nViews.append(slice(start, start + chunks[axis][idx], None))
+
+        graph[(name,) + block_idx] = (_load_block, header.url, nViews, strides, header.data_offset, dtype, scaling, header.seek_index)
+
+    return da.Array(graph, name, chunks, dtype=utils.image__apply_scaling(np.empty(0, dtype=dtype), scaling).dtype)
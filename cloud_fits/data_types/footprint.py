@@ -0,0 +1,182 @@
+import collections
+import logging
+import math
+import typing
+import warnings
+
+from cloud_fits.lazy_import import lazy_import
+
+astropy_wcs = lazy_import('astropy.wcs')
+np = lazy_import('numpy')
+
+# The sky is split into declination bands of FOOTPRINT_CELL_SIZE degrees, each band into equal width right ascension
+# cells. Cells keep a similar area towards the poles, like HEALPix, without needing healpy
+FOOTPRINT_CELL_SIZE: float = 1.0
+CELL_ID_BAND: int = 1000000
+logger = logging.getLogger(__name__)
+
+FootprintMatch = collections.namedtuple('FootprintMatch', ['cloudpath', 'hdu', 'nViews', 'separation'])
+
+def angular_separation(ra: float, dec: float, other_ra: float, other_dec: float) -> float:
+    # Haversine, degrees in and out
+    ra, dec, other_ra, other_dec = map(math.radians, [ra, dec, other_ra, other_dec])
+    haversine: float = math.sin((other_dec - dec) / 2) ** 2 + math.cos(dec) * math.cos(other_dec) * math.sin((other_ra - ra) / 2) ** 2
+    return math.degrees(2 * math.asin(min(1, math.sqrt(haversine))))
+
+def project_gnomonic(ra: float, dec: float, center_ra: float, center_dec: float) -> typing.Optional[typing.Tuple[float, float]]:
+    # Tangent plane coordinates in degrees, None for the far hemisphere
+    ra, dec, center_ra, center_dec = map(math.radians, [ra, dec, center_ra, center_dec])
+    cos_c: float = math.sin(center_dec) * math.sin(dec) + math.cos(center_dec) * math.cos(dec) * math.cos(ra - center_ra)
+    if cos_c <= 0:
+        return None
+
+    xi: float = math.cos(dec) * math.sin(ra - center_ra) / cos_c
+    eta: float = (math.cos(center_dec) * math.sin(dec) - math.sin(center_dec) * math.cos(dec) * math.cos(ra - center_ra)) / cos_c
+    return math.degrees(xi), math.degrees(eta)
+
+def sky_cells(ra: float, dec: float, radius: float, cell_size: float = None) -> typing.List[int]:
+    # Every cell touching the disk, conservatively
+    cell_size = cell_size or FOOTPRINT_CELL_SIZE
+    band_count: int = int(math.ceil(180 / cell_size))
+    cells: typing.List[int] = []
+    for band in range(max(int((dec - radius + 90) // cell_size), 0), min(int((dec + radius + 90) // cell_size), band_count - 1) + 1):
+        band_low: float = band * cell_size - 90
+        band_high: float = min(band_low + cell_size, 90)
+        equator_latitude: float = 0 if band_low <= 0 <= band_high else min(abs(band_low), abs(band_high))
+        column_count: int = max(1, int(360 * math.cos(math.radians(equator_latitude)) // cell_size))
+        column_width: float = 360 / column_count
+        pole_latitude: float = min(max(abs(max(band_low, dec - radius)), abs(min(band_high, dec + radius))), 90)
+        if pole_latitude >= 90 or radius >= 90:
+            columns: typing.Iterable[int] = range(0, column_count)
+
+        else:
+            half_width: float = radius / math.cos(math.radians(pole_latitude))
+            if half_width >= 180:
+                columns = range(0, column_count)
+
+            else:
+                columns = sorted(set(
+                    column % column_count for column in range(
+                        int(math.floor((ra - half_width) / column_width)),
+                        int(math.floor((ra + half_width) / column_width)) + 1)))
+
+        cells.extend(band * CELL_ID_BAND + column for column in columns)
+
+    return cells
+
+def build_footprint(header: 'fits.Header', shape: typing.Tuple[int]) -> typing.Optional[typing.Dict[str, typing.Any]]:
+    # The celestial axes are linearised about the image center in the tangent plane, which is exact for TAN
+    # projections and close enough to find candidates for everything else
+    if shape is None or len(shape) < 2:
+        return None
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        try:
+            wcs = astropy_wcs.WCS(header)
+        except Exception as err:
+            logger.warning(f'Unable to read WCS: {err}')
+            return None
+
+        if not wcs.has_celestial:
+            return None
+
+        # lng, lat are 0 based FITS axes, numpy axes run the other way
+        axes: typing.List[int] = [len(shape) - 1 - wcs.wcs.lng, len(shape) - 1 - wcs.wcs.lat]
+        celestial = wcs.sub([astropy_wcs.WCSSUB_LONGITUDE, astropy_wcs.WCSSUB_LATITUDE])
+        width, height = shape[axes[0]], shape[axes[1]]
+        pixels = np.array([
+            [(width - 1) / 2, (height - 1) / 2],
+            [0, 0], [width - 1, 0], [0, height - 1], [width - 1, height - 1],
+            [(width - 1) / 2, 0], [(width - 1) / 2, height - 1], [0, (height - 1) / 2], [width - 1, (height - 1) / 2]])
+        worlds = celestial.wcs_pix2world(pixels, 0)
+
+    if not np.all(np.isfinite(worlds)):
+        return None
+
+    center_ra, center_dec = float(worlds[0][0]) % 360, float(worlds[0][1])
+    planes: typing.List[typing.Tuple[float, float]] = [project_gnomonic(ra, dec, center_ra, center_dec) for ra, dec in worlds[1:]]
+    if None in planes:
+        return None
+
+    # Least squares fit of tangent plane degrees to pixel offsets
+    matrix, residuals, rank, singular_values = np.linalg.lstsq(np.array(planes), pixels[1:] - pixels[0], rcond=None)
+    if rank < 2:
+        return None
+
+    return {
+        'ra': center_ra,
+        'dec': center_dec,
+        'radius': max(angular_separation(center_ra, center_dec, ra, dec) for ra, dec in worlds[1:]),
+        'center': [float(value) for value in pixels[0]],
+        'matrix': [[float(value) for value in row] for row in matrix.T],
+        'axes': axes,
+        'shape': list(shape),
+    }
+
+def build_footprint_index(
+    indices: typing.List[typing.Dict[str, typing.Any]],
+    cell_size: float = None) -> typing.Dict[str, typing.Any]:
+    # An inverted index from sky cell to the HDUs whose footprint touches it
+    entries: typing.List[typing.List[typing.Any]] = []
+    for index in indices:
+        for hdu, header in enumerate(index['headers']):
+            footprint: typing.Dict[str, typing.Any] = header.get('footprint', None)
+            if not footprint is None:
+                entries.append([index['cloudpath'], hdu, footprint])
+
+    # Cells grow with the footprints, so a wide field image only lands in a handful of cells
+    if cell_size is None and entries:
+        cell_size = max(FOOTPRINT_CELL_SIZE, float(np.median([footprint['radius'] for cloudpath, hdu, footprint in entries])))
+
+    cell_size = cell_size or FOOTPRINT_CELL_SIZE
+    cells: typing.Dict[int, typing.List[int]] = collections.defaultdict(list)
+    for entry_id, (cloudpath, hdu, footprint) in enumerate(entries):
+        for cell in sky_cells(footprint['ra'], footprint['dec'], footprint['radius'], cell_size):
+            cells[cell].append(entry_id)
+
+    return {
+        'cell-size': cell_size,
+        'entries': entries,
+        'cells': dict(cells),
+    }
+
+def find_pixel_box(footprint: typing.Dict[str, typing.Any], ra: float, dec: float, radius: float) -> typing.Optional[typing.Tuple[slice]]:
+    plane: typing.Optional[typing.Tuple[float, float]] = project_gnomonic(ra, dec, footprint['ra'], footprint['dec'])
+    if plane is None:
+        return None
+
+    (a, b), (c, d) = footprint['matrix']
+    x: float = footprint['center'][0] + a * plane[0] + b * plane[1]
+    y: float = footprint['center'][1] + c * plane[0] + d * plane[1]
+    # The Frobenius norm bounds the pixels per degree in any direction
+    pixel_radius: float = radius * math.sqrt(a * a + b * b + c * c + d * d)
+    nViews: typing.List[slice] = [slice(0, size) for size in footprint['shape']]
+    for axis, position in zip(footprint['axes'], [x, y]):
+        start: int = max(int(math.floor(position - pixel_radius + .5)), 0)
+        stop: int = min(int(math.floor(position + pixel_radius + .5)) + 1, footprint['shape'][axis])
+        if start >= stop:
+            return None
+
+        nViews[axis] = slice(start, stop)
+
+    return tuple(nViews)
+
+def query_footprint_index(footprint_index: typing.Dict[str, typing.Any], ra: float, dec: float, radius: float = 0) -> typing.List[FootprintMatch]:
+    ra = ra % 360
+    entry_ids: typing.Set[int] = set()
+    for cell in sky_cells(ra, dec, radius, footprint_index['cell-size']):
+        entry_ids.update(footprint_index['cells'].get(cell, []))
+
+    matches: typing.List[FootprintMatch] = []
+    for entry_id in entry_ids:
+        cloudpath, hdu, footprint = footprint_index['entries'][entry_id]
+        separation: float = angular_separation(ra, dec, footprint['ra'], footprint['dec'])
+        if separation > footprint['radius'] + radius:
+            continue
+
+        nViews: typing.Optional[typing.Tuple[slice]] = find_pixel_box(footprint, ra, dec, radius)
+        if not nViews is None:
+            matches.append(FootprintMatch(cloudpath, hdu, nViews, separation))
+
+    return sorted(matches, key=lambda match: match.separation)
@@ -0,0 +1,249 @@
+import base64
+import bisect
+import collections
+import ctypes
+import ctypes.util
+import logging
+import typing
+import zlib
+
+# Random access into .fits.gz, zran style. The indexer inflates the file once and records a seek point every SPAN
+# uncompressed bytes at a deflate block boundary: the compressed offset, the bits of the previous byte that belong to
+# the next block, the uncompressed offset and the 32KiB window of output before it. A read primes a raw inflate from
+# the nearest seek point and only fetches the compressed span up to the next seek point past the read.
+# The stdlib zlib module exposes neither Z_BLOCK nor inflatePrime, so libz is called through ctypes
+SPAN: int = 4 * 1024 * 1024
+WINDOW_SIZE: int = 32 * 1024
+INPUT_CHUNK_SIZE: int = 1024 * 1024
+OUTPUT_CHUNK_SIZE: int = 1024 * 1024
+GZIP_TRAILER_SIZE: int = 8
+GZIP_MAGIC: bytes = b'\x1f\x8b'
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+logger = logging.getLogger(__name__)
+
+Z_OK: int = 0
+Z_STREAM_END: int = 1
+Z_BUF_ERROR: int = -5
+Z_NO_FLUSH: int = 0
+Z_BLOCK: int = 5
+# windowBits, 15 + 16 parses a gzip header and trailer, -15 is a raw deflate stream
+GZIP_WINDOW_BITS: int = 31
+RAW_WINDOW_BITS: int = -15
+
+# One inflate from a seek point. start and stop are uncompressed, ranges are indices into the planned ranges
+GzipRead = collections.namedtuple('GzipRead', ['point', 'compressed_start', 'compressed_stop', 'start', 'stop', 'ranges'])
+
+class _ZStream(ctypes.Structure):
+    _fields_ = [
+        ('next_in', ctypes.c_void_p),
+        ('avail_in', ctypes.c_uint),
+        ('total_in', ctypes.c_ulong),
+        ('next_out', ctypes.c_void_p),
+        ('avail_out', ctypes.c_uint),
+        ('total_out', ctypes.c_ulong),
+        ('msg', ctypes.c_char_p),
+        ('state', ctypes.c_void_p),
+        ('zalloc', ctypes.c_void_p),
+        ('zfree', ctypes.c_void_p),
+        ('opaque', ctypes.c_void_p),
+        ('data_type', ctypes.c_int),
+        ('adler', ctypes.c_ulong),
+        ('reserved', ctypes.c_ulong),
+    ]
+
+_LIBZ: typing.Optional[ctypes.CDLL] = None
+
+def _load_libz() -> ctypes.CDLL:
+    global _LIBZ
+    if _LIBZ is None:
+        library: typing.Optional[str] = ctypes.util.find_library('z')
+        if library is None:
+            raise NotImplementedError(f'Gzip seek points without libz Not supported yet')
+
+        libz: ctypes.CDLL = ctypes.CDLL(library)
+        libz.zlibVersion.restype = ctypes.c_char_p
+        libz.inflateInit2_.argtypes = [ctypes.POINTER(_ZStream), ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+        libz.inflate.argtypes = [ctypes.POINTER(_ZStream), ctypes.c_int]
+        libz.inflateEnd.argtypes = [ctypes.POINTER(_ZStream)]
+        libz.inflateReset2.argtypes = [ctypes.POINTER(_ZStream), ctypes.c_int]
+        libz.inflatePrime.argtypes = [ctypes.POINTER(_ZStream), ctypes.c_int, ctypes.c_int]
+        libz.inflateSetDictionary.argtypes = [ctypes.POINTER(_ZStream), ctypes.c_char_p, ctypes.c_uint]
+        _LIBZ = libz
+
+    return _LIBZ
+
+class _Inflater:
+    def __init__(self: PWN, window_bits: int) -> None:
+        self._libz = _load_libz()
+        self._stream = _ZStream()
+        self._input: ctypes.Array = None
+        self._output = ctypes.create_string_buffer(OUTPUT_CHUNK_SIZE)
+        if self._libz.inflateInit2_(ctypes.byref(self._stream), window_bits,
+                self._libz.zlibVersion(), ctypes.sizeof(_ZStream)) != Z_OK:
+            raise NotImplementedError(f'Unable to initialise inflate')
+
+    @property
+    def avail_in(self: PWN) -> int:
+        return self._stream.avail_in
+
+    @property
+    def data_type(self: PWN) -> int:
+        return self._stream.data_type
+
+    def feed(self: PWN, data: bytes) -> None:
+        # Replaces the input, callers feed once the previous input is consumed
+        self._input = ctypes.create_string_buffer(data, len(data))
+        self._stream.next_in = ctypes.addressof(self._input)
+        self._stream.avail_in = len(data)
+
+    def unconsumed(self: PWN) -> bytes:
+        if self._stream.avail_in == 0:
+            return b''
+
+        return ctypes.string_at(self._stream.next_in, self._stream.avail_in)
+
+    def prime(self: PWN, bits: int, value: int) -> None:
+        self._libz.inflatePrime(ctypes.byref(self._stream), bits, value)
+
+    def set_window(self: PWN, window: bytes) -> None:
+        if len(window) > 0 and self._libz.inflateSetDictionary(ctypes.byref(self._stream), window, len(window)) != Z_OK:
+            raise NotImplementedError(f'Unable to set the inflate window')
+
+    def reset(self: PWN, window_bits: int) -> None:
+        self._libz.inflateReset2(ctypes.byref(self._stream), window_bits)
+
+    def inflate(self: PWN, flush: int = Z_NO_FLUSH, limit: int = OUTPUT_CHUNK_SIZE) -> typing.Tuple[int, bytes]:
+        self._stream.next_out = ctypes.addressof(self._output)
+        self._stream.avail_out = min(limit, OUTPUT_CHUNK_SIZE)
+        available: int = self._stream.avail_out
+        status: int = self._libz.inflate(ctypes.byref(self._stream), flush)
+        if status < 0 and status != Z_BUF_ERROR:
+            raise NotImplementedError(f'Inflate failed with Status[{status}] Message[{self._stream.msg}]')
+
+        return status, self._output.raw[:available - self._stream.avail_out]
+
+    def close(self: PWN) -> None:
+        self._libz.inflateEnd(ctypes.byref(self._stream))
+
+def _encode_window(window: bytes) -> str:
+    return base64.b64encode(zlib.compress(window)).decode('ascii')
+
+def _decode_window(window: str) -> bytes:
+    return zlib.decompress(base64.b64decode(window.encode('ascii')))
+
+def build_seek_index(gzip_filepath: str, stream: typing.BinaryIO, span: int = None) -> typing.Dict[str, typing.Any]:
+    # Inflates gzip_filepath into stream. Concatenated gzip members are inflated one after another
+    span = span or SPAN
+    points: typing.List[typing.List[typing.Any]] = []
+    window: bytearray = bytearray()
+    compressed: int = 0
+    uncompressed: int = 0
+    last: int = None
+    inflater: _Inflater = _Inflater(GZIP_WINDOW_BITS)
+    try:
+        with open(gzip_filepath, 'rb') as gzip_stream:
+            while True:
+                if inflater.avail_in == 0:
+                    chunk: bytes = gzip_stream.read(INPUT_CHUNK_SIZE)
+                    if not chunk:
+                        raise NotImplementedError(f'Truncated gzip File[{gzip_filepath}]')
+
+                    inflater.feed(chunk)
+
+                available: int = inflater.avail_in
+                status, content = inflater.inflate(Z_BLOCK)
+                compressed = compressed + available - inflater.avail_in
+                uncompressed = uncompressed + len(content)
+                stream.write(content)
+                window.extend(content)
+                del window[:-WINDOW_SIZE]
+                if status == Z_STREAM_END:
+                    # Another member may follow the trailer, anything else is padding
+                    gzip_stream.seek(compressed)
+                    chunk: bytes = gzip_stream.read(INPUT_CHUNK_SIZE)
+                    if not chunk.startswith(GZIP_MAGIC):
+                        break
+
+                    inflater.reset(GZIP_WINDOW_BITS)
+                    inflater.feed(chunk)
+                    continue
+
+                # Bit 7 is set at a block boundary, bit 6 when the next block is the last one
+                if inflater.data_type & 128 and not inflater.data_type & 64 and (last is None or uncompressed - last >= span):
+                    points.append([compressed, inflater.data_type & 7, uncompressed, _encode_window(bytes(window))])
+                    last = uncompressed
+
+    finally:
+        inflater.close()
+
+    return {
+        'span': span,
+        'compressed-length': compressed,
+        'length': uncompressed,
+        'points': points,
+    }
+
+def plan_reads(seek_index: typing.Dict[str, typing.Any], ranges: typing.List[typing.Tuple[int, int]]) -> typing.List[GzipRead]:
+    # Ranges in the order given share an inflate while no seek point lies between one read and the next, so sorted
+    # ranges come back in order. Every read fetches from its seek point to the first seek point at or past its stop
+    offsets: typing.List[int] = [point[2] for point in seek_index['points']]
+    reads: typing.List[GzipRead] = []
+    for idx, (start, stop) in enumerate(ranges):
+        assert 0 <= start <= stop <= seek_index['length']
+        point: int = bisect.bisect_right(offsets, start) - 1
+        # Reads are kept within a span, so one inflate holds at most a span more than its ranges in memory
+        if len(reads) > 0 and reads[-1].start <= start and point <= bisect.bisect_right(offsets, reads[-1].stop) - 1 \
+                and max(reads[-1].stop, stop) - reads[-1].start <= seek_index['span']:
+            previous: GzipRead = reads.pop()
+            point, start, stop = previous.point, previous.start, max(previous.stop, stop)
+            indices: typing.List[int] = previous.ranges + [idx]
+
+        else:
+            indices: typing.List[int] = [idx]
+
+        bound: int = bisect.bisect_left(offsets, stop)
+        compressed_stop: int = seek_index['points'][bound][0] if bound < len(offsets) else seek_index['compressed-length']
+        compressed, bits, uncompressed, window = seek_index['points'][point]
+        reads.append(GzipRead(point, compressed - (1 if bits else 0), compressed_stop, start, stop, indices))
+
+    return reads
+
+def inflate_read(seek_index: typing.Dict[str, typing.Any], read: GzipRead, payload: bytes) -> bytes:
+    # payload is the compressed span of read, returns the uncompressed bytes from read.start to read.stop
+    compressed, bits, uncompressed, window = seek_index['points'][read.point]
+    inflater: _Inflater = _Inflater(RAW_WINDOW_BITS)
+    window_bits: int = RAW_WINDOW_BITS
+    skip: int = read.start - uncompressed
+    remaining: int = read.stop - uncompressed
+    contents: typing.List[bytes] = []
+    try:
+        if bits:
+            inflater.prime(bits, payload[0] >> (8 - bits))
+            payload = payload[1:]
+
+        inflater.set_window(_decode_window(window))
+        inflater.feed(payload)
+        while remaining > 0:
+            status, content = inflater.inflate(Z_NO_FLUSH, remaining)
+            remaining = remaining - len(content)
+            if skip >= len(content):
+                skip = skip - len(content)
+
+            else:
+                contents.append(content[skip:])
+                skip = 0
+
+            if status == Z_STREAM_END and remaining > 0:
+                # The read crosses into the next gzip member, a raw stream stops short of the trailer
+                unconsumed: bytes = inflater.unconsumed()
+                inflater.reset(GZIP_WINDOW_BITS)
+                inflater.feed(unconsumed[GZIP_TRAILER_SIZE if window_bits == RAW_WINDOW_BITS else 0:])
+                window_bits = GZIP_WINDOW_BITS
+
+            elif len(content) == 0 and inflater.avail_in == 0:
+                raise NotImplementedError(f'Compressed Range[{read.compressed_start}-{read.compressed_stop}] ended early')
+
+    finally:
+        inflater.close()
+
+    return b''.join(contents)
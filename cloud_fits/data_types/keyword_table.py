@@ -0,0 +1,155 @@
+import collections
+import logging
+import typing
+import warnings
+
+from cloud_fits.data_types import utils
+from cloud_fits.lazy_import import lazy_import
+
+fits = lazy_import('astropy.io.fits')
+np = lazy_import('numpy')
+
+# Header keywords of every HDU in the index as typed columns, one row per HDU. Columns are sparse, only the rows that
+# carry a keyword are stored. Catalog wide tables only keep KEYWORDS, or the set given to cloud-fits-index --keywords,
+# so the table grows with the files rather than with every keyword they carry
+KEYWORDS: typing.List[str] = [
+    'SIMPLE', 'XTENSION', 'EXTNAME', 'BITPIX', 'NAXIS', 'NAXIS1', 'NAXIS2', 'NAXIS3', 'NAXIS4',
+    'TELESCOP', 'INSTRUME', 'OBJECT', 'FILTER', 'DATE-OBS', 'EXPOSURE', 'EXPTIME', 'TSTART', 'TSTOP',
+    'SECTOR', 'CAMERA', 'CCD', 'TICID', 'RA_OBJ', 'DEC_OBJ',
+]
+EXCLUDED_KEYWORDS: typing.Set[str] = {'', 'COMMENT', 'HISTORY', 'CONTINUE', 'END'}
+COLUMN_DTYPES: typing.Dict[str, str] = {
+    'bool': 'bool',
+    'int': 'int64',
+    'float': 'float64',
+}
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+logger = logging.getLogger(__name__)
+
+KeywordMatch = collections.namedtuple('KeywordMatch', ['cloudpath', 'hdu'])
+
+def _read_header_whole(header: typing.Any) -> bytes:
+    # FitsCloudIndex replaces the header entries with FitsCloudIndexHeader in place
+    if isinstance(header, dict):
+        return header['header']['whole']
+
+    return header.header_whole
+
+def _column_type(values: typing.List[typing.Any]) -> str:
+    if all(isinstance(value, bool) for value in values):
+        return 'bool'
+
+    elif all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+        return 'int'
+
+    elif all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+        return 'float'
+
+    return 'str'
+
+def build_keyword_table(
+    indices: typing.List[typing.Dict[str, typing.Any]],
+    keywords: typing.List[str] = None) -> typing.Dict[str, typing.Any]:
+    # keywords=None keeps every keyword, which is only meant for the headers of a single file
+    included: typing.Optional[typing.Set[str]] = None if keywords is None else set(keywords)
+    cloudpaths: typing.List[str] = []
+    files: typing.List[int] = []
+    hdus: typing.List[int] = []
+    rows: typing.Dict[str, typing.List[int]] = collections.defaultdict(list)
+    values: typing.Dict[str, typing.List[typing.Any]] = collections.defaultdict(list)
+    for index in indices:
+        cloudpaths.append(index['cloudpath'])
+        for hdu, header in enumerate(index['headers']):
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                cards: typing.List[typing.Any] = fits.Header.fromstring(_read_header_whole(header)).cards
+
+            for card in cards:
+                if card.keyword in EXCLUDED_KEYWORDS or isinstance(card.value, fits.card.Undefined):
+                    continue
+
+                if not included is None and not card.keyword in included:
+                    continue
+
+                # Duplicated keywords keep their first value, the same as fits.Header[keyword]
+                if rows[card.keyword] and rows[card.keyword][-1] == len(hdus):
+                    continue
+
+                rows[card.keyword].append(len(hdus))
+                values[card.keyword].append(card.value)
+
+            files.append(len(cloudpaths) - 1)
+            hdus.append(hdu)
+
+    columns: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+    for keyword, column_values in values.items():
+        column_type: str = _column_type(column_values)
+        columns[keyword] = {
+            'type': column_type,
+            'rows': utils.pack_int_array(rows[keyword]),
+        }
+        if column_type == 'float':
+            columns[keyword]['values'] = utils.pack_float_array(column_values)
+
+        elif column_type in ['bool', 'int']:
+            columns[keyword]['values'] = utils.pack_int_array(column_values)
+
+        else:
+            columns[keyword]['values'] = [str(value) for value in column_values]
+
+    return {
+        'cloudpaths': cloudpaths,
+        'files': utils.pack_int_array(files),
+        'hdus': utils.pack_int_array(hdus),
+        'columns': columns,
+    }
+
+class KeywordTable:
+    def __init__(self: PWN, table: typing.Dict[str, typing.Any]) -> None:
+        self._table = table
+        self._files: np.ndarray = utils.unpack_int_array(table['files'])
+        self._hdus: np.ndarray = utils.unpack_int_array(table['hdus'])
+        self._columns: typing.Dict[str, np.ma.MaskedArray] = {}
+
+    def __len__(self: PWN) -> int:
+        return len(self._hdus)
+
+    def __contains__(self: PWN, keyword: str) -> bool:
+        return keyword in self._table['columns']
+
+    @property
+    def keywords(self: PWN) -> typing.List[str]:
+        return sorted(self._table['columns'])
+
+    def __getitem__(self: PWN, keyword: str) -> 'np.ma.MaskedArray':
+        # Rows without the keyword are masked
+        if not keyword in self._columns:
+            column: typing.Dict[str, typing.Any] = self._table['columns'][keyword]
+            if column['type'] == 'float':
+                column_values: np.ndarray = utils.unpack_float_array(column['values'])
+
+            elif column['type'] in COLUMN_DTYPES:
+                column_values = utils.unpack_int_array(column['values']).astype(COLUMN_DTYPES[column['type']])
+
+            else:
+                column_values = np.array(column['values'], dtype=str)
+
+            values: np.ma.MaskedArray = np.ma.masked_all(len(self), dtype=column_values.dtype)
+            values[utils.unpack_int_array(column['rows'])] = column_values
+            self._columns[keyword] = values
+
+        return self._columns[keyword]
+
+    def mask(self: PWN, keyword: str, op: str, value: typing.Any) -> 'np.ndarray':
+        if not keyword in self:
+            return np.zeros(len(self), dtype=bool)
+
+        return np.ma.filled(utils.bintable__evaluate(self[keyword], op, value), False)
+
+    def query(self: PWN, *conditions: typing.Tuple[str, str, typing.Any], **equals: typing.Any) -> typing.List[KeywordMatch]:
+        # query(('EXPOSURE', '>', 1000), CAMERA=1, CCD=3), rows missing a keyword never match
+        mask: np.ndarray = np.ones(len(self), dtype=bool)
+        for keyword, op, value in list(conditions) + [(keyword, '==', value) for keyword, value in equals.items()]:
+            mask &= self.mask(keyword, op, value)
+
+        return [KeywordMatch(self._table['cloudpaths'][self._files[row]], int(self._hdus[row])) for row in np.flatnonzero(mask)]
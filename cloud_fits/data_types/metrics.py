@@ -0,0 +1,178 @@
+import collections
+import logging
+import threading
+import time
+import typing
+
+# Fetch statistics for one cutout or bintable read. The result carries them as `.telemetry` and every hook in HOOKS is
+# called with them once the read finishes. bytes_requested / bytes_useful is the read amplification
+LATENCY_PERCENTILES: typing.List[int] = [50, 90, 99]
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+logger = logging.getLogger(__name__)
+
+class FetchTelemetry:
+    def __init__(self: PWN, operation: str, url: str, ranges_planned: int = 0, bytes_useful: int = 0) -> None:
+        self.operation = operation
+        self.url = url
+        self.ranges_planned = ranges_planned
+        self.bytes_useful = bytes_useful
+        self.requests = 0
+        self.bytes_requested = 0
+        self.bytes_received = 0
+        self.retries = 0
+        self.errors = 0
+        self.cached = False
+        self.status_codes: typing.Dict[int, int] = collections.Counter()
+        self.latencies: typing.List[float] = []
+        self.seconds: float = None
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self: PWN,
+        bytes_requested: int,
+        bytes_received: int,
+        seconds: float,
+        status_code: int = None,
+        retry: bool = False,
+        error: bool = False) -> None:
+        # One attempt at one range. Local reads have no status code, failed connections record error
+        with self._lock:
+            self.requests = self.requests + 1
+            self.bytes_requested = self.bytes_requested + bytes_requested
+            self.bytes_received = self.bytes_received + bytes_received
+            self.retries = self.retries + int(retry)
+            self.errors = self.errors + int(error)
+            self.latencies.append(seconds)
+            if not status_code is None:
+                self.status_codes[status_code] += 1
+
+    def export(self: PWN) -> typing.Dict[str, typing.Any]:
+        # Child processes in shortcuts.remote_cutout send their attempts back over a pipe as JSON
+        return {
+            'requests': self.requests,
+            'bytes-requested': self.bytes_requested,
+            'bytes-received': self.bytes_received,
+            'retries': self.retries,
+            'errors': self.errors,
+            'status-codes': {str(status_code): count for status_code, count in self.status_codes.items()},
+            'latencies': self.latencies,
+        }
+
+    def merge(self: PWN, exported: typing.Dict[str, typing.Any]) -> None:
+        with self._lock:
+            self.requests = self.requests + exported['requests']
+            self.bytes_requested = self.bytes_requested + exported['bytes-requested']
+            self.bytes_received = self.bytes_received + exported['bytes-received']
+            self.retries = self.retries + exported['retries']
+            self.errors = self.errors + exported['errors']
+            self.latencies.extend(exported['latencies'])
+            for status_code, count in exported['status-codes'].items():
+                self.status_codes[int(status_code)] += count
+
+    @property
+    def read_amplification(self: PWN) -> float:
+        if self.bytes_useful == 0:
+            return 0.0 if self.bytes_requested == 0 else float('inf')
+
+        return self.bytes_requested / self.bytes_useful
+
+    def percentile(self: PWN, percent: float) -> typing.Optional[float]:
+        # Nearest rank
+        if not self.latencies:
+            return None
+
+        latencies: typing.List[float] = sorted(self.latencies)
+        rank: int = max(int(-(-percent * len(latencies) // 100)), 1)
+        return latencies[min(rank, len(latencies)) - 1]
+
+    def finish(self: PWN) -> PWN:
+        self.seconds = time.perf_counter() - self._start
+        for hook in list(HOOKS):
+            try:
+                hook(self)
+            except Exception as err:
+                # A broken metrics sink never fails the read
+                logger.warning(f'Metrics Hook[{hook}] failed: {err}')
+
+        return self
+
+    def as_dict(self: PWN) -> typing.Dict[str, typing.Any]:
+        summary: typing.Dict[str, typing.Any] = {
+            'operation': self.operation,
+            'url': self.url,
+            'cached': self.cached,
+            'ranges-planned': self.ranges_planned,
+            'requests': self.requests,
+            'bytes-requested': self.bytes_requested,
+            'bytes-received': self.bytes_received,
+            'bytes-useful': self.bytes_useful,
+            'read-amplification': self.read_amplification,
+            'retries': self.retries,
+            'errors': self.errors,
+            'status-codes': dict(self.status_codes),
+            'seconds': self.seconds,
+        }
+        for percent in LATENCY_PERCENTILES:
+            summary[f'latency-p{percent}'] = self.percentile(percent)
+
+        return summary
+
+    def __repr__(self: PWN) -> str:
+        return f'FetchTelemetry: {self.operation} Requests[{self.requests}] Amplification[{self.read_amplification:.2f}]'
+
+HOOKS: typing.List[typing.Callable[[FetchTelemetry], None]] = []
+
+def add_hook(hook: typing.Callable[[FetchTelemetry], None]) -> typing.Callable[[FetchTelemetry], None]:
+    HOOKS.append(hook)
+    return hook
+
+def remove_hook(hook: typing.Callable[[FetchTelemetry], None]) -> None:
+    if hook in HOOKS:
+        HOOKS.remove(hook)
+
+class PrometheusCounters:
+    # A hook keeping running totals per operation, render() is the Prometheus text exposition format
+    COUNTERS: typing.List[typing.Tuple[str, str]] = [
+        ('operations', 'Cutout and bintable reads'),
+        ('requests', 'Range requests issued, retries included'),
+        ('retries', 'Range requests retried'),
+        ('errors', 'Range requests that failed to connect'),
+        ('bytes_requested', 'Bytes asked for in Range headers'),
+        ('bytes_useful', 'Bytes the reads returned to the caller'),
+        ('latency_seconds', 'Seconds spent waiting on range requests'),
+    ]
+
+    def __init__(self: PWN, prefix: str = 'cloud_fits_fetch') -> None:
+        self.prefix = prefix
+        self.counters: typing.Dict[typing.Tuple[str, str], float] = collections.Counter()
+        self.status_codes: typing.Dict[typing.Tuple[str, int], int] = collections.Counter()
+        self._lock = threading.Lock()
+
+    def __call__(self: PWN, telemetry: FetchTelemetry) -> None:
+        with self._lock:
+            self.counters[('operations', telemetry.operation)] += 1
+            self.counters[('requests', telemetry.operation)] += telemetry.requests
+            self.counters[('retries', telemetry.operation)] += telemetry.retries
+            self.counters[('errors', telemetry.operation)] += telemetry.errors
+            self.counters[('bytes_requested', telemetry.operation)] += telemetry.bytes_requested
+            self.counters[('bytes_useful', telemetry.operation)] += telemetry.bytes_useful
+            self.counters[('latency_seconds', telemetry.operation)] += sum(telemetry.latencies)
+            for status_code, count in telemetry.status_codes.items():
+                self.status_codes[(telemetry.operation, status_code)] += count
+
+    def render(self: PWN) -> str:
+        lines: typing.List[str] = []
+        with self._lock:
+            for name, description in self.COUNTERS:
+                lines.append(f'# HELP {self.prefix}_{name}_total {description}')
+                lines.append(f'# TYPE {self.prefix}_{name}_total counter')
+                for (counter_name, operation), value in sorted(self.counters.items()):
+                    if counter_name == name:
+                        lines.append(f'{self.prefix}_{name}_total{{operation="{operation}"}} {value}')
+
+            lines.append(f'# HELP {self.prefix}_responses_total Range responses by status code')
+            lines.append(f'# TYPE {self.prefix}_responses_total counter')
+            for (operation, status_code), count in sorted(self.status_codes.items()):
+                lines.append(f'{self.prefix}_responses_total{{operation="{operation}",status="{status_code}"}} {count}')
+
+        return '\n'.join(lines) + '\n'
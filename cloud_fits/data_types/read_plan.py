@@ -0,0 +1,104 @@
+import collections
+import logging
+import math
+import typing
+
+# Prices a read before running it. Ranges are planned exactly as the read would plan them, nothing is fetched.
+# The default network model is S3 standard GET requests and transfer out to the internet in us-east-1
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+logger = logging.getLogger(__name__)
+
+NetworkModel = collections.namedtuple('NetworkModel', [
+    'latency', 'bandwidth', 'concurrency', 'request_cost', 'transfer_cost'])
+
+# latency is seconds per request, bandwidth is bytes per second per connection, costs are dollars per request and per byte
+NETWORK_MODEL: NetworkModel = NetworkModel(
+    latency=.05,
+    bandwidth=50 * 1024 * 1024,
+    concurrency=8,
+    request_cost=.0004 / 1000,
+    transfer_cost=.09 / 1024 ** 3)
+
+class ReadPlan:
+    def __init__(self: PWN,
+        operation: str,
+        url: str,
+        shape: typing.Tuple[int],
+        ranges_generated: int,
+        ranges: typing.List[typing.List[int]],
+        network_model: NetworkModel = None) -> None:
+        self.operation = operation
+        self.url = url
+        self.shape = shape
+        self.ranges_generated = ranges_generated
+        self.ranges = ranges
+        self.network_model = NETWORK_MODEL if network_model is None else network_model
+
+    @property
+    def requests(self: PWN) -> int:
+        return len(self.ranges)
+
+    @property
+    def bytes(self: PWN) -> int:
+        return sum(stop - start for (start, stop) in self.ranges)
+
+    @property
+    def ranges_coalesced(self: PWN) -> int:
+        # Requests saved by merging adjacent ranges
+        return self.ranges_generated - self.requests
+
+    @property
+    def estimated_seconds(self: PWN) -> float:
+        # Requests go out in waves of `concurrency`, every wave pays the latency once and bytes share the connections
+        if self.requests == 0:
+            return 0.0
+
+        connections: int = min(self.network_model.concurrency, self.requests)
+        waves: int = math.ceil(self.requests / self.network_model.concurrency)
+        return waves * self.network_model.latency + self.bytes / (self.network_model.bandwidth * connections)
+
+    @property
+    def estimated_cost(self: PWN) -> float:
+        return self.requests * self.network_model.request_cost + self.bytes * self.network_model.transfer_cost
+
+    def check(self: PWN, max_requests: int = None, max_bytes: int = None, max_cost: float = None) -> PWN:
+        # Raises before anything is fetched, so oversized queries can be reshaped
+        for name, value, limit in [
+                ('Requests', self.requests, max_requests),
+                ('Bytes', self.bytes, max_bytes),
+                ('Cost', self.estimated_cost, max_cost)]:
+            if not limit is None and value > limit:
+                raise ValueError(f'{name}[{value}] exceeds Limit[{limit}] for URL[{self.url}]')
+
+        return self
+
+    def as_dict(self: PWN) -> typing.Dict[str, typing.Any]:
+        return {
+            'operation': self.operation,
+            'url': self.url,
+            'shape': list(self.shape),
+            'ranges-generated': self.ranges_generated,
+            'ranges-coalesced': self.ranges_coalesced,
+            'requests': self.requests,
+            'bytes': self.bytes,
+            'estimated-seconds': self.estimated_seconds,
+            'estimated-cost': self.estimated_cost,
+            'network-model': dict(self.network_model._asdict()),
+        }
+
+    def __repr__(self: PWN) -> str:
+        return f'ReadPlan: {self.operation} Requests[{self.requests}] Bytes[{self.bytes}] Cost[${self.estimated_cost:.6f}]'
+
+class ReadPlanner:
+    # header.explain[0:10, 0:10, 0:100, 0] or header.explain(network_model, out)[...], out plans a cutout into a file
+    # or array, which is streamed
+    def __init__(self: PWN, header: typing.Any, network_model: NetworkModel = None, out: typing.Any = None) -> None:
+        self._header = header
+        self._network_model = network_model
+        self._out = out
+
+    def __call__(self: PWN, network_model: NetworkModel = None, out: typing.Any = None) -> PWN:
+        return ReadPlanner(self._header, network_model, out)
+
+    def __getitem__(self: PWN, nViews: typing.Union[typing.Tuple, int, slice, typing.Tuple[slice]]) -> ReadPlan:
+        return self._header._plan_read(self._header._as_nViews(nViews), self._network_model, self._out)
@@ -1,123 +1,538 @@
 import base64
+import bisect
+import collections
+import concurrent.futures
 import logging
 import json
-import operator
-import requests
+import mmap
+import os
+import tempfile
 import time
-import multiprocessing
 import typing
 
-import numpy as np
-
-from astropy.io import fits
-
-from cloud_fits.auth import aws as aws_auth
-from cloud_fits.data_types import utils
+from cloud_fits import exceptions, profiling
+from cloud_fits.data_types import gzip_index, metrics, utils
+from cloud_fits.lazy_import import lazy_import
 
 from datetime import datetime
 
+aws_auth = lazy_import('cloud_fits.auth.aws')
+fits = lazy_import('astropy.io.fits')
+multiprocessing = lazy_import('multiprocessing')
+np = lazy_import('numpy')
+requests = lazy_import('requests')
+# Streamed ranges are split into chunks, at most STREAM_WORKERS chunks are held in memory
+STREAM_CHUNK_SIZE: int = 8 * 1024 * 1024
+STREAM_WORKERS: int = 8
+# Sparse reads closer than GATHER_MAX_GAP bytes are fetched as one range, one request costs more than a few KiB of transfer
+GATHER_MAX_GAP: int = 16 * 1024
+# Throttling and server errors are retried, any other status, e.g. 403 or 416, fails the range straight away
+RETRY_STATUS_CODES: typing.List[int] = [429, 500, 502, 503, 504]
+ERROR_BODY_LIMIT: int = 512
+# Cutouts larger than MEMMAP_THRESHOLD bytes are backed by a np.memmap in MEMMAP_DIRECTORY. Written pages are flushed and
+# released every MEMMAP_MEMORY_BUDGET bytes
+MEMMAP_THRESHOLD: int = 2 * 1024 * 1024 * 1024
+MEMMAP_MEMORY_BUDGET: int = 256 * 1024 * 1024
+MEMMAP_DIRECTORY: str = None
 logger = logging.getLogger(__name__)
 
-def test_cutout(filename: str) -> fits.HDUList:
+def test_cutout(filename: str) -> 'fits.HDUList':
     cutout = utils.create_hdu_list()
     cutout[1].data = fits.open(filename)[1].data[:250, :250, 50, 0]
     return cutout
 
-def local_cutout(filename: str, ranges: typing.List[typing.Tuple[int, int]], shape: typing.Tuple[int], dtype: np.dtype) -> fits.HDUList:
-    datas: typing.List[bytes] = []
-    with open(filename, 'rb') as stream:
-        for (start, stop) in ranges:
-            stream.seek(start)
-            diff: int = stop - start
-            datas.append(stream.read(diff))
+def _allocate_cutout(
+    ranges: typing.List[typing.Tuple[int, int]],
+    shape: typing.Tuple[int],
+    dtype: 'np.dtype') -> typing.Tuple['np.ndarray', 'np.ndarray', typing.List[int]]:
+    # Ranges are written straight into their position of the preallocated result
+    data_arr: np.ndarray = np.empty(shape, dtype=dtype)
+    positions: typing.List[int] = [0]
+    for (start, stop) in ranges:
+        positions.append(positions[-1] + stop - start)
 
-    # data_arr = np.frombuffer(b''.join(datas), dtype=dtype).reshape(shape)
-    data_arr = np.frombuffer(b''.join(datas), dtype='>f4').reshape(shape)
-    cutout = utils.create_hdu_list()
+    if positions[-1] != data_arr.nbytes:
+        raise NotImplementedError(f'Ranges[{positions[-1]} bytes] do not fill Shape[{shape}]')
+
+    return data_arr, data_arr.reshape(-1).view(np.uint8), positions[:-1]
+
+def _build_cutout_hdu_list(data_arr: 'np.ndarray', scaling: utils.ImageScaling, header: 'fits.Header' = None) -> 'fits.HDUList':
+    if not header is None and not scaling is None and (scaling.bscale != 1 or scaling.bzero != 0):
+        # The data is already scaled, astropy works out BZERO again for pseudo unsigned data
+        for keyword in ['BSCALE', 'BZERO', 'BLANK']:
+            header.remove(keyword, ignore_missing=True)
+
+    cutout = utils.create_hdu_list(header)
     cutout[1].data = data_arr
     return cutout
 
-def _load_byte_range(process_count, start: int, stop: int, child_conn, url: str):
-    max_retry = 0
-    while max_retry < 3:
+def _finish_cutout(
+    data_arr: 'np.ndarray',
+    native_byteorder: bool,
+    scaling: utils.ImageScaling,
+    header: 'fits.Header' = None) -> 'fits.HDUList':
+    with profiling.phase('decode'):
+        if native_byteorder and not data_arr.dtype.isnative:
+            data_arr.byteswap(inplace=True)
+            data_arr = data_arr.view(data_arr.dtype.newbyteorder('='))
+
+        return _build_cutout_hdu_list(utils.image__apply_scaling(data_arr, scaling), scaling, header)
+
+def _cutout_dtype(dtype: 'np.dtype', native_byteorder: bool, scaling: utils.ImageScaling) -> 'np.dtype':
+    out_dtype: np.dtype = utils.image__apply_scaling(np.zeros(0, dtype=dtype), scaling).dtype
+    if native_byteorder:
+        out_dtype = out_dtype.newbyteorder('=')
+
+    return out_dtype
+
+def _exceeds_memmap_threshold(shape: typing.Tuple[int], out_dtype: 'np.dtype') -> bool:
+    return out_dtype.itemsize * int(np.prod(shape)) > MEMMAP_THRESHOLD
+
+def streams_cutout(
+    shape: typing.Tuple[int],
+    dtype: 'np.dtype',
+    native_byteorder: bool = False,
+    scaling: utils.ImageScaling = None,
+    out: typing.Union[str, 'np.ndarray', None] = None,
+    seek_index: typing.Dict[str, typing.Any] = None) -> bool:
+    # Whether image_cutout streams the ranges, split into STREAM_CHUNK_SIZE chunks, instead of fetching them whole
+    return not out is None or not seek_index is None or _exceeds_memmap_threshold(
+        shape, _cutout_dtype(dtype, native_byteorder, scaling))
+
+def _allocate_out_of_core(
+    shape: typing.Tuple[int],
+    dtype: 'np.dtype',
+    native_byteorder: bool,
+    scaling: utils.ImageScaling,
+    out: typing.Union[str, 'np.ndarray', None]) -> typing.Tuple[typing.Optional['np.ndarray'], typing.Optional[mmap.mmap]]:
+    # The mapping is returned for memmaps allocated here, their written pages can be released. Arrays passed as out are
+    # only flushed
+    out_dtype: np.dtype = _cutout_dtype(dtype, native_byteorder, scaling)
+    if isinstance(out, np.ndarray):
+        if out.shape != tuple(shape) or out.dtype != out_dtype:
+            raise NotImplementedError(f'out must be Shape[{shape}] DataType[{out_dtype}]')
+
+        # Payloads are written through a flat view, reshaping anything else would fill a copy
+        if not out.flags.c_contiguous or not out.flags.writeable:
+            raise NotImplementedError(f'out must be a writeable C contiguous array')
+
+        return out, None
+
+    elif isinstance(out, str):
+        data_arr: np.memmap = np.memmap(out, dtype=out_dtype, mode='w+', shape=tuple(shape))
+        return data_arr, data_arr.base
+
+    elif _exceeds_memmap_threshold(shape, out_dtype):
+        memmap_fd, memmap_filepath = tempfile.mkstemp(suffix='.cutout', dir=MEMMAP_DIRECTORY)
         try:
-            response = requests.get(url, headers={
-                'Range': f'bytes={start}-{stop}',
+            data_arr: np.memmap = np.memmap(memmap_filepath, dtype=out_dtype, mode='w+', shape=tuple(shape))
+            return data_arr, data_arr.base
+
+        finally:
+            # The mapping keeps the file alive until the cutout is garbage collected
+            os.close(memmap_fd)
+            os.remove(memmap_filepath)
+
+    return None, None
+
+def _release_pages(data_arr: 'np.ndarray', mapping: typing.Optional[mmap.mmap]) -> None:
+    if isinstance(data_arr, np.memmap):
+        data_arr.flush()
+
+    if not mapping is None and hasattr(mapping, 'madvise') and hasattr(mmap, 'MADV_DONTNEED'):
+        mapping.madvise(mmap.MADV_DONTNEED)
+
+def _stream_cutout(
+    url: str,
+    ranges: typing.List[typing.Tuple[int, int]],
+    dtype: 'np.dtype',
+    scaling: utils.ImageScaling,
+    data_arr: 'np.ndarray',
+    header: 'fits.Header' = None,
+    telemetry: metrics.FetchTelemetry = None,
+    seek_index: typing.Dict[str, typing.Any] = None,
+    mapping: mmap.mmap = None) -> 'fits.HDUList':
+    # Payloads are decoded chunk by chunk into data_arr, numpy converts the byte order on assignment
+    data_flat: np.ndarray = data_arr.reshape(-1)
+    position: int = 0
+    unreleased: int = 0
+    with profiling.phase('fetch'):
+        for content in stream_byte_ranges(url, ranges, telemetry=telemetry, seek_index=seek_index):
+            with profiling.phase('decode'):
+                chunk: np.ndarray = np.frombuffer(content, dtype=dtype)
+                if not scaling is None:
+                    chunk = utils.image__apply_scaling(chunk.copy(), scaling)
+
+            with profiling.phase('assemble'):
+                data_flat[position:position + chunk.size] = chunk
+                position = position + chunk.size
+                unreleased = unreleased + chunk.size * data_arr.dtype.itemsize
+                if unreleased >= MEMMAP_MEMORY_BUDGET:
+                    _release_pages(data_arr, mapping)
+                    unreleased = 0
+
+    if position != data_flat.size:
+        raise NotImplementedError(f'Ranges[{position} items] do not fill Shape[{data_arr.shape}]')
+
+    _release_pages(data_arr, mapping)
+    return _build_cutout_hdu_list(data_arr, scaling, header)
+
+def local_cutout(
+    filename: str,
+    ranges: typing.List[typing.Tuple[int, int]],
+    shape: typing.Tuple[int],
+    dtype: 'np.dtype' = '>f4',
+    native_byteorder: bool = False,
+    scaling: utils.ImageScaling = None,
+    header: 'fits.Header' = None,
+    telemetry: metrics.FetchTelemetry = None) -> 'fits.HDUList':
+    data_arr, data_bytes, positions = _allocate_cutout(ranges, shape, dtype)
+    # Ranges are read straight into place, so fetch covers assemble
+    with profiling.phase('fetch'), open(filename, 'rb') as stream:
+        for position, (start, stop) in zip(positions, ranges):
+            requested: float = time.perf_counter()
+            stream.seek(start)
+            length: int = stream.readinto(memoryview(data_bytes[position:position + stop - start]))
+            if not telemetry is None:
+                telemetry.record(stop - start, length, time.perf_counter() - requested)
+
+    return _finish_cutout(data_arr, native_byteorder, scaling, header)
+
+def assemble_image_cutout(
+    payloads: typing.List[bytes],
+    ranges: typing.List[typing.Tuple[int, int]],
+    shape: typing.Tuple[int],
+    dtype: 'np.dtype' = '>f4',
+    native_byteorder: bool = False,
+    scaling: utils.ImageScaling = None,
+    header: 'fits.Header' = None) -> 'fits.HDUList':
+    # Payloads fetched elsewhere, e.g. by fetch_reads, in range order
+    data_arr, data_bytes, positions = _allocate_cutout(ranges, shape, dtype)
+    with profiling.phase('assemble'):
+        for position, content in zip(positions, payloads):
+            data_bytes[position:position + len(content)] = np.frombuffer(content, dtype=np.uint8)
+
+    return _finish_cutout(data_arr, native_byteorder, scaling, header)
+
+def build_session(workers: int = None) -> 'requests.Session':
+    # Keeps up to `workers` connections open per host
+    workers = workers or STREAM_WORKERS
+    session: requests.Session = requests.Session()
+    for prefix in ['http://', 'https://']:
+        session.mount(prefix, requests.adapters.HTTPAdapter(pool_connections=workers, pool_maxsize=workers))
+
+    return session
+
+def _fetch_read_range(
+    url: str,
+    start: int,
+    stop: int,
+    session: 'requests.Session',
+    telemetry: metrics.FetchTelemetry) -> bytes:
+    if url.startswith('https://') or url.startswith('http://'):
+        return fetch_byte_range(url, start, stop, session=session, telemetry=telemetry)
+
+    return load_byte_ranges(url, [(start, stop)], telemetry)[0]
+
+def fetch_reads(
+    reads: typing.List[typing.Tuple[str, typing.List[typing.Tuple[int, int]], metrics.FetchTelemetry, typing.Dict[str, typing.Any]]],
+    workers: int = None,
+    session: 'requests.Session' = None) -> typing.List[typing.List[bytes]]:
+    # reads are (url, ranges, telemetry, seek_index). Every range of every read goes through one pool of workers sharing
+    # one session, so the reads overlap and the wall time approaches the slowest one instead of the sum. Gzip
+    # compressed reads are one task each, their seek points decide the compressed spans
+    workers = workers or STREAM_WORKERS
+    if session is None and any(url.startswith('https://') or url.startswith('http://') for (url, ranges, telemetry, seek_index) in reads):
+        session = build_session(workers)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures: typing.List[typing.Any] = []
+        for (url, ranges, telemetry, seek_index) in reads:
+            if not seek_index is None:
+                futures.append(executor.submit(load_byte_ranges, url, ranges, telemetry, seek_index))
+
+            else:
+                futures.append([executor.submit(_fetch_read_range, url, start, stop, session, telemetry) for (start, stop) in ranges])
+
+        with profiling.phase('fetch'):
+            return [future.result() if isinstance(future, concurrent.futures.Future) else [
+                range_future.result() for range_future in future] for future in futures]
+
+def fetch_byte_range(
+    url: str,
+    start: int,
+    stop: int,
+    max_retry: int = 3,
+    session: 'requests.Session' = None,
+    telemetry: metrics.FetchTelemetry = None) -> bytes:
+    # start, stop are half-open. HTTP Range headers are inclusive. Long running callers pass a session to reuse connections
+    status_code: int = None
+    for retry in range(0, max_retry):
+        requested: float = time.perf_counter()
+        try:
+            response = (session or requests).get(url, headers={
+                'Range': f'bytes={start}-{stop - 1}',
                 'Accept': 'application/octet-stream'
             }, auth=aws_auth.AWSAuth(True), stream=False)
         except Exception as err:
+            if not telemetry is None:
+                telemetry.record(stop - start, 0, time.perf_counter() - requested, retry=retry > 0, error=True)
+
+            logger.warning(f'Unable to load Range[{start}-{stop}] from URL[{url}]: {err}')
+            status_code = None
             time.sleep(.1)
 
         else:
+            if not telemetry is None:
+                telemetry.record(stop - start, len(response.content), time.perf_counter() - requested, response.status_code, retry > 0)
+
             if response.status_code == 206:
-                child_conn.send([
-                    json.dumps([
-                        process_count,
-                        base64.b64encode(response.content).decode('ascii')
-                    ])
-                ])
-                return None
-
-        max_retry = max_retry + 1
-        if max_retry >= 3:
-            child_conn.send([
-                json.dumps([
-                    process_count,
-                    base64.b64encode(b'noop').decode('ascii')
-                ])
-            ])
-            return None
-
-def remote_cutout(url: str, ranges: typing.List[typing.Tuple[int, int]], shape: typing.Tuple[int]):
+                return response.content
+
+            status_code = response.status_code
+            logger.warning(f'Unable to load Range[{start}-{stop}] from URL[{url}] Status[{status_code}]: '
+                f'{response.content[:ERROR_BODY_LIMIT]!r}')
+            if not status_code in RETRY_STATUS_CODES:
+                break
+
+    raise exceptions.RangeException(f'Unable to load Range[{start}-{stop}] from URL[{url}] Status[{status_code}]', status_code)
+
+def _inflate_byte_ranges(
+    url: str,
+    ranges: typing.List[typing.Tuple[int, int]],
+    seek_index: typing.Dict[str, typing.Any],
+    workers: int = None,
+    telemetry: metrics.FetchTelemetry = None) -> typing.Iterator[typing.Tuple[gzip_index.GzipRead, bytes]]:
+    # Yields every read of a gzip compressed file with its inflated bytes, in range order. libz releases the GIL
+    def _load_read(read: gzip_index.GzipRead) -> bytes:
+        payload: bytes = load_byte_ranges(url, [(read.compressed_start, read.compressed_stop)], telemetry)[0]
+        with profiling.phase('decode'):
+            return gzip_index.inflate_read(seek_index, read, payload)
+
+    workers = workers or STREAM_WORKERS
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: typing.Deque[typing.Tuple[gzip_index.GzipRead, concurrent.futures.Future]] = collections.deque()
+        for read in gzip_index.plan_reads(seek_index, ranges):
+            pending.append((read, executor.submit(_load_read, read)))
+            if len(pending) >= workers:
+                read, future = pending.popleft()
+                yield read, future.result()
+
+        while pending:
+            read, future = pending.popleft()
+            yield read, future.result()
+
+def load_byte_ranges(
+    url: str,
+    ranges: typing.List[typing.Tuple[int, int]],
+    telemetry: metrics.FetchTelemetry = None,
+    seek_index: typing.Dict[str, typing.Any] = None) -> typing.List[bytes]:
+    # Ranges of a gzip compressed file are uncompressed offsets, see cloud_fits.data_types.gzip_index
+    if not seek_index is None:
+        datas: typing.List[bytes] = [None] * len(ranges)
+        for read, inflated in _inflate_byte_ranges(url, ranges, seek_index, telemetry=telemetry):
+            for idx in read.ranges:
+                datas[idx] = inflated[ranges[idx][0] - read.start:ranges[idx][1] - read.start]
+
+        return datas
+
+    if url.startswith('https://') or url.startswith('http://'):
+        return [fetch_byte_range(url, start, stop, telemetry=telemetry) for (start, stop) in ranges]
+
+    datas: typing.List[bytes] = []
+    with open(url, 'rb') as stream:
+        for (start, stop) in ranges:
+            requested: float = time.perf_counter()
+            stream.seek(start)
+            datas.append(stream.read(stop - start))
+            if not telemetry is None:
+                telemetry.record(stop - start, len(datas[-1]), time.perf_counter() - requested)
+
+    return datas
+
+def stream_byte_ranges(
+    url: str,
+    ranges: typing.List[typing.Tuple[int, int]],
+    chunk_size: int = None,
+    workers: int = None,
+    telemetry: metrics.FetchTelemetry = None,
+    seek_index: typing.Dict[str, typing.Any] = None) -> typing.Iterator[bytes]:
+    # Yields payloads in range order, so callers can write or reduce them as they arrive
+    ranges = utils.split_ranges(ranges, chunk_size or STREAM_CHUNK_SIZE)
+    if not seek_index is None:
+        for read, inflated in _inflate_byte_ranges(url, ranges, seek_index, workers, telemetry):
+            for idx in read.ranges:
+                yield inflated[ranges[idx][0] - read.start:ranges[idx][1] - read.start]
+
+        return None
+
+    if not (url.startswith('https://') or url.startswith('http://')):
+        with open(url, 'rb') as stream:
+            for (start, stop) in ranges:
+                requested: float = time.perf_counter()
+                stream.seek(start)
+                content: bytes = stream.read(stop - start)
+                if not telemetry is None:
+                    telemetry.record(stop - start, len(content), time.perf_counter() - requested)
+
+                yield content
+
+        return None
+
+    workers = workers or STREAM_WORKERS
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: typing.Deque[concurrent.futures.Future] = collections.deque()
+        for (start, stop) in ranges:
+            pending.append(executor.submit(fetch_byte_range, url, start, stop, telemetry=telemetry))
+            if len(pending) >= workers:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+def gather_byte_ranges(
+    url: str,
+    ranges: typing.List[typing.Tuple[int, int]],
+    max_gap: int = 0,
+    telemetry: metrics.FetchTelemetry = None,
+    seek_index: typing.Dict[str, typing.Any] = None) -> bytearray:
+    # Payloads of ranges joined in the order given. Ranges may be unsorted, overlap or repeat
+    fetch_ranges: typing.List[typing.List[int]] = utils.coalesce_ranges(ranges, max_gap)
+    chunks: typing.Iterator[bytes] = stream_byte_ranges(url, fetch_ranges, telemetry=telemetry, seek_index=seek_index)
+    payloads: typing.List[memoryview] = []
+    for (start, stop) in fetch_ranges:
+        payload: bytearray = bytearray()
+        while len(payload) < stop - start:
+            payload.extend(next(chunks))
+
+        payloads.append(memoryview(payload))
+
+    starts: typing.List[int] = [start for (start, stop) in fetch_ranges]
+    gathered: bytearray = bytearray(sum(stop - start for (start, stop) in ranges))
+    position: int = 0
+    for (start, stop) in ranges:
+        idx: int = bisect.bisect_right(starts, start) - 1
+        gathered[position:position + stop - start] = payloads[idx][start - starts[idx]:stop - starts[idx]]
+        position = position + stop - start
+
+    return gathered
+
+def write_image_cutout(
+    url: str,
+    ranges: typing.List[typing.Tuple[int, int]],
+    primary_header: bytes,
+    header: 'fits.Header',
+    filepath: str,
+    telemetry: metrics.FetchTelemetry = None,
+    seek_index: typing.Dict[str, typing.Any] = None) -> str:
+    # Range payloads are already big-endian FITS data in C order, so they're written through without decoding
+    data_length: int = 0
+    with open(filepath, 'wb') as stream:
+        stream.write(primary_header)
+        stream.write(header.tostring().encode('ascii'))
+        for content in stream_byte_ranges(url, ranges, telemetry=telemetry, seek_index=seek_index):
+            stream.write(content)
+            data_length = data_length + len(content)
+
+        stream.write(b'\0' * (-data_length % utils.BLOCK_SIZE))
+
+    return filepath
+
+def _load_byte_range(process_count, start: int, stop: int, child_conn, url: str):
+    # Attempts are recorded in the child and merged into the parent's telemetry
+    telemetry = metrics.FetchTelemetry('range', url)
+    status_code: int = 206
+    try:
+        content = fetch_byte_range(url, start, stop, telemetry=telemetry)
+    except exceptions.RangeException as err:
+        content = b'noop'
+        status_code = err.status_code
+
+    child_conn.send([
+        json.dumps([
+            process_count,
+            base64.b64encode(content).decode('ascii'),
+            telemetry.export(),
+            status_code,
+        ])
+    ])
+
+def image_cutout(
+    url: str,
+    ranges: typing.List[typing.Tuple[int, int]],
+    shape: typing.Tuple[int],
+    dtype: 'np.dtype' = '>f4',
+    native_byteorder: bool = False,
+    scaling: utils.ImageScaling = None,
+    header: 'fits.Header' = None,
+    out: typing.Union[str, 'np.ndarray', None] = None,
+    telemetry: metrics.FetchTelemetry = None,
+    seek_index: typing.Dict[str, typing.Any] = None) -> 'fits.HDUList':
+    # out is a filepath or array to write the cutout into, large cutouts fall back to a temporary memmap
+    data_arr, mapping = _allocate_out_of_core(shape, dtype, native_byteorder, scaling, out)
+    if data_arr is None and not seek_index is None:
+        # Inflated payloads arrive in order, so gzip compressed cutouts are decoded into place like streamed ones
+        data_arr = np.empty(shape, dtype=_cutout_dtype(dtype, native_byteorder, scaling))
+
+    if not data_arr is None:
+        return _stream_cutout(url, ranges, dtype, scaling, data_arr, header, telemetry, seek_index, mapping)
+
+    if url.startswith('https://') or url.startswith('http://'):
+        return remote_cutout(url, ranges, shape, dtype, native_byteorder, scaling, header, telemetry)
+
+    return local_cutout(url, ranges, shape, dtype, native_byteorder, scaling, header, telemetry)
+
+def remote_cutout(
+    url: str,
+    ranges: typing.List[typing.Tuple[int, int]],
+    shape: typing.Tuple[int],
+    dtype: 'np.dtype' = '>f4',
+    native_byteorder: bool = False,
+    scaling: utils.ImageScaling = None,
+    header: 'fits.Header' = None,
+    telemetry: metrics.FetchTelemetry = None) -> 'fits.HDUList':
     workers = 250
     processes = []
-    process_results = []
+    data_arr, data_bytes, positions = _allocate_cutout(ranges, shape, dtype)
+    ranges = list(ranges)
     process_count: int = 0
-    while len(processes) > 0 or len(ranges) > 0:
-        for idx, (parent_conn, proc) in enumerate(processes):
-            if proc.is_alive() == False:
-                result = json.loads(parent_conn.recv()[0])
-                content = base64.b64decode(result[1].encode('ascii'))
-                if content == 'noop':
-                    process_results.append([result[0], 'noop'])
-
-                else:
-                    value = base64.b64decode(result[1].encode('ascii'))
-                    if value == 'noop':
-                        raise Exception
-
-                    process_results.append([
-                        result[0],
-                        value,
-                    ])
-
-                proc.join()
-                processes.pop(idx)
-
-        if len(processes) > 3:
-            time.sleep(.1)
-            continue
-
-        logger.info(f'Process Count: {len(processes)}')
-        logger.info(f'Range Count: {len(ranges)}')
-        logger.info(f'Worker Count: {workers}')
-        logger.info(f'Result Count: {len(process_results)}')
-        for idx in range(0, workers - len(processes)):
-            try:
-                next_range = ranges.pop(0)
-            except IndexError:
+    with profiling.phase('fetch'):
+        while len(processes) > 0 or len(ranges) > 0:
+            for idx, (parent_conn, proc) in enumerate(processes):
+                if proc.is_alive() == False:
+                    result = json.loads(parent_conn.recv()[0])
+                    content = base64.b64decode(result[1].encode('ascii'))
+                    if not telemetry is None:
+                        telemetry.merge(result[2])
+
+                    if content == b'noop':
+                        raise exceptions.RangeException(f'Unable to load Range[{result[0]}] from URL[{url}] Status[{result[3]}]', result[3])
+
+                    with profiling.phase('assemble'):
+                        position: int = positions[result[0]]
+                        data_bytes[position:position + len(content)] = np.frombuffer(content, dtype=np.uint8)
+
+                    proc.join()
+                    processes.pop(idx)
+
+            if len(processes) > 3:
+                time.sleep(.1)
                 continue
 
-            parent_conn, child_conn = multiprocessing.Pipe()
-            proc = multiprocessing.Process(target=_load_byte_range, args=(process_count, next_range[0], next_range[1], child_conn, url))
-            proc.daemon = True
-            proc.start()
-            processes.append([parent_conn, proc])
-            process_count = process_count + 1
+            logger.info(f'Process Count: {len(processes)}')
+            logger.info(f'Range Count: {len(ranges)}')
+            logger.info(f'Worker Count: {workers}')
+            for idx in range(0, workers - len(processes)):
+                try:
+                    next_range = ranges.pop(0)
+                except IndexError:
+                    continue
 
-    datas = [re[1] for re in sorted(process_results, key=operator.itemgetter(0))]
-    data_arr = np.frombuffer(b''.join(datas), dtype='>f4').reshape(shape)
-    cutout = utils.create_hdu_list()
-    cutout[1].data = data_arr
-    return cutout
+                parent_conn, child_conn = multiprocessing.Pipe()
+                proc = multiprocessing.Process(target=_load_byte_range, args=(process_count, next_range[0], next_range[1], child_conn, url))
+                proc.daemon = True
+                proc.start()
+                processes.append([parent_conn, proc])
+                process_count = process_count + 1
 
+    return _finish_cutout(data_arr, native_byteorder, scaling, header)
@@ -1,34 +1,101 @@
+import base64
 import collections
 import enum
 import functools
+import hashlib
 import logging
 import operator
 import os
-import requests
-import tempfile
+import re
 import typing
 
-import numpy as np
-
-from astropy.io import fits
-from astropy.table import Table as Astropy_Table
-
 from cloud_fits import exceptions
-from cloud_fits.auth import aws as aws_auth
+from cloud_fits.lazy_import import lazy_import
+
+fits = lazy_import('astropy.io.fits')
+np = lazy_import('numpy')
 
 BLOCK_SIZE: int = 2880
+SHARD_PREFIX: str = 'cloud-fits-shards'
+# Reference pixel keywords, including alternate WCS, and IRAF physical offsets
+PIXEL_OFFSET_PATTERN: typing.Pattern = re.compile(r'^(CRPIX|LTV)(\d+)([A-Z]?)$')
 PWN: typing.TypeVar = typing.TypeVar('PWN')
 logger = logging.getLogger(__name__)
 
 FitsCloudIndexContext = collections.namedtuple('FitsCloudIndexContext', [
     'region', 'version', 'bucket_name', 'data_bucket_path'])
 
+ImageScaling = collections.namedtuple('ImageScaling', ['bscale', 'bzero', 'blank'])
+
 class ExtensionType(enum.Enum):
     BinTable: str = 'bintable'
     Image: str = 'image'
     Primary: str = 'primary'
 
-def create_primary_header() -> fits.PrimaryHDU:
+BINTABLE_OPERATORS: typing.Dict[str, typing.Callable[[typing.Any, typing.Any], typing.Any]] = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    # Any of the bits in value set, e.g. QUALITY flags
+    '&': lambda values, value: (values & value) != 0,
+}
+# FITS data is always big-endian, BITPIX 16/32/64 are signed
+# https://fits.gsfc.nasa.gov/standard40/fits_standard40aa-le.pdf Table 8
+BITPIX_DTYPES: typing.Dict[int, str] = {
+    8: 'u1',
+    16: '>i2',
+    32: '>i4',
+    64: '>i8',
+    -32: '>f4',
+    -64: '>f8',
+}
+
+def read_header_card(header: bytes, keyword: str) -> typing.Any:
+    # Reads a single fixed-format card without parsing the whole header through astropy
+    # https://fits.gsfc.nasa.gov/standard40/fits_standard40aa-le.pdf Section 4.2
+    for idx in range(0, len(header), 80):
+        card: str = header[idx:idx + 80].decode('ascii')
+        if card[:8] == 'END     ':
+            break
+
+        elif card[:8].rstrip() != keyword or card[8:10] != '= ':
+            continue
+
+        value: str = card[10:].strip()
+        if value.startswith("'"):
+            return value[1:].split("'", 1)[0].rstrip()
+
+        value = value.split('/', 1)[0].strip()
+        if value in ['T', 'F']:
+            return value == 'T'
+
+        for value_type in [int, float]:
+            try:
+                return value_type(value)
+            except ValueError:
+                pass
+
+        return value
+
+    return None
+
+def build_s3_url(region: str, path: str) -> str:
+    # CLOUD_FITS_S3_ENDPOINT points cloud-fits at an S3 compatible endpoint, e.g. cloud_fits.stand_in_server
+    endpoint: str = os.environ.get('CLOUD_FITS_S3_ENDPOINT', None) or f'https://s3.{region}.amazonaws.com'
+    return f'{endpoint.rstrip("/")}/{path.strip("/")}'
+
+def build_shard_key(cloudpath: str, shard_depth: int) -> str:
+    # cloudpath directories, e.g. s0001/1/1/tess-cube.fits with a depth of 2 belongs to shard s0001/1
+    directories: typing.List[str] = cloudpath.strip('/').split('/')[:-1]
+    return '/'.join(directories[:shard_depth])
+
+def build_shard_filepath(shard_key: str) -> str:
+    return f'{SHARD_PREFIX}/{hashlib.sha1(shard_key.encode("utf-8")).hexdigest()}.yaml'
+
+def create_primary_header() -> 'fits.PrimaryHDU':
     header = fits.Header()
     # Primary Header mandatory keywords
     # https://fits.gsfc.nasa.gov/standard30/fits_standard30aa.pdf
@@ -40,7 +107,10 @@ def create_primary_header() -> fits.PrimaryHDU:
     header['MESSAGE'] = 'Generated header from cloud-fits'
     return fits.PrimaryHDU(header=header)
 
-def create_image_header() -> fits.ImageHDU:
+def create_image_header(header: 'fits.Header' = None) -> 'fits.ImageHDU':
+    if not header is None:
+        return fits.ImageHDU(header=header)
+
     header = fits.Header()
     header['XTENSION'] = 'IMAGE'
     header['BITPIX'] = '-32'
@@ -51,14 +121,93 @@ def create_image_header() -> fits.ImageHDU:
     header['GCOUNT'] = 1
     return fits.ImageHDU(header=header)
 
-def create_hdu_list() -> fits.HDUList():
+def create_hdu_list(header: 'fits.Header' = None) -> 'fits.HDUList':
     hdu_list = fits.HDUList([
         create_primary_header(),
-        create_image_header()
+        create_image_header(header)
     ])
     return hdu_list
 
-def image__find_byte_length_of_data(header: fits.Header, itemsize: np.dtype) -> None:
+def image__build_cutout_header(header: 'fits.Header', nViews: typing.List[slice]) -> 'fits.Header':
+    # nViews are in numpy order, the last view is NAXIS1
+    cutout_header: fits.Header = header.copy()
+    for idx, nView in enumerate(nViews):
+        if not nView.step in [None, 1]:
+            raise NotImplementedError(f'Cutout headers for stepped views are not supported yet')
+
+        cutout_header[f'NAXIS{len(nViews) - idx}'] = nView.stop - nView.start
+
+    for keyword in list(cutout_header.keys()):
+        match = PIXEL_OFFSET_PATTERN.match(keyword)
+        if match and int(match.group(2)) <= len(nViews):
+            cutout_header[keyword] = header[keyword] - nViews[len(nViews) - int(match.group(2))].start
+
+    for keyword in ['CHECKSUM', 'DATASUM']:
+        cutout_header.remove(keyword, ignore_missing=True)
+
+    return cutout_header
+
+def pack_float_array(values: 'np.ndarray') -> str:
+    # Compact enough for YAML, little-endian float64
+    return base64.b64encode(np.asarray(values, dtype='<f8').tobytes()).decode('ascii')
+
+def unpack_float_array(packed: str) -> 'np.ndarray':
+    return np.frombuffer(base64.b64decode(packed), dtype='<f8')
+
+def pack_int_array(values: 'np.ndarray') -> str:
+    return base64.b64encode(np.asarray(values, dtype='<i8').tobytes()).decode('ascii')
+
+def unpack_int_array(packed: str) -> 'np.ndarray':
+    return np.frombuffer(base64.b64decode(packed), dtype='<i8')
+
+def bitpix_to_dtype(bitpix: int) -> 'np.dtype':
+    if not bitpix in BITPIX_DTYPES:
+        raise ValueError(f'BITPIX={bitpix} not supported')
+
+    return np.dtype(BITPIX_DTYPES[bitpix])
+
+def image__read_scaling(header: bytes) -> ImageScaling:
+    bscale: typing.Any = read_header_card(header, 'BSCALE')
+    bzero: typing.Any = read_header_card(header, 'BZERO')
+    return ImageScaling(
+        1 if bscale is None else bscale,
+        0 if bzero is None else bzero,
+        read_header_card(header, 'BLANK'))
+
+def image__apply_scaling(data: 'np.ndarray', scaling: ImageScaling) -> 'np.ndarray':
+    # Mirrors astropy.io.fits ImageHDU.data, https://docs.astropy.org/en/stable/io/fits/usage/image.html#scaled-data
+    if scaling is None or (scaling.bscale == 1 and scaling.bzero == 0):
+        return data
+
+    bits: int = data.dtype.itemsize * 8
+    if scaling.bscale == 1 and (
+        (data.dtype.kind == 'i' and scaling.bzero == 2 ** (bits - 1)) or
+        (data.dtype.kind == 'u' and scaling.bzero == -2 ** (bits - 1))):
+        # Pseudo unsigned integers (or signed bytes), adding BZERO only flips the sign bit. Done in place on the raw buffer
+        pseudo_dtype: np.dtype = np.dtype(f'{"i" if data.dtype.kind == "u" else "u"}{data.dtype.itemsize}').newbyteorder(data.dtype.byteorder)
+        pseudo_data: np.ndarray = data.view(pseudo_dtype)
+        np.bitwise_xor(pseudo_data, np.array(1 << (bits - 1)).astype(pseudo_dtype), out=pseudo_data)
+        return pseudo_data
+
+    if data.dtype.kind == 'f':
+        scaled: np.ndarray = data
+
+    else:
+        scaled = np.empty(data.shape, dtype=np.float64 if bits > 16 else np.float32)
+        np.copyto(scaled, data, casting='unsafe')
+
+    if scaling.bscale != 1:
+        np.multiply(scaled, scaling.bscale, out=scaled, casting='unsafe')
+
+    if scaling.bzero != 0:
+        np.add(scaled, scaling.bzero, out=scaled, casting='unsafe')
+
+    if not scaling.blank is None and data.dtype.kind in 'iu':
+        scaled[data == scaling.blank] = np.nan
+
+    return scaled
+
+def image__find_byte_length_of_data(header: 'fits.Header', itemsize: 'np.dtype') -> None:
     # https://ui.adsabs.harvard.edu/abs/1994A%26AS..105...53P/abstract
     B: int = itemsize
     G: int = header['GCOUNT']
@@ -67,7 +216,7 @@ def image__find_byte_length_of_data(header: fits.Header, itemsize: np.dtype) ->
     S: int = B * G * (P + np.prod(N))
     return S
 
-def image__validate_fits_format(header: fits.Header) -> None:
+def image__validate_fits_format(header: 'fits.Header') -> None:
     # https://docs.astropy.org/en/stable/io/fits/api/images.html
     # Implemented the validators that are aligned with the FITS Spec
     # http://articles.adsabs.harvard.edu/pdf/1994A%26AS..105...53P
@@ -75,7 +224,7 @@ def image__validate_fits_format(header: fits.Header) -> None:
     G: int = header['GCOUNT']
     P: int = header['PCOUNT']
     N: typing.List[int] = [header[f'NAXIS{idx}'] for idx in range(1, header['NAXIS'] + 1)]
-    assert len(N) > 2
+    assert len(N) > 1
     assert G == 1
 
 def image__validate_python_inputs(nViews: typing.List[typing.Union[slice, int]], shape: typing.Tuple[int]) -> None:
@@ -116,7 +265,7 @@ def _image___generate_ranges_visitor(nView: slice, nViews: typing.List[slice], s
         else:
             index_strides.append(idx_stride)
             _image___generate_ranges_visitor(next_nView, next_nViews, next_strides, ranges, index_strides)
-            index_strides = index_strides[:-1]
+            index_strides.pop()
 
 def image__generate_ranges(nViews: typing.List[slice], strides: typing.Tuple[int], offset: int = 0, stop_variance: int = 0) -> None:
     ranges: typing.List[int] = []
@@ -160,6 +309,95 @@ def image__generate_ranges__validate(nViews: typing.List[slice], strides: typing
 
     return ranges
 
+def split_ranges(ranges: typing.List[typing.Tuple[int, int]], max_length: int) -> typing.List[typing.List[int]]:
+    split: typing.List[typing.List[int]] = []
+    for start, stop in ranges:
+        for split_start in range(start, stop, max_length):
+            split.append([split_start, min(split_start + max_length, stop)])
+
+    return split
+
+def coalesce_ranges(ranges: typing.List[typing.Tuple[int, int]], max_gap: int = 0) -> typing.List[typing.List[int]]:
+    # Ranges are half-open, [start, stop). Adjacent ranges are merged so a contiguous run costs one read, max_gap also
+    # merges ranges up to that many bytes apart, the gap is read and dropped
+    consolidated_ranges: typing.List[typing.List[int]] = []
+    for start, stop in sorted(ranges):
+        if consolidated_ranges and consolidated_ranges[-1][0] <= start <= consolidated_ranges[-1][1] + max_gap:
+            consolidated_ranges[-1][1] = max(stop, consolidated_ranges[-1][1])
+
+        else:
+            consolidated_ranges.append([start, stop])
+
+    return consolidated_ranges
+
+def image__contiguous_chunks(shape: typing.Tuple[int], itemsize: int, limit: int) -> typing.Tuple[int]:
+    # Trailing axes are kept whole for as long as they fit within limit bytes, so each chunk maps onto as
+    # few contiguous byte runs as possible. The first axis that doesn't fit is split, leading axes are 1
+    chunks: typing.List[int] = []
+    run_bytes: int = itemsize
+    for idx in range(len(shape) - 1, -1, -1):
+        if run_bytes * shape[idx] <= limit:
+            chunks.insert(0, shape[idx])
+            run_bytes = run_bytes * shape[idx]
+            continue
+
+        chunks.insert(0, max(1, limit // run_bytes))
+        chunks[:0] = [1] * idx
+        break
+
+    return tuple(chunks)
+
+def bintable__evaluate(values: 'np.ndarray', op: str, value: typing.Any) -> 'np.ndarray':
+    if not op in BINTABLE_OPERATORS:
+        raise NotImplementedError(f'Operator[{op}] Not supported yet, use one of {sorted(BINTABLE_OPERATORS)}')
+
+    return BINTABLE_OPERATORS[op](values, value)
+
+def bintable__unpack_bounds(bounds: typing.Union[str, typing.List[typing.Optional[int]]]) -> 'np.ndarray':
+    # Float bounds are packed, integer bounds are a list of ints compared exactly as Python objects. None, a row group
+    # without valid rows, compares like NaN
+    if isinstance(bounds, str):
+        return unpack_float_array(bounds)
+
+    return np.array([np.nan if bound is None else bound for bound in bounds], dtype=object)
+
+def bintable__zone_candidates(
+    zones: typing.Optional[typing.Dict[str, typing.Any]],
+    column: str,
+    op: str,
+    value: typing.Any,
+    row_count: int) -> typing.List[typing.List[int]]:
+    # Row ranges of the row groups whose min/max, null count and bits could hold a matching row
+    if zones is None or not column in zones['columns']:
+        return [[0, row_count]] if row_count > 0 else []
+
+    zone: typing.Dict[str, typing.Any] = zones['columns'][column]
+    minimums: np.ndarray = bintable__unpack_bounds(zone['min'])
+    maximums: np.ndarray = bintable__unpack_bounds(zone['max'])
+    with np.errstate(invalid='ignore'):
+        if op == '&':
+            candidates: np.ndarray = np.ones(len(minimums), dtype=bool) if not 'bits' in zone else \
+                (unpack_int_array(zone['bits']) & int(value)) != 0
+
+        elif op == '!=':
+            # Only row groups where every row equals value are skipped
+            candidates = ~(np.asarray(minimums == value, dtype=bool) & np.asarray(maximums == value, dtype=bool)
+                & (unpack_int_array(zone['nulls']) == 0))
+
+        elif op in ['<', '<=']:
+            candidates = bintable__evaluate(minimums, op, value)
+
+        elif op in ['>', '>=']:
+            candidates = bintable__evaluate(maximums, op, value)
+
+        else:
+            candidates = bintable__evaluate(minimums, '<=', value) & bintable__evaluate(maximums, '>=', value)
+
+    row_ranges: typing.List[typing.List[int]] = [
+        [int(group) * zones['rows'], min((int(group) + 1) * zones['rows'], row_count)]
+        for group in np.flatnonzero(np.asarray(candidates, dtype=bool))]
+    return coalesce_ranges(row_ranges)
+
 def calculate_shape_from_nViews(nViews: typing.List[slice]) -> typing.Tuple[int]:
     shape: typing.List[int] = []
     for nView in nViews:
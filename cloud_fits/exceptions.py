@@ -1,3 +1,8 @@
 class IndexException(Exception):
     pass
 
+class RangeException(Exception):
+    # status_code is the last response status, None when no response came back, e.g. the connection failed
+    def __init__(self, message: str, status_code: int = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
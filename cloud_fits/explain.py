@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import logging
+import sys
+import typing
+
+import cloud_fits
+
+from cloud_fits import data_types, local_index
+from cloud_fits.data_types import read_plan
+from cloud_fits.lazy_import import lazy_import
+
+bucket_operations = lazy_import('cloud_fits.bucket_operations')
+cutout_server = lazy_import('cloud_fits.cutout_server')
+
+logger = logging.getLogger(__name__)
+
+def capture_options() -> argparse.Namespace:
+    options = argparse.ArgumentParser()
+    source = options.add_mutually_exclusive_group(required=True)
+    source.add_argument('-i', '--index-bucket-name', type=str, help="""
+Plan against the Cloud Fits Index stored in this bucket
+""")
+    source.add_argument('-f', '--fits-files-directory', type=str, help="""
+Index a local directory in memory and plan against it
+""")
+    options.add_argument('-p', '--path', type=str, required=True, help="""
+Cloudpath of the FITS file, e.g. s0001/1/tess-s0001-1-1-cube.fits
+""")
+    options.add_argument('-u', '--hdu', type=int, default=1)
+    options.add_argument('-v', '--view', type=str, required=True, help="""
+Comma separated view, 0:10,0:10,0:100,0 is the same as [0:10, 0:10, 0:100, 0]
+""")
+    options.add_argument('--latency', type=float, default=read_plan.NETWORK_MODEL.latency, help="""
+Seconds per request
+""")
+    options.add_argument('--bandwidth', type=float, default=read_plan.NETWORK_MODEL.bandwidth, help="""
+Bytes per second per connection
+""")
+    options.add_argument('--concurrency', type=int, default=read_plan.NETWORK_MODEL.concurrency)
+    options.add_argument('--request-cost', type=float, default=read_plan.NETWORK_MODEL.request_cost, help="""
+Dollars per request
+""")
+    options.add_argument('--transfer-cost', type=float, default=read_plan.NETWORK_MODEL.transfer_cost, help="""
+Dollars per byte
+""")
+    options.add_argument('--max-cost', type=float, default=None, help="""
+Exit with an error when the estimated cost is higher
+""")
+    return options.parse_args()
+
+def run_from_cli() -> None:
+    cloud_fits.configure_logging()
+    options = capture_options()
+    if options.fits_files_directory:
+        catalog: data_types.FitsCloudCatalog = local_index.build_local_catalog(options.fits_files_directory)
+
+    else:
+        catalog: data_types.FitsCloudCatalog = bucket_operations.download_catalog(options.index_bucket_name)
+
+    network_model = read_plan.NetworkModel(
+        options.latency, options.bandwidth, options.concurrency, options.request_cost, options.transfer_cost)
+    header: data_types.FitsCloudIndexHeader = catalog[options.path].headers[options.hdu]
+    plan: read_plan.ReadPlan = header.explain(network_model)[cutout_server.parse_view(options.view)]
+    print(json.dumps(plan.as_dict(), indent=4))
+    try:
+        plan.check(max_cost=options.max_cost)
+    except ValueError as err:
+        logger.error(str(err))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    run_from_cli()
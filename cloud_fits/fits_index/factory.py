@@ -1,15 +1,17 @@
 #!/usr/bin/env python
 
 import argparse
+import contextlib
 import enum
 import logging
 import os
 import sys
+import tempfile
 import typing
 
-import numpy as np
+import cloud_fits
 
-from cloud_fits import exceptions, data_types, local_index, bucket_operations
+from cloud_fits import exceptions, data_types, local_index, bucket_operations, profiling
 
 class ScanMode(enum.Enum):
     Local: str = 'local'
@@ -31,10 +33,31 @@ Full s3://<bucket-name>/<data>/<path> to the contents
 """)
     options.add_argument('-m', '--mode', type=ScanMode, default=ScanMode.Local, help="""
 Scan an s3 bucket, local directory, or another resource to generate the Cloud Fits Index 
+""")
+    options.add_argument('-r', '--rebuild', action='store_true', default=False, help="""
+Ignore the manifest of the existing Cloud Fits Index and re-index every file. Without it, files whose size, mtime and
+header hash are unchanged are carried over, so a rewrite of the data alone that keeps all three needs --rebuild
+""")
+    options.add_argument('-s', '--shard-depth', type=int, default=0, help="""
+Split the Cloud Fits Index into shards keyed by the first N directories of each file, e.g. sector/camera/ccd
+""")
+    options.add_argument('--previews', type=str, choices=local_index.PREVIEW_METHODS, default=None, help="""
+Build preview pyramids of 2-D images binned by mean or max, uploaded to s3://<index-bucket-name>/previews
+""")
+    options.add_argument('-k', '--keywords', type=str, default=None, help="""
+Comma separated header keywords kept in the keyword table, e.g. CAMERA,CCD,EXPOSURE. Defaults to keyword_table.KEYWORDS
+""")
+    options.add_argument('--profile', type=str, default=None, help="""
+Write a report of cProfile stats, peak memory and time per phase to this file, the raw stats to <file>.prof
 """)
 
     return options.parse_args()
 
+@contextlib.contextmanager
+def _no_context() -> typing.Iterator[None]:
+    # contextlib.nullcontext is Python 3.7+
+    yield None
+
 def _validate_options(options: argparse.Namespace) -> None:
     if not options.data_bucket_path.startswith('s3://'):
         raise NotImplementedError('BucketPath input is not valid s3 path.')
@@ -42,21 +65,28 @@ def _validate_options(options: argparse.Namespace) -> None:
 def run_fits_index() -> None:
     options: argparse.Namespace = capture_options()
     _validate_options(options)
-    cloud_indices: typing.List[data_types.FitsFileCloudIndex] = []
-    if options.mode is ScanMode.Local:
-        for relative_path, fits_filepath in local_index.scan_for_all_fits_files(options):
-            logger.info(f'Scanning File[{fits_filepath}]')
-            cloud_indices.append(local_index.build_fits_cloud_index(relative_path, fits_filepath))
+    options.keywords = [keyword.strip().upper() for keyword in options.keywords.split(',')] if options.keywords else None
+    configuration: typing.Dict[str, typing.Any] = {}
+    if not options.rebuild:
+        configuration = bucket_operations.download_configuration(options.index_bucket_name) or {}
+
+    with tempfile.TemporaryDirectory() if options.previews else _no_context() as preview_directory:
+        options.preview_directory = preview_directory
+        options.preview_method = options.previews
+        if options.mode is ScanMode.Local:
+            cloud_indices, manifest = local_index.build_incremental_cloud_indices(options, configuration)
             logger.warn(f"Write logic that'll validate the size of the two files[local|remote] to be the same.")
-    else:
-        raise NotImplementedError
+        else:
+            raise NotImplementedError
 
-    bucket_operations.upload_index(options, cloud_indices)
+        bucket_operations.upload_index(options, cloud_indices, manifest)
 
 def run_from_cli() -> None:
+    cloud_fits.configure_logging()
     sys.path.append(os.getcwd())
     options = capture_options()
-    run_fits_index()
+    with profiling.profile(options.profile) if options.profile else _no_context():
+        run_fits_index()
 
 if __name__ == '__main__':
     run_from_cli()
@@ -0,0 +1,20 @@
+import importlib
+import sys
+import types
+import typing
+
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+
+class LazyModule(types.ModuleType):
+    # Stands in for a module until an attribute is first read. The real module's namespace is then copied in, so later
+    # lookups cost the same as on the real module
+    def __getattr__(self: PWN, name: str) -> typing.Any:
+        module: types.ModuleType = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, name)
+
+def lazy_import(name: str) -> types.ModuleType:
+    if name in sys.modules:
+        return sys.modules[name]
+
+    return LazyModule(name)
@@ -1,22 +1,37 @@
 import argparse
+import gzip
+import hashlib
+import logging
 import os
+import tempfile
 import types
 import typing
+import warnings
 import _io
 
-import numpy as np
+from cloud_fits import exceptions, data_types, profiling
+from cloud_fits.data_types import footprint, gzip_index, keyword_table, utils
+from cloud_fits.lazy_import import lazy_import
 
-from astropy.io import fits
-
-from cloud_fits import exceptions, data_types
+fits = lazy_import('astropy.io.fits')
+np = lazy_import('numpy')
 
 BLOCK_SIZE: int = 2880
+# Gzip compressed files are inflated once while indexing, see cloud_fits.data_types.gzip_index
+GZIP_SUFFIX: str = '.fits.gz'
 END_CARD: bytes = b'END' + b' ' * 77
+# Rows summarised together in the bintable zone maps
+ZONE_MAP_ROWS: int = 1024
+# Preview pyramids halve 2-D images until the next level would be smaller than PREVIEW_MIN_SIZE pixels on a side
+PREVIEW_MIN_SIZE: int = 32
+PREVIEW_METHODS: typing.List[str] = ['mean', 'max']
+PREVIEW_SUFFIX: str = '.previews'
+logger = logging.getLogger(__name__)
 
 def scan_for_all_fits_files(options: argparse.Namespace) -> types.GeneratorType:
     for root, directories, filenames in os.walk(options.fits_files_directory):
         for filename in filenames:
-            if filename.endswith('.fits'):
+            if filename.endswith('.fits') or filename.endswith(GZIP_SUFFIX):
                 yield options.fits_files_directory, os.path.join(root, filename)
 
 def _load_header_rest(stream: _io.BufferedReader) -> typing.Tuple[typing.List[str], int]:
@@ -39,8 +54,30 @@ def _load_header_rest(stream: _io.BufferedReader) -> typing.Tuple[typing.List[st
     return header_parts, offset
 
 
-def build_fits_cloud_index(relative_path: str, fits_filepath: str) -> data_types.FitsFileIndex:
-    with open(fits_filepath, 'rb') as stream:
+def build_fits_cloud_index(
+    relative_path: str,
+    fits_filepath: str,
+    preview_directory: str = None,
+    preview_method: str = 'mean') -> data_types.FitsFileIndex:
+    cloud_filepath: str = build_cloud_filepath(relative_path, fits_filepath)
+    if not fits_filepath.endswith(GZIP_SUFFIX):
+        return _build_fits_file_index(cloud_filepath, fits_filepath, preview_directory, preview_method)
+
+    # Offsets in the index are uncompressed, the seek points map them back into the compressed file
+    with tempfile.TemporaryDirectory() as inflated_directory:
+        inflated_filepath: str = os.path.join(inflated_directory, os.path.basename(fits_filepath)[:-len('.gz')])
+        with profiling.phase('scan'), open(inflated_filepath, 'wb') as stream:
+            seek_index: typing.Dict[str, typing.Any] = gzip_index.build_seek_index(fits_filepath, stream)
+
+        return _build_fits_file_index(cloud_filepath, inflated_filepath, preview_directory, preview_method, seek_index)
+
+def _build_fits_file_index(
+    cloud_filepath: str,
+    fits_filepath: str,
+    preview_directory: str = None,
+    preview_method: str = 'mean',
+    seek_index: typing.Dict[str, typing.Any] = None) -> data_types.FitsFileIndex:
+    with profiling.phase('scan'), open(fits_filepath, 'rb') as stream:
         header_offset: int = None
         header_length: int = None
         data_offset: int = None
@@ -119,7 +156,288 @@ def build_fits_cloud_index(relative_path: str, fits_filepath: str) -> data_types
                 data_stop,
                 previous_header_whole))
 
-    fits_filename: str = os.path.basename(fits_filepath)
+    with profiling.phase('summarise'):
+        attach_table_summaries(fits_filepath, headers)
+
+    if not preview_directory is None:
+        with profiling.phase('previews'):
+            attach_previews(fits_filepath, headers, preview_directory, cloud_filepath, preview_method)
+
+    fits_filename: str = os.path.basename(cloud_filepath)
     index_name: str = fits_filename.split('.', 1)[0]
-    cloud_filepath: str = fits_filepath.replace(relative_path, '').strip('/')
-    return data_types.FitsFileIndex(cloud_filepath, fits_filename, index_name, headers)
+    return data_types.FitsFileIndex(cloud_filepath, fits_filename, index_name, headers, seek_index)
+
+def _read_cadence_times(table: 'fits.BinTableHDU') -> typing.Tuple['np.ndarray', 'np.ndarray']:
+    starts: np.ndarray = np.asarray(table.data['TSTART'], dtype='<f8')
+    if 'TSTOP' in table.columns.names:
+        return starts, np.asarray(table.data['TSTOP'], dtype='<f8')
+
+    # Without TSTOP a cadence lasts until the next one starts
+    spacing: float = float(np.nanmedian(np.diff(starts))) if len(starts) > 1 else 0
+    return starts, np.append(starts[1:], starts[-1] + spacing)
+
+def _attach_time_axes(hdu_list: 'fits.HDUList', headers: typing.List[data_types.FitsFileHeader], tables: typing.List[int]) -> None:
+    # TESS cubes pair the image cube with a bintable of per cadence TSTART/TSTOP. The image axis with as many
+    # frames as the table has rows becomes the time axis
+    for table_idx in tables:
+        if not 'TSTART' in hdu_list[table_idx].columns.names:
+            continue
+
+        starts, stops = _read_cadence_times(hdu_list[table_idx])
+        for header in headers:
+            if header.as_fits.get('XTENSION', '').strip().upper() != 'IMAGE' or not header.datum_shape:
+                continue
+
+            axes: typing.List[int] = [axis for axis, size in enumerate(header.datum_shape) if size == len(starts)]
+            if len(axes) != 1:
+                logger.warning(f'Unable to find the time axis of Shape[{header.datum_shape}] in File[{hdu_list.filename()}]')
+                continue
+
+            header.time_axis = {
+                'axis': axes[0],
+                'start': utils.pack_float_array(starts),
+                'stop': utils.pack_float_array(stops),
+            }
+
+def _build_zone_map(table: 'fits.BinTableHDU') -> typing.Dict[str, typing.Any]:
+    # Per row group min/max and null count of every scalar numeric column, integer columns also keep the OR of
+    # their values so flag tests can skip row groups. Integer bounds are kept as exact ints, None for a group without
+    # valid rows, since float64 rounds above 2**53
+    row_count: int = len(table.data)
+    group_starts: typing.List[int] = list(range(0, row_count, ZONE_MAP_ROWS))
+    columns: typing.Dict[str, typing.Dict[str, str]] = {}
+    for column in table.columns:
+        values: np.ndarray = np.asarray(table.data[column.name])
+        if values.ndim != 1 or not values.dtype.kind in 'biuf':
+            continue
+
+        nulls: np.ndarray = np.isnan(values) if values.dtype.kind == 'f' else np.zeros(row_count, dtype=bool)
+        if values.dtype.kind in 'iu' and not column.null is None:
+            nulls = values == column.null
+
+        integer: bool = values.dtype.kind in 'biu'
+        zone: typing.Dict[str, typing.List[typing.Any]] = {'min': [], 'max': [], 'nulls': []}
+        if integer:
+            zone['bits'] = []
+
+        for start in group_starts:
+            group: np.ndarray = values[start:start + ZONE_MAP_ROWS]
+            group_nulls: np.ndarray = nulls[start:start + ZONE_MAP_ROWS]
+            valid: np.ndarray = group[~group_nulls]
+            if len(valid) == 0:
+                zone['min'].append(None if integer else np.nan)
+                zone['max'].append(None if integer else np.nan)
+
+            elif integer:
+                zone['min'].append(int(valid.min()))
+                zone['max'].append(int(valid.max()))
+
+            else:
+                zone['min'].append(valid.min())
+                zone['max'].append(valid.max())
+
+            zone['nulls'].append(int(group_nulls.sum()))
+            if 'bits' in zone:
+                zone['bits'].append(int(np.bitwise_or.reduce(valid.astype(np.int64))) if len(valid) else 0)
+
+        columns[column.name] = {
+            'min': zone['min'] if integer else utils.pack_float_array(zone['min']),
+            'max': zone['max'] if integer else utils.pack_float_array(zone['max']),
+            'nulls': utils.pack_int_array(zone['nulls']),
+        }
+        if 'bits' in zone:
+            columns[column.name]['bits'] = utils.pack_int_array(zone['bits'])
+
+    return {'rows': ZONE_MAP_ROWS, 'columns': columns}
+
+def attach_table_summaries(fits_filepath: str, headers: typing.List[data_types.FitsFileHeader]) -> None:
+    tables: typing.List[int] = [idx for idx, header in enumerate(headers)
+        if header.as_fits.get('XTENSION', '').strip().upper() == 'BINTABLE']
+    if len(tables) == 0:
+        return None
+
+    with fits.open(fits_filepath, memmap=True) as hdu_list:
+        _attach_time_axes(hdu_list, headers, tables)
+        for table_idx in tables:
+            headers[table_idx].zone_map = _build_zone_map(hdu_list[table_idx])
+
+def _bin_preview_level(data: 'np.ndarray', method: str) -> 'np.ndarray':
+    # 2x2 blocks, a trailing odd row or column is dropped. Blocks that are all NaN stay NaN
+    rows, columns = data.shape[0] // 2 * 2, data.shape[1] // 2 * 2
+    blocks: np.ndarray = data[:rows, :columns].reshape(rows // 2, 2, columns // 2, 2)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return (np.nanmean if method == 'mean' else np.nanmax)(blocks, axis=(1, 3)).astype(np.float32)
+
+def build_preview_pyramid(data: 'np.ndarray', method: str = 'mean') -> typing.List['np.ndarray']:
+    if not method in PREVIEW_METHODS:
+        raise NotImplementedError(f'Preview Method[{method}] Not supported yet')
+
+    levels: typing.List[np.ndarray] = []
+    level: np.ndarray = np.asarray(data, dtype=np.float32)
+    while min(level.shape) // 2 >= PREVIEW_MIN_SIZE:
+        level = _bin_preview_level(level, method)
+        levels.append(level)
+
+    return levels
+
+def attach_previews(
+    fits_filepath: str,
+    headers: typing.List[data_types.FitsFileHeader],
+    preview_directory: str,
+    cloud_filepath: str,
+    method: str = 'mean') -> None:
+    # Every 2-D image gets a sidecar FITS file of its levels, <cloudpath>.<hdu>.previews in preview_directory. The
+    # index records where the data of every level starts, so a preview is a single small range request
+    images: typing.List[int] = [idx for idx, header in enumerate(headers)
+        if header.as_fits.get('XTENSION', '').strip().upper() == 'IMAGE' and len(header.datum_shape or []) == 2]
+    if len(images) == 0:
+        return None
+
+    with fits.open(fits_filepath, memmap=True) as hdu_list:
+        for image_idx in images:
+            levels: typing.List[np.ndarray] = build_preview_pyramid(hdu_list[image_idx].data, method)
+            if len(levels) == 0:
+                continue
+
+            preview_path: str = f'{cloud_filepath}.{image_idx}{PREVIEW_SUFFIX}'
+            preview_filepath: str = os.path.join(preview_directory, preview_path)
+            os.makedirs(os.path.dirname(preview_filepath), exist_ok=True)
+            fits.HDUList([fits.PrimaryHDU()] + [fits.ImageHDU(level.astype('>f4')) for level in levels]).writeto(preview_filepath, overwrite=True)
+            with fits.open(preview_filepath) as preview_list:
+                offsets: typing.List[int] = [preview_list.fileinfo(level_idx + 1)['datLoc'] for level_idx in range(0, len(levels))]
+
+            headers[image_idx].preview = {
+                'path': preview_path,
+                'method': method,
+                'levels': [{
+                    'factor': 2 ** (level_idx + 1),
+                    'shape': list(level.shape),
+                    'offset': offset,
+                } for level_idx, (level, offset) in enumerate(zip(levels, offsets))],
+            }
+
+def build_cloud_filepath(relative_path: str, fits_filepath: str) -> str:
+    return fits_filepath.replace(relative_path, '').strip('/')
+
+def hash_fits_headers(fits_filepath: str) -> str:
+    # sha256 of the header blocks of every HDU, the data is skipped by the size its header gives. Gzip compressed files
+    # are inflated up to the last header
+    digest = hashlib.sha256()
+    with (gzip.open if fits_filepath.endswith(GZIP_SUFFIX) else open)(fits_filepath, 'rb') as stream:
+        while True:
+            header_parts: typing.List[bytes] = [stream.read(BLOCK_SIZE)]
+            # Padding or special records after the last HDU end the headers
+            if len(header_parts[-1]) < BLOCK_SIZE or not header_parts[-1][:8] in [b'SIMPLE  ', b'XTENSION']:
+                break
+
+            while not END_CARD in [header_parts[-1][idx:idx + 80] for idx in range(0, BLOCK_SIZE, 80)]:
+                header_parts.append(stream.read(BLOCK_SIZE))
+                if len(header_parts[-1]) < BLOCK_SIZE:
+                    raise NotImplementedError(f'Invalid FITS file')
+
+            header: bytes = b''.join(header_parts)
+            digest.update(header)
+            axes: typing.List[int] = [utils.read_header_card(header, f'NAXIS{idx}')
+                for idx in range(1, (utils.read_header_card(header, 'NAXIS') or 0) + 1)]
+            # Random groups record NAXIS1 = 0
+            if axes and axes[0] == 0 and utils.read_header_card(header, 'GROUPS') is True:
+                axes = axes[1:]
+
+            data_length: int = 0
+            if axes:
+                data_length = abs(utils.read_header_card(header, 'BITPIX')) // 8 * (utils.read_header_card(header, 'GCOUNT') or 1) * (
+                    (utils.read_header_card(header, 'PCOUNT') or 0) + int(np.prod(axes)))
+
+            stream.seek(data_length + -data_length % BLOCK_SIZE, os.SEEK_CUR)
+
+    return digest.hexdigest()
+
+def build_manifest_entry(fits_filepath: str) -> typing.Dict[str, typing.Any]:
+    # Files with the same size and mtime are only re-scanned when their headers changed, rewrites of the data alone
+    # that keep both aren't detected, see cloud-fits-index --rebuild
+    stat: os.stat_result = os.stat(fits_filepath)
+    return {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'header-hash': hash_fits_headers(fits_filepath),
+    }
+
+def _manifest_entry_is_current(fits_filepath: str, entry: typing.Dict[str, typing.Any]) -> bool:
+    stat: os.stat_result = os.stat(fits_filepath)
+    if entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+        return False
+
+    return entry.get('header-hash', None) == hash_fits_headers(fits_filepath)
+
+def _is_missing_previews(index: typing.Dict[str, typing.Any], preview_method: str) -> bool:
+    # 2-D images large enough for a pyramid, without one binned by preview_method, e.g. indexed without --previews
+    for header in index['headers']:
+        shape: typing.List[int] = header['data'].get('shape', None) or []
+        if str(utils.read_header_card(header['header']['whole'], 'XTENSION') or '').upper() != 'IMAGE' or len(shape) != 2:
+            continue
+
+        if min(shape) // 2 >= PREVIEW_MIN_SIZE and header.get('preview', {}).get('method', None) != preview_method:
+            return True
+
+    return False
+
+def build_incremental_cloud_indices(
+    options: argparse.Namespace,
+    configuration: typing.Dict[str, typing.Any]) -> typing.Tuple[typing.List[data_types.FitsFileIndex], typing.Dict[str, typing.Any]]:
+    # Files whose size and mtime match the manifest of the previous index are carried over without being
+    # re-read, unless previews are requested and they have none. Files that no longer exist on disk aren't scanned,
+    # which drops them from the merged index
+    preview_method: typing.Optional[str] = None
+    if not getattr(options, 'preview_directory', None) is None:
+        preview_method = getattr(options, 'preview_method', 'mean')
+
+    previous_indices: typing.Dict[str, typing.Any] = {
+        index['cloudpath']: index for index in configuration.get('indicies', [])}
+    previous_manifest: typing.Dict[str, typing.Any] = configuration.get('manifest', {})
+    cloud_indices: typing.List[data_types.FitsFileIndex] = []
+    manifest: typing.Dict[str, typing.Any] = {}
+    for relative_path, fits_filepath in scan_for_all_fits_files(options):
+        cloud_filepath: str = build_cloud_filepath(relative_path, fits_filepath)
+        entry: typing.Dict[str, typing.Any] = previous_manifest.get(cloud_filepath, None)
+        if entry and cloud_filepath in previous_indices and _manifest_entry_is_current(fits_filepath, entry) and not (
+                preview_method and _is_missing_previews(previous_indices[cloud_filepath], preview_method)):
+            cloud_indices.append(data_types.FitsFileIndex.from_index(previous_indices[cloud_filepath]))
+            manifest[cloud_filepath] = entry
+            continue
+
+        logger.info(f'Scanning File[{fits_filepath}]')
+        cloud_index: data_types.FitsFileIndex = build_fits_cloud_index(relative_path, fits_filepath,
+            getattr(options, 'preview_directory', None), preview_method or 'mean')
+        cloud_indices.append(cloud_index)
+        manifest[cloud_filepath] = build_manifest_entry(fits_filepath)
+
+    logger.info(f'Indexed Files[{len(manifest)}], Removed Files[{len(set(previous_manifest) - set(manifest))}]')
+    return cloud_indices, manifest
+
+def build_local_configuration(
+    fits_files_directory: str,
+    preview_directory: str = None,
+    preview_method: str = 'mean',
+    keywords: typing.List[str] = None) -> typing.Dict[str, typing.Any]:
+    # Indexes a local directory in memory, the data is read straight from disk. Previews are written to preview_directory
+    fits_files_directory = os.path.abspath(fits_files_directory)
+    options = argparse.Namespace(
+        fits_files_directory=fits_files_directory, preview_directory=preview_directory, preview_method=preview_method)
+    cloud_indices, manifest = build_incremental_cloud_indices(options, {})
+    configuration: typing.Dict[str, typing.Any] = {
+        'version': '0.1.0',
+        'aws-default-region': os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'),
+        'index-bucket-name': None,
+        'data-bucket-path': f'file://{fits_files_directory}',
+        'indicies': [cloud_index.index for cloud_index in cloud_indices],
+    }
+    configuration['footprints'] = footprint.build_footprint_index(configuration['indicies'])
+    configuration['keywords'] = keyword_table.build_keyword_table(configuration['indicies'], keywords or keyword_table.KEYWORDS)
+    if not preview_directory is None:
+        configuration['previews-path'] = f'file://{os.path.abspath(preview_directory)}'
+
+    return configuration
+
+def build_local_catalog(fits_files_directory: str) -> data_types.FitsCloudCatalog:
+    return data_types.FitsCloudCatalog(build_local_configuration(fits_files_directory), lambda shard_key: None)
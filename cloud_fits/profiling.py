@@ -0,0 +1,122 @@
+import contextlib
+import io
+import logging
+import threading
+import time
+import typing
+
+from cloud_fits.lazy_import import lazy_import
+
+cProfile = lazy_import('cProfile')
+pstats = lazy_import('pstats')
+tracemalloc = lazy_import('tracemalloc')
+
+# Opt-in profiling of the indexing and cutout paths. Library code wraps its phases in `phase(name)`, which does nothing
+# unless a `profile()` block is active. Phases nest, e.g. assemble and decode run inside fetch when streaming, and sign
+# runs inside every request. cProfile only follows the thread that opened the block, phase times come from every thread
+PHASES: typing.List[str] = ['scan', 'summarise', 'previews', 'plan', 'sign', 'fetch', 'assemble', 'decode']
+REPORT_STATS_LIMIT: int = 40
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+logger = logging.getLogger(__name__)
+
+class Profile:
+    def __init__(self: PWN, report_filepath: str = None, memory: bool = True) -> None:
+        self.report_filepath = report_filepath
+        self.memory = memory
+        self.seconds: float = None
+        self.peak_memory: int = None
+        self.phases: typing.Dict[str, typing.Dict[str, float]] = {}
+        self.stats: 'pstats.Stats' = None
+        self._profiler: 'cProfile.Profile' = None
+        self._lock = threading.Lock()
+
+    def record(self: PWN, name: str, seconds: float) -> None:
+        with self._lock:
+            timing: typing.Dict[str, float] = self.phases.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            timing['seconds'] = timing['seconds'] + seconds
+            timing['calls'] = timing['calls'] + 1
+
+    def as_dict(self: PWN) -> typing.Dict[str, typing.Any]:
+        return {
+            'seconds': self.seconds,
+            'peak-memory': self.peak_memory,
+            'phases': {name: dict(timing) for name, timing in self.phases.items()},
+        }
+
+    def report(self: PWN) -> str:
+        lines: typing.List[str] = [f'Wall Time[{self.seconds:.6f}s] Peak Memory[{self.peak_memory} bytes]', '']
+        lines.append(f'{"Phase":<12} {"Seconds":>12} {"Calls":>8}')
+        names: typing.List[str] = [name for name in PHASES if name in self.phases]
+        for name in names + sorted(set(self.phases) - set(names)):
+            lines.append(f'{name:<12} {self.phases[name]["seconds"]:>12.6f} {self.phases[name]["calls"]:>8}')
+
+        if not self.stats is None:
+            stream = io.StringIO()
+            self.stats.stream = stream
+            self.stats.sort_stats('cumulative').print_stats(REPORT_STATS_LIMIT)
+            lines.extend(['', stream.getvalue()])
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self: PWN, report_filepath: str) -> str:
+        # The text report and a .prof file of the raw stats, e.g. for `python -m pstats` or snakeviz
+        with open(report_filepath, 'w') as stream:
+            stream.write(self.report())
+
+        if not self.stats is None:
+            self.stats.dump_stats(f'{report_filepath}.prof')
+
+        return report_filepath
+
+ACTIVE: typing.Optional[Profile] = None
+
+@contextlib.contextmanager
+def profile(report_filepath: str = None, memory: bool = True) -> typing.Iterator[Profile]:
+    # with profiling.profile('/tmp/cutout-report.txt') as report: header[0:10, 0:10, 0:100, 0]
+    global ACTIVE
+    if not ACTIVE is None:
+        raise NotImplementedError(f'Nested profiles Not supported yet')
+
+    active: Profile = Profile(report_filepath, memory)
+    started_tracing: bool = memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+
+    # tracemalloc.reset_peak is Python 3.9+, earlier versions report the peak since tracing started
+    if memory and hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+
+    active._profiler = cProfile.Profile()
+    ACTIVE = active
+    start: float = time.perf_counter()
+    active._profiler.enable()
+    try:
+        yield active
+
+    finally:
+        active._profiler.disable()
+        active.seconds = time.perf_counter() - start
+        ACTIVE = None
+        if memory:
+            active.peak_memory = tracemalloc.get_traced_memory()[1]
+
+        if started_tracing:
+            tracemalloc.stop()
+
+        active.stats = pstats.Stats(active._profiler, stream=io.StringIO())
+        if not report_filepath is None:
+            logger.info(f'Writing Profile[{active.write(report_filepath)}]')
+
+@contextlib.contextmanager
+def phase(name: str) -> typing.Iterator[None]:
+    active: typing.Optional[Profile] = ACTIVE
+    if active is None:
+        yield None
+        return None
+
+    start: float = time.perf_counter()
+    try:
+        yield None
+
+    finally:
+        active.record(name, time.perf_counter() - start)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+import argparse
+import collections
+import contextlib
+import http.server
+import logging
+import os
+import re
+import shutil
+import socketserver
+import threading
+import time
+import typing
+import uuid
+
+from email.utils import formatdate
+from urllib.parse import parse_qs, unquote, urlparse
+
+import cloud_fits
+
+# A small S3 stand-in serving a local directory, <directory>/<bucket-name>/<key>. It implements enough of the S3 API for
+# cloud-fits to be exercised without AWS: ranged GETs, conditional GETs, PUT, DELETE and multipart uploads
+ENCODING: str = 'utf-8'
+RANGE_PATTERN: typing.Pattern = re.compile(r'^bytes=(\d+)-(\d*)$')
+UPLOADS_DIRECTORY: str = '.cloud-fits-uploads'
+WRITE_SIZE: int = 64 * 1024
+PWN: typing.TypeVar = typing.TypeVar('PWN')
+logger = logging.getLogger(__name__)
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads: bool = True
+    # Parallel range fetches open many connections at once, the default backlog of 5 resets them
+    request_queue_size: int = 128
+
+class _StandInRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version: str = 'HTTP/1.1'
+
+    def log_message(self: PWN, format: str, *args: typing.Any) -> None:
+        logger.debug(format % args)
+
+    @property
+    def stand_in(self: PWN) -> 'StandInServer':
+        return self.server.stand_in
+
+    def _parse_path(self: PWN) -> typing.Tuple[str, typing.Dict[str, typing.List[str]]]:
+        url_parts = urlparse(self.path)
+        filepath: str = os.path.normpath(os.path.join(self.stand_in.directory, unquote(url_parts.path).lstrip('/')))
+        if not filepath.startswith(self.stand_in.directory):
+            raise NotImplementedError(f'Path[{self.path}] outside of Directory[{self.stand_in.directory}]')
+
+        return filepath, parse_qs(url_parts.query, keep_blank_values=True)
+
+    def _read_body(self: PWN) -> bytes:
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _send(self: PWN, status_code: int, body: bytes = b'', headers: typing.Dict[str, str] = {}) -> None:
+        self.stand_in.record(self.command, status_code, len(body))
+        with self.stand_in.in_flight():
+            time.sleep(self.stand_in.latency)
+            self.send_response(status_code)
+            for key, value in headers.items():
+                self.send_header(key, value)
+
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            for idx in range(0, len(body), WRITE_SIZE):
+                chunk: bytes = body[idx:idx + WRITE_SIZE]
+                self.wfile.write(chunk)
+                if self.stand_in.bandwidth:
+                    time.sleep(len(chunk) / self.stand_in.bandwidth)
+
+    def do_GET(self: PWN) -> None:
+        filepath, query = self._parse_path()
+        if not os.path.isfile(filepath):
+            return self._send(404)
+
+        stat: os.stat_result = os.stat(filepath)
+        headers: typing.Dict[str, str] = {
+            'ETag': f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+            'Last-Modified': formatdate(stat.st_mtime, usegmt=True),
+            'Accept-Ranges': 'bytes',
+        }
+        if self.headers.get('If-None-Match', None) == headers['ETag']:
+            return self._send(304, headers=headers)
+
+        range_match = RANGE_PATTERN.match(self.headers.get('Range', ''))
+        with open(filepath, 'rb') as stream:
+            if range_match is None:
+                return self._send(200, stream.read(), headers)
+
+            start: int = int(range_match.group(1))
+            stop: int = min(int(range_match.group(2) or stat.st_size - 1), stat.st_size - 1)
+            if start > stop:
+                return self._send(416, headers={'Content-Range': f'bytes */{stat.st_size}'})
+
+            stream.seek(start)
+            headers['Content-Range'] = f'bytes {start}-{stop}/{stat.st_size}'
+            return self._send(206, stream.read(stop - start + 1), headers)
+
+    def do_PUT(self: PWN) -> None:
+        filepath, query = self._parse_path()
+        body: bytes = self._read_body()
+        if 'uploadId' in query:
+            filepath = os.path.join(self.stand_in.directory, UPLOADS_DIRECTORY, query['uploadId'][0], query['partNumber'][0])
+            if not os.path.isdir(os.path.dirname(filepath)):
+                return self._send(404)
+
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, 'wb') as stream:
+            stream.write(body)
+
+        return self._send(200, headers={'ETag': f'"{uuid.uuid4().hex}"'})
+
+    def do_POST(self: PWN) -> None:
+        filepath, query = self._parse_path()
+        self._read_body()
+        if 'uploads' in query:
+            upload_id: str = uuid.uuid4().hex
+            os.makedirs(os.path.join(self.stand_in.directory, UPLOADS_DIRECTORY, upload_id))
+            return self._send(200, f'<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>'.encode(ENCODING))
+
+        elif 'uploadId' in query:
+            upload_directory: str = os.path.join(self.stand_in.directory, UPLOADS_DIRECTORY, query['uploadId'][0])
+            if not os.path.isdir(upload_directory):
+                return self._send(404)
+
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            with open(filepath, 'wb') as stream:
+                for part_number in sorted(os.listdir(upload_directory), key=int):
+                    with open(os.path.join(upload_directory, part_number), 'rb') as part_stream:
+                        shutil.copyfileobj(part_stream, stream)
+
+            shutil.rmtree(upload_directory)
+            return self._send(200, b'<CompleteMultipartUploadResult></CompleteMultipartUploadResult>')
+
+        return self._send(400)
+
+    def do_DELETE(self: PWN) -> None:
+        filepath, query = self._parse_path()
+        if 'uploadId' in query:
+            shutil.rmtree(os.path.join(self.stand_in.directory, UPLOADS_DIRECTORY, query['uploadId'][0]), ignore_errors=True)
+
+        elif os.path.isfile(filepath):
+            os.remove(filepath)
+
+        return self._send(204)
+
+class StandInServer:
+    def __init__(self: PWN, directory: str, host: str = '127.0.0.1', port: int = 0, latency: float = 0, bandwidth: int = 0) -> None:
+        # latency is seconds added to every response, bandwidth is bytes per second, 0 is unlimited
+        self.directory = os.path.abspath(directory)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.statistics: typing.Dict[str, int] = collections.Counter()
+        self._in_flight: int = 0
+        self._lock = threading.Lock()
+        self._server = _ThreadingHTTPServer((host, port), _StandInRequestHandler)
+        self._server.stand_in = self
+        self._thread: threading.Thread = None
+
+    @property
+    def endpoint(self: PWN) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def record(self: PWN, method: str, status_code: int, byte_count: int) -> None:
+        with self._lock:
+            self.statistics['requests'] += 1
+            self.statistics[f'requests-{method}'] += 1
+            self.statistics[f'status-{status_code}'] += 1
+            self.statistics['bytes-sent'] += byte_count
+
+    @contextlib.contextmanager
+    def in_flight(self: PWN) -> typing.Iterator[None]:
+        # Responses being sent at once, statistics['max-in-flight'] shows whether clients overlap their requests
+        with self._lock:
+            self._in_flight = self._in_flight + 1
+            self.statistics['max-in-flight'] = max(self.statistics['max-in-flight'], self._in_flight)
+
+        try:
+            yield None
+
+        finally:
+            with self._lock:
+                self._in_flight = self._in_flight - 1
+
+    def start(self: PWN) -> PWN:
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f'Serving Directory[{self.directory}] on Endpoint[{self.endpoint}]')
+        return self
+
+    def stop(self: PWN) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self: PWN) -> PWN:
+        return self.start()
+
+    def __exit__(self: PWN, *args: typing.Any) -> None:
+        self.stop()
+
+def capture_options() -> argparse.Namespace:
+    options = argparse.ArgumentParser()
+    options.add_argument('-f', '--fits-files-directory', type=str, required=True, help="""
+Directory served as <bucket-name>/<key>
+""")
+    options.add_argument('-p', '--port', type=int, default=9000)
+    options.add_argument('-l', '--latency', type=float, default=0, help="""
+Seconds added to every response
+""")
+    options.add_argument('-b', '--bandwidth', type=int, default=0, help="""
+Bytes per second per connection, 0 is unlimited
+""")
+    return options.parse_args()
+
+def run_from_cli() -> None:
+    cloud_fits.configure_logging()
+    options = capture_options()
+    server = StandInServer(options.fits_files_directory, port=options.port, latency=options.latency, bandwidth=options.bandwidth)
+    server._server.serve_forever()
+
+if __name__ == '__main__':
+    run_from_cli()
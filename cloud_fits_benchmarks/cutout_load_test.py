@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+import argparse
+import concurrent.futures
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import typing
+
+import requests
+
+REPO_DIRECTORY: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIRECTORY)
+
+from cloud_fits import cutout_server, data_types, local_index
+from cloud_fits.data_types import utils
+
+# Fires random cutout requests at cloud-fits-serve for the cubes in a local data directory. Without --endpoint the
+# server is started in process, so its shared cache and batching statistics are reported alongside the latencies
+
+def capture_options() -> argparse.Namespace:
+    options = argparse.ArgumentParser()
+    options.add_argument('-f', '--fits-files-directory', type=str, required=True)
+    options.add_argument('-e', '--endpoint', type=str, default=None, help="""
+A running cloud-fits-serve for the same --fits-files-directory, e.g. http://127.0.0.1:8080
+""")
+    options.add_argument('-n', '--requests', type=int, default=200)
+    options.add_argument('-c', '--concurrency', type=int, default=16)
+    options.add_argument('-s', '--size', type=int, default=16, help="""
+Pixels along each axis of a cutout
+""")
+    options.add_argument('-w', '--batch-window', type=float, default=cutout_server.BATCH_WINDOW)
+    options.add_argument('--seed', type=int, default=0)
+    options.add_argument('-o', '--output', type=str, default=None, help="""
+Write the JSON results to a file instead of stdout
+""")
+    return options.parse_args()
+
+def find_targets(configuration: typing.Dict[str, typing.Any]) -> typing.List[typing.Tuple[str, int, typing.List[int]]]:
+    # image__validate_fits_format only accepts cubes
+    targets: typing.List[typing.Tuple[str, int, typing.List[int]]] = []
+    for index in configuration['indicies']:
+        for hdu, header in enumerate(index['headers']):
+            naxis: int = utils.read_header_card(header['header']['whole'], 'NAXIS') or 0
+            if naxis > 2 and hdu > 0:
+                targets.append((index['cloudpath'], hdu, list(header['data']['shape'])))
+
+    return targets
+
+def build_view(shape: typing.List[int], size: int, generator: random.Random) -> str:
+    axis_views: typing.List[str] = []
+    for axis_size in shape:
+        length: int = min(size, axis_size)
+        start: int = generator.randint(0, axis_size - length)
+        axis_views.append(f'{start}:{start + length}')
+
+    return ','.join(axis_views)
+
+def request_cutout(session: requests.Session, endpoint: str, cloudpath: str, hdu: int, view: str) -> typing.Tuple[int, float]:
+    start: float = time.perf_counter()
+    response = session.get(f'{endpoint}/cutout', params={'path': cloudpath, 'hdu': hdu, 'view': view})
+    return response.status_code, time.perf_counter() - start
+
+def run_load_test(
+    endpoint: str,
+    targets: typing.List[typing.Tuple[str, int, typing.List[int]]],
+    request_count: int,
+    concurrency: int,
+    size: int,
+    seed: int = 0) -> typing.Dict[str, typing.Any]:
+    if len(targets) == 0:
+        raise NotImplementedError('No image cubes found to cut out')
+
+    generator = random.Random(seed)
+    plans: typing.List[typing.Tuple[str, int, str]] = []
+    for idx in range(0, request_count):
+        cloudpath, hdu, shape = generator.choice(targets)
+        plans.append((cloudpath, hdu, build_view(shape, size, generator)))
+
+    session = requests.Session()
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+    start: float = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda plan: request_cutout(session, endpoint, *plan), plans))
+
+    seconds: float = time.perf_counter() - start
+    latencies: typing.List[float] = sorted(latency for status_code, latency in results)
+    return {
+        'requests': request_count,
+        'errors': len([status_code for status_code, latency in results if status_code != 200]),
+        'seconds': seconds,
+        'requests-per-second': request_count / seconds,
+        'latency-p50': statistics.median(latencies),
+        'latency-p95': latencies[int(len(latencies) * .95) - 1],
+        'latency-max': latencies[-1],
+    }
+
+def run_from_cli() -> None:
+    options = capture_options()
+    configuration: typing.Dict[str, typing.Any] = local_index.build_local_configuration(options.fits_files_directory)
+    targets = find_targets(configuration)
+    if options.endpoint:
+        results = run_load_test(options.endpoint, targets, options.requests, options.concurrency, options.size, options.seed)
+
+    else:
+        catalog = data_types.FitsCloudCatalog(configuration, lambda shard_key: None)
+        service = cutout_server.CutoutService(catalog, batch_window=options.batch_window)
+        with cutout_server.CutoutServer(service) as server:
+            results = run_load_test(server.endpoint, targets, options.requests, options.concurrency, options.size, options.seed)
+
+        results['server'] = dict(service.statistics)
+
+    results = json.dumps(results, indent=4, sort_keys=True)
+    if options.output is None:
+        print(results)
+
+    else:
+        with open(options.output, 'w') as stream:
+            stream.write(results)
+
+if __name__ == '__main__':
+    run_from_cli()
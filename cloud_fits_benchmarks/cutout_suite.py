@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+
+import numpy as np
+import yaml
+
+from astropy.io import fits
+
+REPO_DIRECTORY: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIRECTORY)
+
+from cloud_fits import data_types, local_index, stand_in_server
+
+# Generates TESS shaped cubes, (rows, columns, cadences, [flux, flux_err]) paired with a per cadence bintable, serves
+# them from cloud_fits.stand_in_server and times the read paths. Results are JSON so runs can be diffed across commits
+BUCKET_NAME: str = 'cloud-fits-benchmarks'
+CREDENTIALS: str = '[default]\naws_access_key_id = cloud-fits\naws_secret_access_key = cloud-fits\nregion = us-east-1\n'
+
+def capture_options() -> argparse.Namespace:
+    options = argparse.ArgumentParser()
+    options.add_argument('-c', '--cubes', type=int, default=4)
+    options.add_argument('-s', '--cube-shape', type=int, nargs=4, default=[64, 64, 200, 2], help="""
+Rows, columns, cadences and values per cadence of every cube
+""")
+    options.add_argument('-p', '--stamp-size', type=int, default=4, help="""
+Pixels along the row and column axes of the cutouts, every pixel is a byte range
+""")
+    options.add_argument('-r', '--repeat', type=int, default=5)
+    options.add_argument('-l', '--latency', type=float, default=0, help="""
+Seconds the stand-in adds to every response
+""")
+    options.add_argument('-b', '--bandwidth', type=int, default=0, help="""
+Bytes per second per connection, 0 is unlimited
+""")
+    options.add_argument('-o', '--output', type=str, default=None, help="""
+Write the JSON results to a file instead of stdout
+""")
+    options.add_argument('--compare', type=str, default=None, help="""
+Previous JSON results to print the median time ratios against
+""")
+    return options.parse_args()
+
+def generate_dataset(directory: str, cubes: int, cube_shape: typing.List[int]) -> typing.List[str]:
+    generator = np.random.default_rng(0)
+    rows, columns, cadences, values = cube_shape
+    filepaths: typing.List[str] = []
+    for idx in range(0, cubes):
+        starts = 1325.0 + np.arange(cadences) / 48
+        bintable = fits.BinTableHDU.from_columns([
+            fits.Column(name='TSTART', format='D', array=starts),
+            fits.Column(name='TSTOP', format='D', array=starts + 1 / 48),
+            fits.Column(name='QUALITY', format='J', array=np.where(generator.random(cadences) < .01, 128, 0)),
+        ])
+        cube = fits.ImageHDU(generator.random((rows, columns, cadences, values), dtype=np.float32).astype('>f4'))
+        filepath: str = os.path.join(directory, f'cube-{idx}.fits')
+        fits.HDUList([fits.PrimaryHDU(), cube, bintable]).writeto(filepath)
+        filepaths.append(filepath)
+
+    return filepaths
+
+@contextlib.contextmanager
+def stand_in_environment(directory: str, latency: float, bandwidth: int) -> typing.Iterator[stand_in_server.StandInServer]:
+    # The request signer reads ~/.aws/credentials
+    home_directory: str = os.path.join(directory, 'home')
+    os.makedirs(os.path.join(home_directory, '.aws'), exist_ok=True)
+    with open(os.path.join(home_directory, '.aws', 'credentials'), 'w') as stream:
+        stream.write(CREDENTIALS)
+
+    environment: typing.Dict[str, typing.Optional[str]] = {key: os.environ.get(key, None) for key in ['HOME', 'CLOUD_FITS_S3_ENDPOINT']}
+    with stand_in_server.StandInServer(os.path.join(directory, 'buckets'), latency=latency, bandwidth=bandwidth) as server:
+        os.environ['HOME'] = home_directory
+        os.environ['CLOUD_FITS_S3_ENDPOINT'] = server.endpoint
+        try:
+            yield server
+
+        finally:
+            for key, value in environment.items():
+                if value is None:
+                    os.environ.pop(key, None)
+
+                else:
+                    os.environ[key] = value
+
+def build_configuration(data_directory: str) -> typing.Dict[str, typing.Any]:
+    options = argparse.Namespace(fits_files_directory=data_directory)
+    cloud_indices, manifest = local_index.build_incremental_cloud_indices(options, {})
+    return {
+        'version': '0.1.0',
+        'aws-default-region': 'us-east-1',
+        'index-bucket-name': BUCKET_NAME,
+        'data-bucket-path': f's3://{BUCKET_NAME}/data',
+        'indicies': [cloud_index.index for cloud_index in cloud_indices],
+    }
+
+def measure(
+    server: stand_in_server.StandInServer,
+    operation: typing.Callable[[], typing.Any],
+    repeat: int) -> typing.Dict[str, typing.Any]:
+    seconds: typing.List[float] = []
+    requests_sent: typing.List[int] = []
+    bytes_sent: typing.List[int] = []
+    for idx in range(0, repeat):
+        previous: typing.Dict[str, int] = dict(server.statistics)
+        start: float = time.perf_counter()
+        operation()
+        seconds.append(time.perf_counter() - start)
+        requests_sent.append(server.statistics['requests'] - previous.get('requests', 0))
+        bytes_sent.append(server.statistics['bytes-sent'] - previous.get('bytes-sent', 0))
+
+    return {
+        'median-seconds': statistics.median(seconds),
+        'min-seconds': min(seconds),
+        'requests': max(requests_sent),
+        'bytes': max(bytes_sent),
+    }
+
+def run_suite(
+    directory: str,
+    cubes: int = 4,
+    cube_shape: typing.List[int] = [64, 64, 200, 2],
+    stamp_size: int = 4,
+    repeat: int = 5,
+    latency: float = 0,
+    bandwidth: int = 0) -> typing.Dict[str, typing.Any]:
+    data_directory: str = os.path.join(directory, 'buckets', BUCKET_NAME, 'data')
+    os.makedirs(data_directory)
+    generate_dataset(data_directory, cubes, cube_shape)
+    rows, columns, cadences, values = cube_shape
+    row, column = rows // 2, columns // 2
+    stamp: typing.Tuple[slice, slice] = (slice(row, row + stamp_size), slice(column, column + stamp_size))
+    # The middle half of the cadences
+    window: typing.Tuple[float, float] = (1325.0 + cadences / 4 / 48, 1325.0 + cadences * 3 / 4 / 48)
+    results: typing.Dict[str, typing.Any] = {}
+    with stand_in_environment(directory, latency, bandwidth) as server:
+        start: float = time.perf_counter()
+        configuration: typing.Dict[str, typing.Any] = build_configuration(data_directory)
+        results['index-build'] = {'median-seconds': time.perf_counter() - start, 'files': cubes}
+        document: str = yaml.dump(configuration)
+        results['index-load'] = measure(server, lambda: data_types.FitsCloudIndex(yaml.load(document, Loader=yaml.FullLoader)), repeat)
+        results['index-load']['bytes'] = len(document)
+
+        index = data_types.FitsCloudIndex(configuration)
+        cube, table = index.headers[1], index.headers[2]
+        cases: typing.Dict[str, typing.Callable[[], typing.Any]] = {
+            'cutout-stamp': lambda: cube[stamp + (slice(0, cadences), slice(0, values))],
+            'cutout-light-curve': lambda: cube[row:row + 1, column:column + 1, 0:cadences, 0:values],
+            'cutout-frame': lambda: cube[stamp + (slice(cadences // 2, cadences // 2 + 1), slice(0, values))],
+            'time-slice': lambda: cube.time_slice(window[0], window[1], stamp + (slice(None), slice(0, values))),
+            'bintable-slice': lambda: table[0:cadences // 2],
+            'bintable-where': lambda: table.where('QUALITY', '&', 128),
+        }
+        for name, operation in cases.items():
+            results[name] = measure(server, operation, repeat)
+
+    return results
+
+def describe_environment() -> typing.Dict[str, typing.Any]:
+    process = subprocess.run(['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, cwd=REPO_DIRECTORY)
+    return {
+        'commit': process.stdout.decode('utf-8').strip() or None,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+    }
+
+def compare(results: typing.Dict[str, typing.Any], previous: typing.Dict[str, typing.Any]) -> typing.List[str]:
+    lines: typing.List[str] = []
+    for name, result in sorted(results['results'].items()):
+        if not name in previous['results']:
+            continue
+
+        ratio: float = result['median-seconds'] / max(previous['results'][name]['median-seconds'], 1e-9)
+        lines.append(f'{name:<24} {ratio:>8.2f}x  requests {previous["results"][name].get("requests")} -> {result.get("requests")}')
+
+    return lines
+
+def run_from_cli() -> None:
+    options = capture_options()
+    with tempfile.TemporaryDirectory() as directory:
+        results: typing.Dict[str, typing.Any] = {
+            'environment': describe_environment(),
+            'parameters': {
+                'cubes': options.cubes,
+                'cube-shape': options.cube_shape,
+                'stamp-size': options.stamp_size,
+                'repeat': options.repeat,
+                'latency': options.latency,
+                'bandwidth': options.bandwidth,
+            },
+            'results': run_suite(
+                directory, options.cubes, options.cube_shape, options.stamp_size, options.repeat, options.latency, options.bandwidth),
+        }
+
+    if options.compare:
+        with open(options.compare, 'r') as stream:
+            sys.stderr.write('\n'.join(compare(results, json.load(stream))) + '\n')
+
+    output: str = json.dumps(results, indent=4, sort_keys=True)
+    if options.output is None:
+        print(output)
+
+    else:
+        with open(options.output, 'w') as stream:
+            stream.write(output)
+
+if __name__ == '__main__':
+    run_from_cli()
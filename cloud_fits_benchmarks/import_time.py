@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import typing
+
+# Tracks `python -X importtime` for the modules AWS Lambda style callers import first
+ENTRY_POINTS: typing.List[str] = [
+    'cloud_fits',
+    'cloud_fits.data_types',
+    'cloud_fits.data_types.utils',
+    'cloud_fits.bucket_operations',
+    'cloud_fits.local_index',
+    'cloud_fits.fits_index.factory',
+]
+HEAVY_MODULES: typing.List[str] = ['astropy', 'numpy', 'requests', 'yaml']
+REPO_DIRECTORY: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def capture_options() -> argparse.Namespace:
+    options = argparse.ArgumentParser()
+    options.add_argument('-r', '--repeat', type=int, default=5)
+    options.add_argument('-o', '--output', type=str, default=None, help="""
+Write the JSON results to a file instead of stdout
+""")
+    return options.parse_args()
+
+def measure_import(module_name: str) -> typing.Dict[str, typing.Any]:
+    script: str = f'import sys, {module_name}; print(",".join(sorted(sys.modules)))'
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', script],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=REPO_DIRECTORY, check=True)
+
+    # import time: self [us] | cumulative | imported package, nested imports are indented by two spaces
+    cumulative_us: int = 0
+    for line in process.stderr.decode('utf-8').splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+
+        self_us, module_cumulative_us, name = line[len('import time:'):].split('|')
+        if name.startswith(' cloud_fits'):
+            cumulative_us = cumulative_us + int(module_cumulative_us)
+
+    modules: typing.List[str] = process.stdout.decode('utf-8').strip().split(',')
+    return {
+        'cumulative-us': cumulative_us,
+        'heavy-modules': [name for name in HEAVY_MODULES if name in modules],
+    }
+
+def run_benchmark(repeat: int = 5) -> typing.Dict[str, typing.Any]:
+    results: typing.Dict[str, typing.Any] = {}
+    for module_name in ENTRY_POINTS:
+        measurements = [measure_import(module_name) for idx in range(0, repeat)]
+        results[module_name] = {
+            'median-us': statistics.median([measurement['cumulative-us'] for measurement in measurements]),
+            'heavy-modules': measurements[0]['heavy-modules'],
+        }
+
+    return results
+
+def run_from_cli() -> None:
+    options = capture_options()
+    results: str = json.dumps(run_benchmark(options.repeat), indent=4, sort_keys=True)
+    if options.output is None:
+        print(results)
+
+    else:
+        with open(options.output, 'w') as stream:
+            stream.write(results)
+
+if __name__ == '__main__':
+    run_from_cli()
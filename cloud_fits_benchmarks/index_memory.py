@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+import argparse
+import copy
+import gc
+import json
+import os
+import sys
+import tempfile
+import timeit
+import tracemalloc
+import typing
+
+import numpy as np
+import yaml
+
+from astropy.io import fits
+
+REPO_DIRECTORY: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIRECTORY)
+
+from cloud_fits import data_types, local_index
+
+# Memory held per loaded HDU and the cost of the attributes the read paths look up on every cutout. Only public
+# attributes are used, so the script runs against older commits for a before and after
+ATTRIBUTES: typing.List[str] = ['data_offset', 'data_shape', 'data_strides', 'data_itemsize', 'dtype', 'header_whole']
+
+def capture_options() -> argparse.Namespace:
+    options = argparse.ArgumentParser()
+    options.add_argument('-f', '--files', type=int, default=200, help="""
+Files in the simulated catalog, every file is a primary HDU, a cube and a bintable
+""")
+    options.add_argument('-n', '--lookups', type=int, default=100000)
+    options.add_argument('-o', '--output', type=str, default=None, help="""
+Write the JSON results to a file instead of stdout
+""")
+    options.add_argument('--compare', type=str, default=None, help="""
+Previous JSON results to print the ratios against
+""")
+    return options.parse_args()
+
+def build_file_index(directory: str) -> typing.Dict[str, typing.Any]:
+    bintable = fits.BinTableHDU.from_columns([
+        fits.Column(name='TSTART', format='D', array=np.linspace(1325.0, 1326.0, 20)),
+        fits.Column(name='QUALITY', format='J', array=np.arange(20)),
+    ])
+    fits_filepath: str = os.path.join(directory, 'tess-cube.fits')
+    fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(np.zeros((8, 8, 20, 2), dtype='>f4')), bintable]).writeto(fits_filepath)
+    return local_index.build_fits_cloud_index(directory, fits_filepath).index
+
+def measure_memory(file_index: typing.Dict[str, typing.Any], files: int) -> typing.Dict[str, typing.Any]:
+    # Every file is loaded from YAML while tracing, what's left once the documents are dropped is held by the index
+    document: str = yaml.dump(file_index)
+    hdus: int = files * len(file_index['headers'])
+    gc.collect()
+    tracemalloc.start()
+    indices: typing.List[data_types.FitsCloudIndex] = []
+    for idx in range(0, files):
+        indices.append(data_types.FitsCloudIndex({
+            'version': '0.1.0',
+            'aws-default-region': 'us-east-1',
+            'index-bucket-name': None,
+            'data-bucket-path': 'file:///tmp',
+            'footprints': {},
+            'indicies': [yaml.load(document, Loader=yaml.FullLoader)],
+        }))
+
+    gc.collect()
+    held: int = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return {
+        'hdus': hdus,
+        'bytes-per-hdu': held / hdus,
+        # The header text is the same size in every representation
+        'header-text-bytes-per-hdu': sum(len(header['header']['whole']) for header in file_index['headers']) / len(file_index['headers']),
+    }
+
+def measure_lookups(file_index: typing.Dict[str, typing.Any], lookups: int) -> typing.Dict[str, float]:
+    header: data_types.FitsCloudIndexHeader = data_types.FitsCloudIndex({
+        'version': '0.1.0',
+        'aws-default-region': 'us-east-1',
+        'index-bucket-name': None,
+        'data-bucket-path': 'file:///tmp',
+        'footprints': {},
+        'indicies': [copy.deepcopy(file_index)],
+    }).headers[1]
+    return {
+        name: min(timeit.repeat(lambda: getattr(header, name), number=lookups, repeat=3)) / lookups * 1e9
+        for name in ATTRIBUTES}
+
+def run_benchmark(files: int = 200, lookups: int = 100000) -> typing.Dict[str, typing.Any]:
+    with tempfile.TemporaryDirectory() as directory:
+        file_index: typing.Dict[str, typing.Any] = build_file_index(directory)
+
+    return {
+        'parameters': {'files': files, 'lookups': lookups},
+        'memory': measure_memory(file_index, files),
+        'lookup-ns': measure_lookups(file_index, lookups),
+    }
+
+def compare(results: typing.Dict[str, typing.Any], previous: typing.Dict[str, typing.Any]) -> None:
+    print(f'{"Measurement":<40} {"Before":>12} {"After":>12} {"Ratio":>8}')
+    rows: typing.List[typing.Tuple[str, float, float]] = [
+        (f'memory {name}', previous['memory'][name], results['memory'][name])
+        for name in ['bytes-per-hdu', 'header-text-bytes-per-hdu']]
+    rows.extend([(f'lookup-ns {name}', previous['lookup-ns'][name], results['lookup-ns'][name]) for name in ATTRIBUTES])
+    for name, before, after in rows:
+        print(f'{name:<40} {before:>12.1f} {after:>12.1f} {after / before:>8.2f}')
+
+def run_from_cli() -> None:
+    options = capture_options()
+    results: typing.Dict[str, typing.Any] = run_benchmark(options.files, options.lookups)
+    if options.output is None:
+        print(json.dumps(results, indent=4, sort_keys=True))
+
+    else:
+        with open(options.output, 'w') as stream:
+            stream.write(json.dumps(results, indent=4, sort_keys=True))
+
+    if not options.compare is None:
+        with open(options.compare, 'r') as stream:
+            compare(results, json.load(stream))
+
+if __name__ == '__main__':
+    run_from_cli()
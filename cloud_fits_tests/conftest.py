@@ -0,0 +1,58 @@
+import os
+import typing
+
+import numpy as np
+import pytest
+
+from astropy.io import fits
+
+from cloud_fits import data_types, local_index
+
+def build_configuration(fits_directory: str, fits_filepath: str) -> typing.Dict[str, typing.Any]:
+    file_index = local_index.build_fits_cloud_index(fits_directory, fits_filepath)
+    return {
+        'version': '0.1.0',
+        'aws-default-region': 'us-east-1',
+        'indicies': [file_index.index],
+        'index-bucket-name': 'cloud-fits-tests',
+        'data-bucket-path': f'file://{fits_directory}',
+    }
+
+def build_cloud_index(fits_directory: str, fits_filepath: str) -> data_types.FitsCloudIndex:
+    return data_types.FitsCloudIndex(build_configuration(fits_directory, fits_filepath))
+
+@pytest.fixture
+def cube_filepath(tmp_path) -> str:
+    # A small TESS shaped cube, (rows, columns, cadences, [flux, flux_err])
+    data = np.arange(9 * 11 * 13 * 2, dtype='>f4').reshape(9, 11, 13, 2)
+    bintable = fits.BinTableHDU.from_columns([
+        fits.Column(name='TSTART', format='D', array=np.linspace(1325.0, 1326.0, 13)),
+        fits.Column(name='QUALITY', format='J', array=np.arange(13)),
+    ])
+    fits_filepath: str = os.path.join(tmp_path, 'tess-cube.fits')
+    fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(data), bintable]).writeto(fits_filepath)
+    return fits_filepath
+
+@pytest.fixture
+def cube_configuration(cube_filepath) -> typing.Dict[str, typing.Any]:
+    return build_configuration(os.path.dirname(cube_filepath), cube_filepath)
+
+@pytest.fixture
+def cube_index(cube_filepath) -> data_types.FitsCloudIndex:
+    return build_cloud_index(os.path.dirname(cube_filepath), cube_filepath)
+
+@pytest.fixture
+def s3_server(tmp_path, monkeypatch) -> typing.Any:
+    from cloud_fits import stand_in_server
+
+    home_directory: str = os.path.join(tmp_path, 'home')
+    os.makedirs(os.path.join(home_directory, '.aws'))
+    with open(os.path.join(home_directory, '.aws', 'credentials'), 'w') as stream:
+        stream.write('[default]\naws_access_key_id = cloud-fits\naws_secret_access_key = cloud-fits\nregion = us-east-1\n')
+
+    bucket_directory: str = os.path.join(tmp_path, 'buckets')
+    os.makedirs(bucket_directory)
+    monkeypatch.setenv('HOME', home_directory)
+    with stand_in_server.StandInServer(bucket_directory) as server:
+        monkeypatch.setenv('CLOUD_FITS_S3_ENDPOINT', server.endpoint)
+        yield server
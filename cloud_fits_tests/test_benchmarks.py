@@ -0,0 +1,38 @@
+import json
+import os
+import subprocess
+import sys
+
+REPO_DIRECTORY: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_cutout_suite_reports_every_case(tmp_path):
+    output: str = os.path.join(tmp_path, 'results.json')
+    command = [sys.executable, 'cloud_fits_benchmarks/cutout_suite.py', '-c', '1', '-s', '8', '8', '20', '2', '-p', '2', '-r', '1', '-o', output]
+    subprocess.run(command, cwd=REPO_DIRECTORY, check=True)
+    with open(output, 'r') as stream:
+        results = json.load(stream)
+
+    assert results['parameters']['cube-shape'] == [8, 8, 20, 2]
+    assert sorted(results['results']) == sorted([
+        'index-build', 'index-load', 'cutout-stamp', 'cutout-light-curve', 'cutout-frame', 'time-slice', 'bintable-slice',
+        'bintable-where'])
+    assert results['results']['cutout-light-curve']['requests'] == 1
+    assert results['results']['cutout-light-curve']['bytes'] == 20 * 2 * 4
+    assert results['results']['index-load']['requests'] == 0
+
+    subprocess.run(command[:-1] + [os.path.join(tmp_path, 'again.json'), '--compare', output], cwd=REPO_DIRECTORY, check=True)
+
+def test_index_memory_compares_against_a_previous_run(tmp_path):
+    output: str = os.path.join(tmp_path, 'results.json')
+    command = [sys.executable, 'cloud_fits_benchmarks/index_memory.py', '-f', '3', '-n', '100', '-o', output]
+    subprocess.run(command, cwd=REPO_DIRECTORY, check=True)
+    with open(output, 'r') as stream:
+        results = json.load(stream)
+
+    assert results['memory']['hdus'] == 9
+    assert results['memory']['header-text-bytes-per-hdu'] == 2880
+    assert sorted(results['lookup-ns']) == sorted(['data_offset', 'data_shape', 'data_strides', 'data_itemsize', 'dtype', 'header_whole'])
+
+    process = subprocess.run(command[:-1] + [os.path.join(tmp_path, 'again.json'), '--compare', output],
+        cwd=REPO_DIRECTORY, check=True, stdout=subprocess.PIPE)
+    assert b'lookup-ns dtype' in process.stdout
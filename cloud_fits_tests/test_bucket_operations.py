@@ -0,0 +1,181 @@
+import argparse
+import collections
+import os
+import shutil
+
+import pytest
+import yaml
+
+from cloud_fits import bucket_operations, exceptions, local_index
+
+@pytest.fixture
+def bucket(monkeypatch):
+    store = {}
+    def _put_yaml(bucket_name, key, body):
+        store[key] = yaml.dump(body)
+
+    def _get_yaml(bucket_name, key):
+        if not key in store:
+            return None
+
+        return yaml.load(store[key], Loader=yaml.FullLoader)
+
+    def _delete_key(bucket_name, key):
+        store.pop(key)
+
+    monkeypatch.setattr(bucket_operations, '_put_yaml', _put_yaml)
+    monkeypatch.setattr(bucket_operations, '_get_yaml', _get_yaml)
+    monkeypatch.setattr(bucket_operations, '_delete_key', _delete_key)
+    return store
+
+def test_sharded_catalog_loads_only_the_requested_shard(cube_filepath, bucket, monkeypatch):
+    fits_directory: str = os.path.dirname(cube_filepath)
+    for sector, camera in [('s0001', '1'), ('s0001', '2'), ('s0002', '1')]:
+        os.makedirs(os.path.join(fits_directory, sector, camera))
+        shutil.copy(cube_filepath, os.path.join(fits_directory, sector, camera, 'cube.fits'))
+
+    os.remove(cube_filepath)
+    options = argparse.Namespace(
+        fits_files_directory=fits_directory,
+        index_bucket_name='cloud-fits-tests',
+        data_bucket_path=f'file://{fits_directory}',
+        shard_depth=2)
+    cloud_indices, manifest = local_index.build_incremental_cloud_indices(options, {})
+    bucket_operations.upload_index(options, cloud_indices, manifest)
+    assert len(bucket) == 7
+    root = yaml.load(bucket[bucket_operations.INDEX_KEY], Loader=yaml.FullLoader)
+    assert not 'indicies' in root
+    assert not 'footprints' in root
+    assert root['footprints-key'] == bucket_operations.FOOTPRINTS_KEY
+    assert not 'keywords' in root
+    assert root['keywords-key'] == bucket_operations.KEYWORDS_KEY
+
+    loaded = []
+    _get_yaml = bucket_operations._get_yaml
+    def _record(bucket_name, key):
+        loaded.append(key)
+        return _get_yaml(bucket_name, key)
+
+    monkeypatch.setattr(bucket_operations, '_get_yaml', _record)
+    catalog = bucket_operations.download_catalog('cloud-fits-tests')
+    cloud_index = catalog['s0001/2/cube.fits']
+    assert catalog['s0001/2/cube.fits'] is cloud_index
+    assert cloud_index.headers[1].data_shape == (9, 11, 13, 2)
+    assert len(loaded) == 2
+    assert catalog.query(83.6, 22.0, 1.0) == []
+    assert loaded[2:] == [bucket_operations.FOOTPRINTS_KEY]
+    assert len(catalog.keywords.query(XTENSION='BINTABLE')) == 3
+    assert loaded[3:] == [bucket_operations.KEYWORDS_KEY]
+    with pytest.raises(exceptions.IndexException):
+        catalog['s0003/1/cube.fits']
+
+    configuration = bucket_operations.download_configuration('cloud-fits-tests')
+    assert sorted(configuration['manifest']) == ['s0001/1/cube.fits', 's0001/2/cube.fits', 's0002/1/cube.fits']
+
+    shutil.rmtree(os.path.join(fits_directory, 's0002'))
+    cloud_indices, manifest = local_index.build_incremental_cloud_indices(options, configuration)
+    bucket_operations.upload_index(options, cloud_indices, manifest)
+    assert len(bucket) == 6
+    assert not 's0002/1/cube.fits' in bucket_operations.download_catalog('cloud-fits-tests')
+
+def test_incremental_index_adds_and_removes_previews(tmp_path, bucket, monkeypatch):
+    from astropy.io import fits
+    import numpy as np
+
+    def _upload_previews(bucket_name, preview_directory):
+        for root, directories, filenames in os.walk(preview_directory):
+            for filename in filenames:
+                bucket[f'{bucket_operations.PREVIEWS_PREFIX}/{os.path.relpath(os.path.join(root, filename), preview_directory)}'] = ''
+
+    monkeypatch.setattr(bucket_operations, 'upload_previews', _upload_previews)
+    fits_directory: str = os.path.join(tmp_path, 'ffis')
+    os.makedirs(fits_directory)
+    for name in ['first', 'second']:
+        fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(np.ones((64, 64), dtype='>f4'))]).writeto(
+            os.path.join(fits_directory, f'{name}.fits'))
+
+    options = argparse.Namespace(
+        fits_files_directory=fits_directory,
+        index_bucket_name='cloud-fits-tests',
+        data_bucket_path=f'file://{fits_directory}')
+    cloud_indices, manifest = local_index.build_incremental_cloud_indices(options, {})
+    bucket_operations.upload_index(options, cloud_indices, manifest)
+    assert sorted(bucket) == [bucket_operations.INDEX_KEY]
+
+    # Unchanged files indexed without previews are scanned again once previews are requested
+    options.preview_directory = os.path.join(tmp_path, 'previews')
+    options.preview_method = 'max'
+    cloud_indices, manifest = local_index.build_incremental_cloud_indices(
+        options, bucket_operations.download_configuration('cloud-fits-tests'))
+    bucket_operations.upload_index(options, cloud_indices, manifest)
+    assert [index.index['headers'][1]['preview']['method'] for index in cloud_indices] == ['max', 'max']
+    assert yaml.load(bucket[bucket_operations.PREVIEW_LISTING_KEY], Loader=yaml.FullLoader) == {
+        'previews': ['first.fits.1.previews', 'second.fits.1.previews']}
+
+    os.remove(os.path.join(fits_directory, 'second.fits'))
+    shutil.rmtree(options.preview_directory)
+    cloud_indices, manifest = local_index.build_incremental_cloud_indices(
+        options, bucket_operations.download_configuration('cloud-fits-tests'))
+    bucket_operations.upload_index(options, cloud_indices, manifest)
+    assert not os.path.exists(options.preview_directory)
+    assert sorted(bucket) == sorted([
+        bucket_operations.INDEX_KEY, bucket_operations.PREVIEW_LISTING_KEY, 'previews/first.fits.1.previews'])
+
+class _Response:
+    def __init__(self, status_code, content=b'', headers={}):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+
+def test_index_cache_revalidates_with_etag(tmp_path, monkeypatch):
+    monkeypatch.setattr(bucket_operations, 'INDEX_CACHE_DIRECTORY', str(tmp_path))
+    requests_sent = []
+    def _get(url, headers={}, auth=None):
+        requests_sent.append(headers)
+        if headers.get('If-None-Match', None) == '"v1"':
+            return _Response(304)
+
+        return _Response(200, yaml.dump({'version': '0.1.0'}).encode('utf-8'), {'ETag': '"v1"'})
+
+    monkeypatch.setattr(bucket_operations.requests, 'get', _get)
+    assert bucket_operations._get_yaml('cloud-fits-tests', bucket_operations.INDEX_KEY) == {'version': '0.1.0'}
+    monkeypatch.setattr(bucket_operations.yaml, 'load', None)
+    assert bucket_operations._get_yaml('cloud-fits-tests', bucket_operations.INDEX_KEY) == {'version': '0.1.0'}
+    assert requests_sent == [{}, {'If-None-Match': '"v1"'}]
+    assert bucket_operations.ETAGS[bucket_operations._build_url('cloud-fits-tests', bucket_operations.INDEX_KEY)] == '"v1"'
+
+def test_only_recent_index_etags_are_kept(monkeypatch):
+    monkeypatch.setattr(bucket_operations, 'INDEX_CACHE_DIRECTORY', '')
+    monkeypatch.setattr(bucket_operations.requests, 'get', lambda url, headers={}, auth=None: _Response(
+        200, yaml.dump({'version': '0.1.0'}).encode('utf-8'), {'ETag': f'"{url}"'}))
+    monkeypatch.setattr(bucket_operations, 'ETAGS', collections.OrderedDict())
+    monkeypatch.setattr(bucket_operations, 'ETAGS_SIZE', 2)
+    for bucket_name in ['first', 'second', 'third']:
+        bucket_operations._get_yaml(bucket_name, bucket_operations.INDEX_KEY)
+        bucket_operations._get_yaml(bucket_name, bucket_operations.SHARD_LISTING_KEY)
+
+    assert list(bucket_operations.ETAGS) == [
+        bucket_operations._build_url(bucket_name, bucket_operations.INDEX_KEY) for bucket_name in ['second', 'third']]
+
+def test_upload_index_streams_multipart(cube_filepath, s3_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(bucket_operations, 'INDEX_CACHE_DIRECTORY', '')
+    monkeypatch.setattr(bucket_operations, 'UPLOAD_PART_SIZE', 4096)
+    os.makedirs(os.path.join(s3_server.directory, 'cloud-fits-tests'))
+    fits_directory: str = os.path.dirname(cube_filepath)
+    for idx in range(0, 8):
+        shutil.copy(cube_filepath, os.path.join(fits_directory, f'cube-{idx}.fits'))
+
+    options = argparse.Namespace(
+        fits_files_directory=fits_directory,
+        index_bucket_name='cloud-fits-tests',
+        data_bucket_path='s3://cloud-fits-tests/data')
+    cloud_indices, manifest = local_index.build_incremental_cloud_indices(options, {})
+    bucket_operations.upload_index(options, cloud_indices, manifest)
+    index_filepath: str = os.path.join(s3_server.directory, 'cloud-fits-tests', bucket_operations.INDEX_KEY)
+    assert os.path.getsize(index_filepath) > 4096 * 4
+    assert s3_server.statistics['requests-POST'] == 2
+    assert s3_server.statistics['requests-PUT'] == os.path.getsize(index_filepath) // 4096 + 1
+
+    configuration = bucket_operations.download_configuration('cloud-fits-tests')
+    assert configuration['manifest'] == manifest
+    assert configuration['indicies'] == [cloud_index.index for cloud_index in cloud_indices]
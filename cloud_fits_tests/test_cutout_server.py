@@ -0,0 +1,89 @@
+import gzip
+import io
+import os
+import shutil
+import threading
+
+import numpy as np
+import requests
+
+from astropy.io import fits
+
+from cloud_fits import cutout_server, data_types
+
+from conftest import build_configuration
+
+def test_parse_view():
+    assert cutout_server.parse_view('0:10,5:20:2,3,:') == (slice(0, 10), slice(5, 20, 2), 3, slice(None, None))
+
+def test_concurrent_cutouts_share_one_fetch(cube_filepath, s3_server):
+    fits_directory: str = os.path.dirname(cube_filepath)
+    os.makedirs(os.path.join(s3_server.directory, 'data'))
+    shutil.copy(cube_filepath, os.path.join(s3_server.directory, 'data', 'tess-cube.fits'))
+    configuration = build_configuration(fits_directory, cube_filepath)
+    configuration['data-bucket-path'] = 's3://data'
+    catalog = data_types.FitsCloudCatalog(configuration, lambda shard_key: None)
+    service = cutout_server.CutoutService(catalog, batch_window=.5)
+
+    views = ['0:3,0:11,0:13,0', '2:9,4:6,1:12,1', '5:6,0:11,3:4,0:2', '8:9,10:11,12:13,1']
+    source = fits.open(cube_filepath)[1].data
+    barrier = threading.Barrier(len(views))
+    responses = {}
+    def _request_cutout(endpoint, view):
+        barrier.wait()
+        responses[view] = requests.get(f'{endpoint}/cutout', params={'path': 'tess-cube.fits', 'hdu': 1, 'view': view})
+
+    with cutout_server.CutoutServer(service) as server:
+        threads = [threading.Thread(target=_request_cutout, args=(server.endpoint, view)) for view in views]
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+        assert service.statistics['batches'] == 1
+        assert s3_server.statistics['requests-GET'] == 1
+
+        for view in views:
+            assert responses[view].status_code == 200
+            with fits.open(io.BytesIO(responses[view].content)) as cutout:
+                # Integer views keep their axis in the FITS file
+                expected = source[cutout_server.parse_view(view)]
+                assert np.array_equal(cutout[1].data.reshape(expected.shape), expected)
+
+        service.batch_window = 0
+        response = requests.get(f'{server.endpoint}/cutout', params={'path': 'tess-cube.fits', 'hdu': 1, 'view': '1:2,1:2,1:2,1'})
+        assert response.status_code == 200
+        assert s3_server.statistics['requests-GET'] == 1
+        assert service.statistics['cache-hits'] == 1
+
+        assert requests.get(f'{server.endpoint}/cutout', params={'path': 'missing.fits', 'view': '0:1'}).status_code == 404
+        assert requests.get(f'{server.endpoint}/cutout', params={'path': 'tess-cube.fits', 'view': '0:a'}).status_code == 400
+
+        def _fail(*args):
+            raise requests.ConnectionError('Connection reset by peer')
+
+        service.load_byte_ranges = _fail
+        response = requests.get(f'{server.endpoint}/cutout', params={'path': 'tess-cube.fits', 'view': '0:1,0:1,0:1,0'})
+        assert response.status_code == 500
+        assert 'ConnectionError' in response.json()['error']
+
+def test_gzip_compressed_cutouts_are_inflated(cube_filepath, tmp_path, monkeypatch):
+    from cloud_fits import local_index
+    from cloud_fits.data_types import gzip_index
+
+    fits_directory: str = os.path.join(tmp_path, 'archive')
+    os.makedirs(fits_directory)
+    with open(cube_filepath, 'rb') as stream:
+        payload = stream.read()
+
+    with open(os.path.join(fits_directory, 'tess-cube.fits.gz'), 'wb') as stream:
+        stream.write(gzip.compress(payload))
+
+    monkeypatch.setattr(gzip_index, 'SPAN', 4 * 1024)
+    catalog = data_types.FitsCloudCatalog(local_index.build_local_configuration(fits_directory), lambda shard_key: None)
+    service = cutout_server.CutoutService(catalog, batch_window=0)
+    source = fits.open(cube_filepath)[1].data
+    with cutout_server.CutoutServer(service) as server:
+        for view in ['0:9,0:11,0:13,0:2', '2:9,4:6,1:12,1']:
+            response = requests.get(f'{server.endpoint}/cutout', params={'path': 'tess-cube.fits.gz', 'hdu': 1, 'view': view})
+            assert response.status_code == 200
+            with fits.open(io.BytesIO(response.content)) as cutout:
+                expected = source[cutout_server.parse_view(view)]
+                assert np.array_equal(cutout[1].data.reshape(expected.shape), expected)
@@ -1,3 +1,15 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from astropy.io import fits
+
+from cloud_fits import data_types
+from cloud_fits.data_types import dask_array, shortcuts, utils
+from conftest import build_cloud_index, build_configuration
+
 def test_generate_ranges():
     api_aligned_cViews = [slice(0, 250), slice(0, 250), slice(0, 1), slice(0, 1)]
 
@@ -79,3 +91,413 @@ def test_generate_ranges():
 # import pdb; pdb.set_trace()
 # import sys; sys.exit(1)
 
+
+def test_to_dask_reductions(cube_filepath, cube_index):
+    da = pytest.importorskip('dask.array')
+    expected = fits.open(cube_filepath)[1].data
+    arr = cube_index.headers[1].to_dask(chunks=(2, 11, 13, 2))
+    assert arr.shape == expected.shape
+    assert arr.numblocks == (5, 1, 1, 1)
+    assert np.array_equal(arr.compute(), expected)
+    assert np.allclose(arr.sum(axis=(0, 1)).compute(), expected.sum(axis=(0, 1)))
+    assert np.allclose(arr[2:7, 3:5, :, 0].mean(axis=-1).compute(), expected[2:7, 3:5, :, 0].mean(axis=-1))
+
+def test_to_dask_auto_chunks_are_contiguous(cube_index):
+    pytest.importorskip('dask.array')
+    dask_array.CHUNK_BYTES = 11 * 13 * 2 * 4 * 3
+    try:
+        arr = cube_index.headers[1].to_dask()
+    finally:
+        dask_array.CHUNK_BYTES = 64 * 1024 * 1024
+
+    assert arr.chunks[1:] == ((11,), (13,), (2,))
+    assert arr.chunks[0] == (3, 3, 3)
+
+@pytest.mark.parametrize('bitpix, bscale, bzero, blank', [
+    (8, 1, 0, None),
+    (8, 1, -128, None),
+    (16, 1, 0, None),
+    (16, 1, 32768, None),
+    (16, 0.5, 10, -1),
+    (32, 1, 2147483648, None),
+    (32, 2.5, -3, None),
+    (64, 1, 0, None),
+    (-32, 1, 0, None),
+    (-32, 3.0, 1.5, None),
+    (-64, 0.25, 0, None),
+])
+def test_cutout_matches_astropy(tmp_path, bitpix, bscale, bzero, blank):
+    raw = (np.arange(7 * 8 * 9) % 120 - 60).astype(utils.bitpix_to_dtype(bitpix)).reshape(7, 8, 9)
+    header = fits.Header([('XTENSION', 'IMAGE'), ('BITPIX', bitpix), ('NAXIS', 3)] + [
+        (f'NAXIS{idx}', raw.shape[-idx]) for idx in range(1, 4)] + [('PCOUNT', 0), ('GCOUNT', 1)])
+    for keyword, value in [('BSCALE', bscale), ('BZERO', bzero), ('BLANK', blank)]:
+        if not value is None:
+            header[keyword] = value
+
+    fits_filepath: str = os.path.join(tmp_path, f'image.fits')
+    with open(fits_filepath, 'wb') as stream:
+        stream.write(fits.PrimaryHDU().header.tostring().encode('ascii'))
+        stream.write(header.tostring().encode('ascii'))
+        stream.write(raw.tobytes())
+        stream.write(b'\0' * (-raw.nbytes % 2880))
+
+    expected = fits.open(fits_filepath)[1].data[1:6, 2:7, 3:8]
+    image_header = build_cloud_index(str(tmp_path), fits_filepath).headers[1]
+    for native_byteorder in [False, True]:
+        cutout = image_header.cutout((slice(1, 6), slice(2, 7), slice(3, 8)), native_byteorder=native_byteorder)[1].data
+        assert cutout.dtype.newbyteorder('=') == expected.dtype.newbyteorder('=')
+        np.testing.assert_array_equal(cutout, expected)
+        if native_byteorder:
+            assert cutout.dtype.isnative
+
+def test_write_cutout_streams_a_valid_fits_file(tmp_path, monkeypatch):
+    from astropy.wcs import WCS
+
+    data = np.arange(6 * 40 * 50, dtype='>i2').reshape(6, 40, 50)
+    hdu = fits.ImageHDU(data)
+    hdu.header.update(WCS({
+        'CTYPE1': 'RA---TAN', 'CTYPE2': 'DEC--TAN', 'CTYPE3': 'TIME',
+        'CRPIX1': 25.0, 'CRPIX2': 20.0, 'CRPIX3': 1.0,
+        'CRVAL1': 83.6, 'CRVAL2': 22.0, 'CRVAL3': 0.0,
+        'CDELT1': -0.001, 'CDELT2': 0.001, 'CDELT3': 1.0}).to_header())
+    fits_filepath: str = os.path.join(tmp_path, 'image.fits')
+    fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(fits_filepath, checksum=True)
+
+    monkeypatch.setattr(shortcuts, 'STREAM_CHUNK_SIZE', 100)
+    nViews = (slice(1, 5), slice(12, 31), slice(3, 44))
+    image_header = build_cloud_index(str(tmp_path), fits_filepath).headers[1]
+    cutout_filepath: str = image_header.write_cutout(nViews, os.path.join(tmp_path, 'cutout.fits'))
+    assert os.path.getsize(cutout_filepath) % 2880 == 0
+
+    source = fits.open(fits_filepath)[1]
+    with fits.open(cutout_filepath, checksum=True) as cutout:
+        assert np.array_equal(cutout[1].data, source.data[nViews])
+        assert not 'CHECKSUM' in cutout[1].header
+        assert cutout[1].header['CRPIX1'] == 25.0 - 3
+        source_world = WCS(source.header).pixel_to_world_values(3, 12, 1)
+        cutout_world = WCS(cutout[1].header).pixel_to_world_values(0, 0, 0)
+        assert np.allclose(source_world, cutout_world)
+
+def test_cutout_out_of_core_matches_astropy(tmp_path, monkeypatch):
+    data = np.arange(5 * 30 * 20, dtype='>i2').reshape(5, 30, 20)
+    hdu = fits.ImageHDU(data)
+    hdu.header['BSCALE'] = 0.5
+    hdu.header['BZERO'] = 10.0
+    fits_filepath: str = os.path.join(tmp_path, 'image.fits')
+    fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(fits_filepath)
+
+    monkeypatch.setattr(shortcuts, 'STREAM_CHUNK_SIZE', 64)
+    monkeypatch.setattr(shortcuts, 'MEMMAP_MEMORY_BUDGET', 256)
+    nViews = (slice(1, 4), slice(2, 27), slice(5, 17))
+    image_header = build_cloud_index(str(tmp_path), fits_filepath).headers[1]
+    expected = fits.open(fits_filepath)[1].data[nViews]
+
+    memmap_filepath: str = os.path.join(tmp_path, 'cutout.dat')
+    cutout = image_header.cutout(nViews, out=memmap_filepath)[1].data
+    assert isinstance(cutout, np.memmap)
+    assert np.array_equal(cutout, expected)
+    assert os.path.getsize(memmap_filepath) == expected.nbytes
+
+    # A transposed out array would be filled through a copy, so it's refused
+    with pytest.raises(NotImplementedError):
+        image_header.cutout(nViews, out=np.empty(expected.shape[::-1], dtype=cutout.dtype).T)
+
+    out = np.empty(expected.shape, dtype=cutout.dtype)
+    assert image_header.cutout(nViews, out=out)[1].data is out
+    assert np.array_equal(out, expected)
+
+    monkeypatch.setattr(shortcuts, 'MEMMAP_THRESHOLD', 0)
+    monkeypatch.setattr(shortcuts, 'MEMMAP_DIRECTORY', str(tmp_path))
+    cutout = image_header.cutout(nViews, native_byteorder=True, scale=False)[1].data
+    assert isinstance(cutout, np.memmap)
+    assert cutout.dtype.isnative
+    assert np.array_equal(cutout, data[nViews])
+    assert sorted(os.listdir(tmp_path)) == ['cutout.dat', 'image.fits']
+
+def test_time_slice_fetches_only_the_frames_in_the_window(cube_filepath, cube_index, monkeypatch):
+    image_header = cube_index.headers[1]
+    assert image_header._header['time']['axis'] == 2
+    assert len(utils.unpack_float_array(image_header._header['time']['start'])) == 13
+
+    # TSTART is linspace(1325, 1326, 13), without TSTOP a cadence lasts until the next one starts
+    assert image_header.time_frames(1325.2, 1325.5) == slice(2, 6)
+    assert image_header.time_frames(1300.0, 1325.0) == slice(0, 0)
+    assert image_header.time_frames(1325.99, 1400.0) == slice(11, 13)
+
+    monkeypatch.setattr(type(image_header), '_slice_bintable', None)
+    data = fits.open(cube_filepath)[1].data
+    cutout = image_header.time_slice(1325.2, 1325.5, (slice(1, 4), slice(0, 11), 0, 0))
+    assert np.array_equal(cutout[1].data, data[1:4, 0:11, 2:6, 0:1])
+    assert np.array_equal(image_header.time_slice(1325.99, 1400.0)[1].data, data[:, :, 11:13, :])
+    assert np.array_equal(image_header.time_slice(1325.2, 1325.5, (slice(0, 4), ))[1].data, data[0:4, :, 2:6, :])
+    with pytest.raises(ValueError):
+        image_header.time_slice(1300.0, 1325.0)
+
+def test_where_skips_row_groups_the_zone_map_rules_out(tmp_path, monkeypatch):
+    from cloud_fits import local_index
+
+    rows = 5 * local_index.ZONE_MAP_ROWS + 17
+    quality = np.zeros(rows, dtype='>i4')
+    quality[[10, 3000]] = [128, 4]
+    flux = np.linspace(0, 1, rows)
+    flux[4000:4100] = np.nan
+    # float64 bounds would round 2**53 + 1 down to 2**53 and skip its row group
+    big = np.full(rows, 2 ** 53, dtype='>i8')
+    big[2500] = 2 ** 53 + 1
+    bintable = fits.BinTableHDU.from_columns([
+        fits.Column(name='TIME', format='D', array=np.linspace(1325.0, 1350.0, rows)),
+        fits.Column(name='FLUX', format='E', array=flux),
+        fits.Column(name='QUALITY', format='J', array=quality),
+        fits.Column(name='BIG', format='K', array=big),
+        fits.Column(name='LABEL', format='4A', array=np.array(['a'] * rows)),
+    ])
+    fits_filepath: str = os.path.join(tmp_path, 'table.fits')
+    fits.HDUList([fits.PrimaryHDU(), bintable]).writeto(fits_filepath)
+    source = fits.open(fits_filepath)[1].data
+    table_header = build_cloud_index(str(tmp_path), fits_filepath).headers[1]
+
+    fetched = []
+    load_byte_ranges = shortcuts.load_byte_ranges
+    def _load_byte_ranges(url, ranges, *args):
+        fetched.extend(ranges)
+        return load_byte_ranges(url, ranges, *args)
+
+    monkeypatch.setattr(shortcuts, 'load_byte_ranges', _load_byte_ranges)
+    row_bytes = bintable.header['NAXIS1'] * local_index.ZONE_MAP_ROWS
+    for column, op, value, groups in [
+            ('QUALITY', '&', 128, 1),
+            ('QUALITY', '&', 132, 2),
+            ('QUALITY', '!=', 0, 2),
+            ('TIME', '>=', 1349.0, 2),
+            ('TIME', '<', 1325.5, 1),
+            ('FLUX', '==', float(flux[2500]), 1),
+            ('FLUX', '>', 2.0, 0),
+            ('BIG', '>', 2 ** 53, 1),
+            ('BIG', '==', 2 ** 53 + 1, 1),
+            ('LABEL', '==', 'a', 6)]:
+        fetched.clear()
+        table = table_header.where(column, op, value)
+        expected = source[utils.BINTABLE_OPERATORS[op](source[column], value)]
+        assert np.array_equal(np.asarray(table['TIME']), expected['TIME'])
+        assert sum(stop - start for start, stop in fetched) <= groups * row_bytes
+
+    # Slices are streamed into the table file chunk by chunk
+    monkeypatch.setattr(shortcuts, 'STREAM_CHUNK_SIZE', 4096)
+    table = table_header[0:rows]
+    assert table.telemetry.requests == -(-rows * bintable.header['NAXIS1'] // 4096)
+    assert np.array_equal(np.asarray(table['BIG']), source['BIG'])
+
+def test_cutout_cache_shares_read_only_results(cube_filepath, cube_configuration, monkeypatch):
+    from cloud_fits import data_types
+    from cloud_fits.data_types import cutout_cache
+
+    calls = []
+    image_cutout = shortcuts.image_cutout
+    def _image_cutout(*args):
+        calls.append(args)
+        return image_cutout(*args)
+
+    monkeypatch.setattr(shortcuts, 'image_cutout', _image_cutout)
+    monkeypatch.setattr(cutout_cache, 'CUTOUT_CACHE', None)
+    cache = cutout_cache.enable(max_bytes=2 * 9 * 11 * 4 * 4)
+    cube_configuration['index-etag'] = '"first"'
+    image_header = data_types.FitsCloudIndex(cube_configuration).headers[1]
+
+    first = image_header[0:9, 0:11, 0:4, 0:1][1].data
+    second = image_header.cutout((slice(None), slice(0, 11), slice(None, 4), 0))[1].data
+    assert second is first and len(calls) == 1
+    assert not first.flags.writeable
+    with pytest.raises(ValueError):
+        first[0, 0, 0, 0] = 1
+
+    image_header.cutout((slice(None), slice(0, 11), slice(None, 4), 0), native_byteorder=True)
+    image_header.cutout((slice(None), slice(0, 11), slice(None, 4), 0), scale=False)
+    assert len(calls) == 3 and len(cache) == 2 and cache.statistics['evictions'] == 1
+
+    cube_configuration = dict(cube_configuration, **{'index-etag': '"second"'})
+    cube_configuration['indicies'] = [dict(cube_configuration['indicies'][0], headers=[
+        header.index for header in cube_configuration['indicies'][0]['headers']])]
+    data_types.FitsCloudIndex(cube_configuration).headers[1].cutout((slice(None), slice(0, 11), slice(None, 4), 0), scale=False)
+    assert len(calls) == 4
+
+    # A file re-indexed into its shard leaves the root index, and its ETag, unchanged
+    with fits.open(cube_filepath) as hdu_list:
+        hdu_list[1].header['RECAL'] = True
+        hdu_list[1].data = hdu_list[1].data + 1
+        hdu_list.writeto(cube_filepath, overwrite=True)
+
+    reindexed = dict(build_configuration(os.path.dirname(cube_filepath), cube_filepath), **{'index-etag': '"second"'})
+    cutout = data_types.FitsCloudIndex(reindexed).headers[1].cutout((slice(None), slice(0, 11), slice(None, 4), 0), scale=False)
+    assert len(calls) == 5
+    assert np.array_equal(cutout[1].data, fits.open(cube_filepath)[1].data[:, 0:11, 0:4, 0:1])
+
+    # Cutouts too large for the cache are handed back untouched
+    assert image_header[0:9, 0:11, 0:13, 0:1][1].data.flags.writeable
+
+    cutout_cache.disable()
+    assert image_header[0:9, 0:11, 0:4, 0:1][1].data.flags.writeable
+
+def test_index_headers_resolve_their_fields_once(cube_configuration):
+    import copy
+
+    from cloud_fits import data_types
+
+    file_index = copy.deepcopy(cube_configuration['indicies'][0])
+    image_header = data_types.FitsCloudIndex(cube_configuration).headers[1]
+    assert not hasattr(image_header, '__dict__')
+    assert image_header.data_offset == file_index['headers'][1]['data']['offset']
+    assert image_header.data_shape == (9, 11, 13, 2)
+    assert image_header.dtype is image_header.dtype and image_header.data_itemsize == 4
+    assert image_header.index == file_index['headers'][1]
+    with pytest.raises(AttributeError):
+        image_header.data_missing
+
+def test_take_fetches_only_the_selected_pixels(cube_filepath, cube_index):
+    from cloud_fits.data_types import metrics
+
+    source = fits.open(cube_filepath)[1].data
+    image_header = cube_index.headers[1]
+    aperture = np.zeros((9, 11), dtype=bool)
+    aperture[[2, 2, 3, 5, 8], [4, 5, 4, 9, 0]] = True
+
+    seen = []
+    metrics.add_hook(seen.append)
+    try:
+        taken = image_header.take(aperture, max_gap=0)
+        assert np.array_equal(taken, source[aperture])
+        telemetry = seen[-1]
+        # Neighbouring columns are contiguous, (2, 4) and (2, 5) are one read
+        assert telemetry.requests == 4
+        assert telemetry.bytes_requested == telemetry.bytes_useful == taken.nbytes
+
+        taken = image_header.take([(8, 0), (2, 4), (8, 0)], (slice(3, 7), 1), native_byteorder=True, max_gap=0)
+        assert taken.dtype.isnative
+        assert np.array_equal(taken, source[[8, 2, 8], [0, 4, 0]][:, 3:7, 1:2])
+        # A repeated pixel is fetched once
+        assert seen[-1].bytes_requested == 2 * 4 * 4
+
+        # Rows 2 and 3 are one row apart, within the gap
+        aperture[4:] = False
+        image_header.take(aperture, max_gap=11 * 13 * 2 * 4)
+        assert seen[-1].requests == 1
+
+    finally:
+        metrics.remove_hook(seen.append)
+
+    with pytest.raises(AssertionError):
+        image_header.take([(9, 0)])
+
+def test_reduce_streams_an_aperture_into_a_light_curve(cube_filepath, cube_index, monkeypatch):
+    source = fits.open(cube_filepath)[1].data.astype(np.float64)
+    image_header = cube_index.headers[1]
+    aperture = np.zeros((9, 11), dtype=bool)
+    aperture[[2, 2, 3, 3, 7], [4, 5, 4, 5, 10]] = True
+    weights = np.linspace(.5, 2, 9 * 11).reshape(9, 11)
+
+    # Chunks smaller than one pixel's time series, every pixel arrives in pieces
+    monkeypatch.setattr(shortcuts, 'STREAM_CHUNK_SIZE', 60)
+    assert np.allclose(image_header.reduce(aperture), source[aperture].sum(axis=0))
+    assert np.allclose(image_header.reduce(aperture, 'mean', weights=weights), np.average(source[aperture], axis=0, weights=weights[aperture]))
+    assert np.allclose(image_header.reduce([(7, 10), (7, 10)], 'sum', (slice(2, 9), 1)), 2 * source[7, 10, 2:9, 1:2])
+
+    source[3, 4, 6, 0] = np.nan
+    fits_filepath = os.path.join(os.path.dirname(cube_filepath), 'nan-cube.fits')
+    fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(source.astype('>f4'))]).writeto(fits_filepath)
+    nan_header = build_cloud_index(os.path.dirname(cube_filepath), fits_filepath).headers[1]
+    assert np.isnan(nan_header.reduce(aperture, 'mean')[6, 0])
+    assert np.allclose(nan_header.reduce(aperture, 'nanmean'), np.nanmean(source[aperture], axis=0))
+    assert np.allclose(nan_header.reduce(aperture, 'nansum'), np.nansum(source[aperture], axis=0))
+
+    with pytest.raises(NotImplementedError):
+        image_header.reduce(aperture, 'median')
+
+def test_preview_serves_the_coarsest_level_that_meets_the_size(tmp_path):
+    from cloud_fits import data_types, local_index
+    from cloud_fits.data_types import metrics
+
+    fits_directory = os.path.join(tmp_path, 'ffis')
+    os.makedirs(fits_directory)
+    source = np.random.default_rng(7).normal(size=(200, 256)).astype('>f4')
+    fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(source)]).writeto(os.path.join(fits_directory, 'tess-ffi.fits'))
+    configuration = local_index.build_local_configuration(fits_directory, os.path.join(tmp_path, 'previews'), 'max')
+    preview_index = configuration['indicies'][0]['headers'][1]['preview']
+    # 200x256 -> 100x128 -> 50x64, a 25x32 level would be smaller than PREVIEW_MIN_SIZE
+    assert [level['factor'] for level in preview_index['levels']] == [2, 4]
+    image_header = data_types.FitsCloudIndex(configuration).headers[1]
+
+    seen = []
+    metrics.add_hook(seen.append)
+    try:
+        preview = image_header.preview(40)
+        assert preview.factor == 4
+        assert np.array_equal(preview.data, source.reshape(50, 4, 64, 4).max(axis=(1, 3)))
+        assert seen[-1].operation == 'preview'
+        assert seen[-1].bytes_requested == 50 * 64 * 4
+
+        # The view is in full resolution pixels, only its rows of the level are read
+        preview = image_header.preview((16, 10), (slice(40, 120), slice(0, 64)))
+        assert preview.factor == 4
+        assert np.array_equal(preview.data, source[40:120, 0:64].reshape(20, 4, 16, 4).max(axis=(1, 3)))
+        assert seen[-1].bytes_requested == 20 * 64 * 4
+
+    finally:
+        metrics.remove_hook(seen.append)
+
+    assert image_header.preview(80).factor == 2
+    preview = image_header.preview(150, (slice(0, 160), slice(0, 160)))
+    assert preview.factor == 1
+    assert np.array_equal(preview.data, source[0:160, 0:160])
+
+    cube_filepath = os.path.join(fits_directory, 'tess-cube.fits')
+    fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(np.zeros((64, 64, 2), dtype='>f4'))]).writeto(cube_filepath)
+    with pytest.raises(NotImplementedError):
+        build_cloud_index(fits_directory, cube_filepath).headers[1].preview(16)
+
+def test_fetch_plans_every_hdu_and_fetches_them_together(cube_filepath, cube_index, s3_server):
+    views = {1: (slice(2, 5), slice(0, 11), slice(3, 9), 0), 2: slice(3, 9)}
+    fetched = cube_index.fetch(views)
+    assert np.array_equal(fetched[1][1].data, cube_index.headers[1][views[1]][1].data)
+    assert fetched[2].as_array().tolist() == cube_index.headers[2][views[2]].as_array().tolist()
+    assert fetched[1].telemetry.operation == 'cutout'
+    assert fetched[2].telemetry.operation == 'bintable'
+
+    # Over the network the ranges of every HDU are in flight together rather than one HDU after another
+    os.makedirs(os.path.join(s3_server.directory, 'data'))
+    shutil.copy(cube_filepath, os.path.join(s3_server.directory, 'data', 'tess-cube.fits'))
+    configuration = build_configuration(os.path.dirname(cube_filepath), cube_filepath)
+    configuration['data-bucket-path'] = 's3://data'
+    remote_index = data_types.FitsCloudIndex(configuration)
+    s3_server.latency = .2
+    contiguous = {1: (slice(2, 5), slice(None), slice(None), slice(None)), 2: slice(3, 9)}
+    remote = remote_index.fetch(contiguous)
+    assert s3_server.statistics['requests-GET'] == 2
+    assert s3_server.statistics['max-in-flight'] == 2
+    assert np.array_equal(remote[1][1].data, cube_index.headers[1][contiguous[1]][1].data)
+    assert remote[2].as_array().tolist() == fetched[2].as_array().tolist()
+
+def test_fetch_reads_like_slicing_each_header(cube_index, monkeypatch):
+    from cloud_fits.data_types import cutout_cache
+
+    views = {1: (slice(2, 5), slice(0, 11), slice(3, 9), 0), 2: slice(0, 13)}
+    expected = cube_index.headers[1][views[1]][1].data
+    monkeypatch.setattr(shortcuts, 'STREAM_CHUNK_SIZE', 64)
+    fetched = cube_index.fetch(views)
+    assert np.array_equal(fetched[1][1].data, expected)
+    assert fetched[2].telemetry.requests == -(-13 * cube_index.headers[2].fits['NAXIS1'] // 64)
+
+    monkeypatch.setattr(cutout_cache, 'CUTOUT_CACHE', None)
+    cutout_cache.enable()
+    try:
+        first = cube_index.fetch(views)[1]
+        monkeypatch.setattr(shortcuts, 'assemble_image_cutout', None)
+        second = cube_index.fetch(views)[1]
+        assert second[1].data is first[1].data and second.telemetry.cached
+
+    finally:
+        cutout_cache.disable()
+
+    # Cutouts above MEMMAP_THRESHOLD are streamed into a memmap like header[view]
+    monkeypatch.setattr(shortcuts, 'MEMMAP_THRESHOLD', 64)
+    fetched = cube_index.fetch(views)
+    assert isinstance(fetched[1][1].data, np.memmap)
+    assert np.array_equal(fetched[1][1].data, expected)
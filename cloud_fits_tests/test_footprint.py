@@ -0,0 +1,77 @@
+import os
+import time
+
+import numpy as np
+
+from astropy.io import fits
+from astropy.wcs import WCS
+
+from cloud_fits import data_types, local_index
+from cloud_fits.data_types import footprint
+
+def write_cube(filepath, ra, dec, rotation=0):
+    # (cadences, rows, columns) with 21 arcsecond pixels, like a TESS FFI
+    scale = 21 / 3600
+    header = WCS({
+        'CTYPE1': 'RA---TAN', 'CTYPE2': 'DEC--TAN', 'CTYPE3': 'TIME',
+        'CRPIX1': 25.0, 'CRPIX2': 20.0, 'CRPIX3': 1.0,
+        'CRVAL1': ra, 'CRVAL2': dec, 'CRVAL3': 0.0,
+        'CDELT1': -scale, 'CDELT2': scale, 'CDELT3': 1.0,
+        'PC1_1': np.cos(rotation), 'PC1_2': -np.sin(rotation),
+        'PC2_1': np.sin(rotation), 'PC2_2': np.cos(rotation)}).to_header()
+    hdu = fits.ImageHDU(np.arange(4 * 40 * 50, dtype='>f4').reshape(4, 40, 50), header=header)
+    fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(filepath)
+    return WCS(hdu.header).celestial
+
+def test_sky_cells_wrap_and_poles():
+    assert set(footprint.sky_cells(359.9, 0, .5)) & set(footprint.sky_cells(.1, 0, .5))
+    assert len(footprint.sky_cells(0, 89.9, .5)) == len(set(footprint.sky_cells(180, 89.9, .5)))
+
+def test_query_returns_files_and_pixel_boxes(tmp_path, monkeypatch):
+    wcses = {
+        'north.fits': write_cube(os.path.join(tmp_path, 'north.fits'), 83.6, 22.0, .3),
+        'wrap.fits': write_cube(os.path.join(tmp_path, 'wrap.fits'), 359.95, -10.0),
+        'far.fits': write_cube(os.path.join(tmp_path, 'far.fits'), 200.0, 45.0),
+    }
+    configuration = local_index.build_local_configuration(str(tmp_path))
+    catalog = data_types.FitsCloudCatalog(configuration, lambda shard_key: None)
+
+    for cloudpath, (x, y) in [('north.fits', (10.2, 31.7)), ('wrap.fits', (44.0, 3.0)), ('wrap.fits', (30.0, 20.0))]:
+        ra, dec = wcses[cloudpath].pixel_to_world_values(x, y)
+        matches = catalog.query(float(ra), float(dec), 30 / 3600)
+        assert [(match.cloudpath, match.hdu) for match in matches] == [(cloudpath, 1)]
+        cadences, rows, columns = matches[0].nViews
+        assert cadences == slice(0, 4)
+        assert rows.start <= round(y) < rows.stop and rows.stop - rows.start <= 6
+        assert columns.start <= round(x) < columns.stop and columns.stop - columns.start <= 6
+
+        cutout = catalog[cloudpath].headers[1].cutout(matches[0].nViews)
+        assert cutout[1].data.shape == (4, rows.stop - rows.start, columns.stop - columns.start)
+        # A file only answers for its own HDUs
+        assert [match.cloudpath for match in catalog[cloudpath].query(float(ra), float(dec), 30 / 3600)] == [cloudpath]
+        assert catalog['far.fits'].query(float(ra), float(dec), 30 / 3600) == []
+
+    # The WCS is solved once per header, however often the index is built
+    cloud_index = local_index.build_fits_cloud_index(str(tmp_path), os.path.join(tmp_path, 'north.fits'))
+    sky_footprint = cloud_index.index['headers'][1]['footprint']
+    monkeypatch.setattr(footprint, 'build_footprint', None)
+    assert cloud_index.index['headers'][1]['footprint'] == sky_footprint
+
+    assert catalog.query(83.6, -22.0, .1) == []
+    ra, dec = wcses['north.fits'].pixel_to_world_values(-10, 20)
+    assert catalog.query(float(ra), float(dec), 0) == []
+
+def test_query_is_fast_over_large_catalogs():
+    generator = np.random.default_rng(0)
+    entry = {'ra': 0, 'dec': 0, 'radius': 8.5, 'center': [1023.5, 1023.5], 'matrix': [[-171.4, 0], [0, 171.4]], 'axes': [1, 0], 'shape': [2048, 2048]}
+    indices = [{
+        'cloudpath': f'ffi-{idx}.fits',
+        'headers': [{}, {'footprint': dict(entry, ra=float(ra), dec=float(dec))}],
+    } for idx, (ra, dec) in enumerate(zip(generator.uniform(0, 360, 5000), np.degrees(np.arcsin(generator.uniform(-1, 1, 5000)))))]
+    footprint_index = footprint.build_footprint_index(indices)
+
+    start = time.perf_counter()
+    for ra, dec in zip(generator.uniform(0, 360, 200), generator.uniform(-60, 60, 200)):
+        footprint.query_footprint_index(footprint_index, ra, dec, .01)
+
+    assert (time.perf_counter() - start) / 200 < .005
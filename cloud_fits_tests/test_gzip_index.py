@@ -0,0 +1,72 @@
+import gzip
+import io
+import os
+
+import numpy as np
+
+from astropy.io import fits
+
+from cloud_fits import data_types, local_index
+from cloud_fits.data_types import gzip_index
+
+def test_seek_points_inflate_any_range(tmp_path):
+    data = np.random.default_rng(3).normal(size=300000).astype('>f4').tobytes() + bytes(400000)
+    gzip_filepath = os.path.join(tmp_path, 'members.gz')
+    with open(gzip_filepath, 'wb') as stream:
+        # Concatenated members, the second one at a different level
+        stream.write(gzip.compress(data[:500000], 6))
+        stream.write(gzip.compress(data[500000:], 1))
+
+    inflated = io.BytesIO()
+    seek_index = gzip_index.build_seek_index(gzip_filepath, inflated, 64 * 1024)
+    assert inflated.getvalue() == data
+    assert seek_index['length'] == len(data)
+    assert seek_index['compressed-length'] == os.path.getsize(gzip_filepath)
+    assert len(seek_index['points']) > 10
+    # Most seek points land mid-byte and need inflatePrime
+    assert any(bits for (compressed, bits, uncompressed, window) in seek_index['points'])
+
+    with open(gzip_filepath, 'rb') as stream:
+        compressed = stream.read()
+
+    ranges = [(0, 10), (123456, 123460), (499990, 500020), (650000, 1000000), (5, 6), (1599990, 1600000)]
+    reads = gzip_index.plan_reads(seek_index, ranges)
+    assert sorted(idx for read in reads for idx in read.ranges) == list(range(0, len(ranges)))
+    for read in reads:
+        payload = gzip_index.inflate_read(seek_index, read, compressed[read.compressed_start:read.compressed_stop])
+        for idx in read.ranges:
+            start, stop = ranges[idx]
+            assert payload[start - read.start:stop - read.start] == data[start:stop]
+
+def test_gzip_compressed_cutouts_match_astropy(tmp_path, monkeypatch):
+    cube = np.random.default_rng(5).integers(0, 4096, size=(40, 40, 50, 2)).astype('>f4')
+    bintable = fits.BinTableHDU.from_columns([
+        fits.Column(name='TSTART', format='D', array=np.linspace(1325.0, 1326.0, 50)),
+        fits.Column(name='QUALITY', format='J', array=np.arange(50)),
+    ])
+    fits_directory = os.path.join(tmp_path, 'archive')
+    os.makedirs(fits_directory)
+    buffer = io.BytesIO()
+    fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(cube), bintable]).writeto(buffer)
+    gzip_filepath = os.path.join(fits_directory, 'tess-cube.fits.gz')
+    with open(gzip_filepath, 'wb') as stream:
+        stream.write(gzip.compress(buffer.getvalue()))
+
+    monkeypatch.setattr(gzip_index, 'SPAN', 16 * 1024)
+    configuration = local_index.build_local_configuration(fits_directory)
+    file_index = configuration['indicies'][0]
+    assert file_index['cloudpath'] == 'tess-cube.fits.gz'
+    assert len(file_index['gzip']['points']) > 4
+    cloud_index = data_types.FitsCloudIndex(configuration)
+    image_header, table_header = cloud_index.headers[1], cloud_index.headers[2]
+
+    cutout = image_header[3:6, 7:9, 10:20, 0:2]
+    assert np.array_equal(cutout[1].data, cube[3:6, 7:9, 10:20, 0:2])
+    # Only the compressed spans around the cutout are read
+    assert cutout.telemetry.bytes_requested < file_index['gzip']['compressed-length'] / 2
+    assert image_header.explain[3:6, 7:9, 10:20, 0:2].bytes == cutout.telemetry.bytes_requested
+
+    assert np.array_equal(image_header.take([(39, 39), (0, 1)], (slice(None), 1)), cube[[39, 0], [39, 1]][:, :, 1:2])
+    assert np.allclose(image_header.reduce([(2, 2), (30, 5)]), cube[[2, 30], [2, 5]].astype(np.float64).sum(axis=0))
+    assert np.array_equal(table_header[5:9]['QUALITY'], np.arange(5, 9))
+    assert np.array_equal(table_header.where('QUALITY', '>=', 47)['QUALITY'], [47, 48, 49])
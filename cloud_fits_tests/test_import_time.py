@@ -0,0 +1,27 @@
+import os
+import pickle
+import subprocess
+import sys
+
+REPO_DIRECTORY: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_core_imports_are_lazy():
+    script: str = ';'.join([
+        'import logging, sys',
+        'import cloud_fits.bucket_operations, cloud_fits.data_types, cloud_fits.data_types.dask_array, cloud_fits.local_index',
+        'assert not logging.getLogger().handlers',
+        'print(",".join(sorted(sys.modules)))',
+    ])
+    process = subprocess.run([sys.executable, '-c', script], stdout=subprocess.PIPE, cwd=REPO_DIRECTORY, check=True)
+    modules = process.stdout.decode('utf-8').strip().split(',')
+    assert [name for name in ['astropy', 'numpy', 'requests', 'yaml'] if name in modules] == []
+
+def test_index_loads_without_astropy(cube_configuration):
+    script: str = ';'.join([
+        'import sys, pickle',
+        'from cloud_fits import data_types',
+        'index = data_types.FitsCloudIndex(pickle.loads(sys.stdin.buffer.read()))',
+        'assert [header.type.name for header in index.headers] == ["Primary", "Image", "BinTable"]',
+        'assert not "astropy" in sys.modules',
+    ])
+    subprocess.run([sys.executable, '-c', script], input=pickle.dumps(cube_configuration), cwd=REPO_DIRECTORY, check=True)
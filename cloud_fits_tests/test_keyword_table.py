@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+import yaml
+
+from astropy.io import fits
+
+from cloud_fits import data_types, local_index
+from cloud_fits.data_types import keyword_table
+
+def test_keyword_table_queries_never_parse_headers(tmp_path, monkeypatch):
+    expected = {}
+    for camera in range(1, 5):
+        for ccd in range(1, 5):
+            hdu = fits.ImageHDU(np.zeros((2, 2, 2), dtype='>f4'))
+            hdu.header['CAMERA'] = camera
+            hdu.header['CCD'] = ccd
+            hdu.header['EXPOSURE'] = 100.0 * camera * ccd
+            hdu.header['TARGET'] = f'target-{camera}'
+            if ccd != 4:
+                hdu.header['CALIB'] = ccd % 2 == 0
+
+            filename = f'ffi-{camera}-{ccd}.fits'
+            fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(os.path.join(tmp_path, filename))
+            expected[filename] = (camera, ccd)
+
+    default_configuration = local_index.build_local_configuration(str(tmp_path))
+    assert data_types.FitsCloudCatalog(default_configuration, lambda shard_key: None).keywords.query(CALIB=True) == []
+    configuration = local_index.build_local_configuration(
+        str(tmp_path), keywords=['SIMPLE', 'CAMERA', 'CCD', 'EXPOSURE', 'TARGET', 'CALIB'])
+    configuration = yaml.load(yaml.dump(configuration), Loader=yaml.FullLoader)
+    catalog = data_types.FitsCloudCatalog(configuration, lambda shard_key: None)
+    monkeypatch.setattr(fits.Header, 'fromstring', None)
+    keywords = catalog.keywords
+    assert len(keywords) == 32
+    assert keywords['CAMERA'].dtype == np.int64
+    assert keywords['EXPOSURE'].dtype == np.float64
+    assert keywords['CALIB'].dtype == bool
+    assert keywords['CAMERA'].mask.sum() == 16
+
+    assert keywords.query(CAMERA=1, CCD=3) == [keyword_table.KeywordMatch('ffi-1-3.fits', 1)]
+    assert sorted(match.cloudpath for match in keywords.query(('EXPOSURE', '>=', 900.0))) == sorted(
+        filename for filename, (camera, ccd) in expected.items() if camera * ccd >= 9)
+    assert len(keywords.query(('TARGET', '!=', 'target-1'), CALIB=True)) == 3
+    assert keywords.query(MISSING=1) == []
+    assert [match.hdu for match in keywords.query(SIMPLE=True)] == [0] * 16
+
+def test_keyword_table_falls_back_to_the_index_headers(cube_index):
+    keywords = cube_index.keywords
+    assert [match.hdu for match in keywords.query(XTENSION='BINTABLE')] == [2]
+    assert keywords['NAXIS'].tolist() == [0, 4, 2]
+    # A single file keeps every keyword, not just keyword_table.KEYWORDS
+    assert [match.hdu for match in keywords.query(TTYPE1='TSTART')] == [2]
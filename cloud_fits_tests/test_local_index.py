@@ -0,0 +1,73 @@
+import argparse
+import os
+import shutil
+
+from cloud_fits import local_index
+
+def _build_configuration(cloud_indices, manifest):
+    return {
+        'indicies': [cloud_index.index for cloud_index in cloud_indices],
+        'manifest': manifest,
+    }
+
+def test_incremental_index_only_rescans_changed_files(cube_filepath, monkeypatch):
+    fits_directory: str = os.path.dirname(cube_filepath)
+    shutil.copy(cube_filepath, os.path.join(fits_directory, 'unchanged.fits'))
+    shutil.copy(cube_filepath, os.path.join(fits_directory, 'removed.fits'))
+    options = argparse.Namespace(fits_files_directory=fits_directory)
+    cloud_indices, manifest = local_index.build_incremental_cloud_indices(options, {})
+    assert sorted(manifest) == ['removed.fits', 'tess-cube.fits', 'unchanged.fits']
+    configuration = _build_configuration(cloud_indices, manifest)
+
+    os.remove(os.path.join(fits_directory, 'removed.fits'))
+    shutil.copy(cube_filepath, os.path.join(fits_directory, 'added.fits'))
+    with open(cube_filepath, 'ab') as stream:
+        stream.write(b'\0' * 2880)
+
+    scanned = []
+    build_fits_cloud_index = local_index.build_fits_cloud_index
+    def _record(relative_path, fits_filepath, *args):
+        scanned.append(os.path.basename(fits_filepath))
+        return build_fits_cloud_index(relative_path, fits_filepath, *args)
+
+    monkeypatch.setattr(local_index, 'build_fits_cloud_index', _record)
+    cloud_indices, manifest = local_index.build_incremental_cloud_indices(options, configuration)
+    assert sorted(scanned) == ['added.fits', 'tess-cube.fits']
+    assert sorted(manifest) == ['added.fits', 'tess-cube.fits', 'unchanged.fits']
+    assert sorted(cloud_index.cloudpath for cloud_index in cloud_indices) == sorted(manifest)
+    assert manifest['unchanged.fits'] == configuration['manifest']['unchanged.fits']
+    assert manifest['tess-cube.fits']['size'] == configuration['manifest']['tess-cube.fits']['size'] + 2880
+
+    # A header rewritten in place keeps the size and, here, the mtime. The header hash still picks it up
+    stat = os.stat(os.path.join(fits_directory, 'unchanged.fits'))
+    with open(os.path.join(fits_directory, 'unchanged.fits'), 'r+b') as stream:
+        header = stream.read(2880)
+        stream.seek(0)
+        stream.write(header.replace(b'EXTEND  =                    T', b'EXTEND  =                    F'))
+
+    os.utime(os.path.join(fits_directory, 'unchanged.fits'), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    scanned.clear()
+    local_index.build_incremental_cloud_indices(options, _build_configuration(cloud_indices, manifest))
+    assert scanned == ['unchanged.fits']
+
+def test_header_hash_skips_the_data(cube_filepath, tmp_path):
+    import gzip
+
+    from astropy.io import fits
+
+    with open(cube_filepath, 'rb') as stream:
+        payload = stream.read()
+
+    with open(os.path.join(tmp_path, 'tess-cube.fits.gz'), 'wb') as stream:
+        stream.write(gzip.compress(payload))
+
+    header_hash = local_index.hash_fits_headers(cube_filepath)
+    assert local_index.hash_fits_headers(os.path.join(tmp_path, 'tess-cube.fits.gz')) == header_hash
+    with fits.open(cube_filepath, mode='update') as hdu_list:
+        hdu_list[1].data[0, 0, 0, 0] = -1
+
+    assert local_index.hash_fits_headers(cube_filepath) == header_hash
+    with fits.open(cube_filepath, mode='update') as hdu_list:
+        hdu_list[2].header['OBSERVER'] = 'someone'
+
+    assert local_index.hash_fits_headers(cube_filepath) != header_hash
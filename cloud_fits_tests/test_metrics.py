@@ -0,0 +1,75 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from cloud_fits import data_types, exceptions
+from cloud_fits.data_types import metrics, shortcuts
+
+from conftest import build_configuration
+
+def test_remote_reads_report_fetch_telemetry(cube_filepath, s3_server):
+    os.makedirs(os.path.join(s3_server.directory, 'data'))
+    shutil.copy(cube_filepath, os.path.join(s3_server.directory, 'data', 'tess-cube.fits'))
+    configuration = build_configuration(os.path.dirname(cube_filepath), cube_filepath)
+    configuration['data-bucket-path'] = 's3://data'
+    index = data_types.FitsCloudIndex(configuration)
+
+    counters = metrics.add_hook(metrics.PrometheusCounters())
+    seen = []
+    metrics.add_hook(seen.append)
+    try:
+        cutout = index.headers[1][2:4, 3:4, 0:13, 0:2]
+        telemetry = cutout.telemetry
+        assert telemetry.ranges_planned == 2
+        assert telemetry.requests == s3_server.statistics['requests-GET'] == 2
+        assert dict(telemetry.status_codes) == {206: 2}
+        assert telemetry.bytes_requested == telemetry.bytes_useful == cutout[1].data.nbytes
+        assert telemetry.read_amplification == 1.0
+        assert telemetry.percentile(50) <= telemetry.percentile(99) <= telemetry.seconds
+
+        table = index.headers[2][0:5]
+        assert table.telemetry.operation == 'bintable'
+        assert table.telemetry.requests == 1
+        assert table.telemetry.bytes_requested == 5 * index.headers[2].fits['NAXIS1']
+        assert len(table) == 5
+
+        assert [telemetry.operation for telemetry in seen] == ['cutout', 'bintable']
+        assert 'cloud_fits_fetch_requests_total{operation="cutout"} 2' in counters.render()
+        assert 'cloud_fits_fetch_responses_total{operation="bintable",status="206"} 1' in counters.render()
+
+    finally:
+        metrics.remove_hook(counters)
+        metrics.remove_hook(seen.append)
+
+    assert metrics.HOOKS == []
+
+def test_fetch_byte_range_records_retries():
+    class _Response:
+        def __init__(self, status_code):
+            self.status_code = status_code
+            self.content = b'abcd' if status_code == 206 else b'SlowDown'
+
+    class _Session:
+        responses = [503, 206]
+        def get(self, url, **kwargs):
+            return _Response(self.responses.pop(0))
+
+    telemetry = metrics.FetchTelemetry('range', 'http://127.0.0.1/tess-cube.fits', 1, 4)
+    assert shortcuts.fetch_byte_range('http://127.0.0.1/tess-cube.fits', 0, 4, session=_Session(), telemetry=telemetry) == b'abcd'
+    assert telemetry.requests == 2
+    assert telemetry.retries == 1
+    assert dict(telemetry.status_codes) == {503: 1, 206: 1}
+    assert telemetry.read_amplification == 2.0
+    assert telemetry.as_dict()['latency-p90'] is not None
+
+    # Only throttling and server errors are retried, the error carries the last status
+    session = _Session()
+    session.responses = [403, 206]
+    telemetry = metrics.FetchTelemetry('range', 'http://127.0.0.1/tess-cube.fits', 1, 4)
+    with pytest.raises(exceptions.RangeException) as err:
+        shortcuts.fetch_byte_range('http://127.0.0.1/tess-cube.fits', 0, 4, session=session, telemetry=telemetry)
+
+    assert err.value.status_code == 403
+    assert telemetry.requests == 1
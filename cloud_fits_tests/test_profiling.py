@@ -0,0 +1,45 @@
+import os
+import pstats
+import shutil
+
+import pytest
+
+from cloud_fits import data_types, local_index, profiling
+
+from conftest import build_configuration
+
+def test_profile_reports_phases_memory_and_stats(cube_filepath, s3_server, tmp_path):
+    os.makedirs(os.path.join(s3_server.directory, 'data'))
+    shutil.copy(cube_filepath, os.path.join(s3_server.directory, 'data', 'tess-cube.fits'))
+    report_filepath = os.path.join(tmp_path, 'report.txt')
+    with profiling.profile(report_filepath) as report:
+        configuration = build_configuration(os.path.dirname(cube_filepath), cube_filepath)
+        index = data_types.FitsCloudIndex(configuration)
+        index.headers[1][0:3, 0:3, 0:13, 0]
+        configuration = build_configuration(os.path.dirname(cube_filepath), cube_filepath)
+        configuration['data-bucket-path'] = 's3://data'
+        data_types.FitsCloudIndex(configuration).headers[2][0:4]
+        with pytest.raises(NotImplementedError):
+            with profiling.profile():
+                pass
+
+    assert profiling.ACTIVE is None
+    assert sorted(report.phases) == ['decode', 'fetch', 'plan', 'scan', 'sign', 'summarise']
+    assert report.phases['sign']['calls'] == 1
+    assert report.phases['fetch']['calls'] == 2
+    assert 0 < report.phases['fetch']['seconds'] <= report.seconds
+    assert report.peak_memory > 0
+
+    with open(report_filepath, 'r') as stream:
+        text = stream.read()
+
+    assert text.startswith('Wall Time[')
+    assert 'cumulative' in text
+    stats = pstats.Stats(f'{report_filepath}.prof')
+    assert 'build_fits_cloud_index' in [function_name for (filename, line, function_name) in stats.stats]
+
+    # Outside a profile phases record nothing
+    with profiling.phase('plan'):
+        pass
+
+    assert report.phases['plan']['calls'] == 1
@@ -0,0 +1,51 @@
+import pytest
+
+from cloud_fits.data_types import read_plan, shortcuts
+
+def test_explain_plans_without_fetching(cube_index, monkeypatch):
+    image_header, table_header = cube_index.headers[1], cube_index.headers[2]
+    cutout = image_header[2:5, 0:11, 3:4, 0:2]
+
+    monkeypatch.setattr(shortcuts, 'image_cutout', None)
+    monkeypatch.setattr(shortcuts, 'load_byte_ranges', None)
+    plan = image_header.explain[2:5, 0:11, 3:4, 0:2]
+    assert plan.shape == (3, 11, 1, 2)
+    assert plan.ranges_generated == 33
+    assert plan.requests == cutout.telemetry.requests == 33
+    assert plan.bytes == cutout.telemetry.bytes_requested == cutout[1].data.nbytes
+
+    # Whole trailing axes are contiguous, every row collapses into one range
+    plan = image_header.explain[2:5, 0:11, 0:13, 0:2]
+    assert (plan.ranges_generated, plan.ranges_coalesced, plan.requests) == (3 * 11 * 13, 3 * 11 * 13 - 1, 1)
+
+    network_model = read_plan.NetworkModel(latency=1.0, bandwidth=1024, concurrency=4, request_cost=.5, transfer_cost=0)
+    plan = image_header.explain(network_model)[0:9, 0:11, 0, 0]
+    assert plan.requests == 99
+    assert plan.estimated_cost == 49.5
+    assert plan.estimated_seconds == 25 + plan.bytes / (1024 * 4)
+    assert plan.check(max_requests=99) is plan
+    with pytest.raises(ValueError):
+        plan.check(max_cost=10)
+
+    plan = table_header.explain[2:6]
+    assert (plan.operation, plan.requests, plan.bytes) == ('bintable', 1, 4 * table_header.fits['NAXIS1'])
+    assert plan.as_dict()['shape'] == [4]
+
+def test_explain_splits_streamed_reads_like_the_read(cube_index, tmp_path, monkeypatch):
+    image_header, table_header = cube_index.headers[1], cube_index.headers[2]
+    monkeypatch.setattr(shortcuts, 'STREAM_CHUNK_SIZE', 1024)
+    assert image_header.explain[0:9, 0:11, 0:13, 0:2].requests == 1
+
+    # Cutouts into out, or above MEMMAP_THRESHOLD, stream in STREAM_CHUNK_SIZE chunks
+    out = str(tmp_path / 'cutout.dat')
+    plan = image_header.explain(out=out)[0:9, 0:11, 0:13, 0:2]
+    assert plan.requests == image_header.cutout((slice(0, 9), slice(0, 11), slice(0, 13), slice(0, 2)), out=out).telemetry.requests
+    assert plan.requests == -(-9 * 11 * 13 * 2 * 4 // 1024)
+
+    monkeypatch.setattr(shortcuts, 'MEMMAP_THRESHOLD', 1024)
+    cutout = image_header[0:9, 0:11, 0:13, 0:2]
+    assert image_header.explain[0:9, 0:11, 0:13, 0:2].requests == cutout.telemetry.requests == plan.requests
+
+    monkeypatch.setattr(shortcuts, 'STREAM_CHUNK_SIZE', 64)
+    plan = table_header.explain[0:13]
+    assert plan.requests == table_header[0:13].telemetry.requests == -(-13 * table_header.fits['NAXIS1'] // 64) > 1
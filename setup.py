@@ -56,9 +56,15 @@ setup(
         'numpy==1.18.2',
         'astropy==4.0.1.post1',
     ],
+    extras_require={
+        'dask': ['dask[array]'],
+    },
     entry_points={
         'console_scripts': [
             'cloud-fits-index = cloud_fits.fits_index.factory:run_from_cli',
+            'cloud-fits-stand-in = cloud_fits.stand_in_server:run_from_cli',
+            'cloud-fits-serve = cloud_fits.cutout_server:run_from_cli',
+            'cloud-fits-explain = cloud_fits.explain:run_from_cli',
         ]
     },
     zip_safe=False,